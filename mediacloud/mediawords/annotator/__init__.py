@@ -494,12 +494,13 @@ class JSONAnnotator(metaclass=abc.ABCMeta):
             #
             # Not using db.create() because it tests last_inserted_id, and on duplicates there would be no such
             # "last_inserted_id" set.
-            db.query("""
-                INSERT INTO stories_tags_map (stories_id, tags_id)
-                VALUES (%(stories_id)s, %(tags_id)s)
-            """, {
-                'stories_id': stories_id,
-                'tags_id': tags_id,
-            })
+            db.prepared(
+                name='annotator_insert_stories_tags_map',
+                sql="""
+                    INSERT INTO stories_tags_map (stories_id, tags_id)
+                    VALUES ($1, $2)
+                """,
+                params=(stories_id, tags_id,),
+            )
 
         db.commit()
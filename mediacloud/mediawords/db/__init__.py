@@ -1,3 +1,6 @@
+import contextlib
+import os
+import threading
 import typing
 
 from mediawords.db.handler import DatabaseHandler
@@ -15,6 +18,11 @@ class McConnectToDBException(Exception):
     pass
 
 
+class McConnectionPoolException(Exception):
+    """Connection pool exception."""
+    pass
+
+
 def connect_to_db(
         label: typing.Optional[str] = None,
         do_not_check_schema_version: bool = False,
@@ -93,9 +101,240 @@ def connect_to_db(
     if ret is None:
         raise McConnectToDBException("Error while connecting to the database.")
 
+    _configure_session(db=ret)
+
+    return ret
+
+
+def _configure_session(db: DatabaseHandler) -> None:
+    """Apply session settings from configuration to a freshly connected (or reset) handler."""
+    config = py_get_config()
+
     if 'db_statement_timeout' in config['mediawords']:
         db_statement_timeout = config['mediawords']['db_statement_timeout']
 
-        ret.query('SET statement_timeout TO %(db_statement_timeout)s' % {'db_statement_timeout': db_statement_timeout})
+        db.query('SET statement_timeout TO %(db_statement_timeout)s' % {'db_statement_timeout': db_statement_timeout})
 
-    return ret
+
+class DatabaseConnectionPool(object):
+    """Process-level pool of connected and configured database handlers.
+
+    Job workers process one message after another, and connecting to the database for every single one of them means
+    paying for a TCP connection, authentication, schema version check and session setup every time. The pool keeps
+    released handlers open, health checks them before handing them out again, and resets their session state on return
+    so that whatever the previous job did (open transaction, temporary tables, SET, advisory locks) doesn't leak into
+    the next one.
+
+    Handlers are pooled per connect_to_db() arguments. The pool notices when the process forks, and the child doesn't
+    reuse (or close) handlers that were connected by the parent.
+    """
+
+    # How many idle handlers to keep per connect_to_db() arguments
+    DEFAULT_MAX_IDLE = 2
+
+    __slots__ = [
+        '__max_idle',
+        '__idle_handlers',
+        '__pid',
+        '__inherited_handlers',
+        '__lock',
+        '__stats',
+    ]
+
+    def __init__(self, max_idle: int = DEFAULT_MAX_IDLE):
+        """Constructor."""
+        if max_idle < 0:
+            raise McConnectionPoolException("Maximum number of idle handlers can't be negative.")
+
+        self.__max_idle = max_idle
+
+        # (label, is_template, do_not_check_schema_version) -> list of idle handlers
+        self.__idle_handlers = dict()
+
+        self.__pid = os.getpid()
+
+        # Handlers connected by a parent process; kept around so that garbage collecting them doesn't close the
+        # parent's connections
+        self.__inherited_handlers = []
+
+        self.__lock = threading.Lock()
+
+        self.__stats = {'connects': 0, 'reuses': 0, 'failed_health_checks': 0, 'discards': 0}
+
+    def __check_pid(self) -> None:
+        """Forget about handlers connected by the parent process if we've forked."""
+        pid = os.getpid()
+        if pid != self.__pid:
+            for idle_handlers in self.__idle_handlers.values():
+                self.__inherited_handlers.extend(idle_handlers)
+            self.__idle_handlers = dict()
+            self.__pid = pid
+
+    @staticmethod
+    def __is_healthy(db: DatabaseHandler) -> bool:
+        """Return True if the handler's connection is still usable."""
+        if not db.is_connected():
+            return False
+        try:
+            db.query('SELECT 1').flat()
+        except Exception as ex:
+            log.warning("Pooled database handler failed health check: %s" % str(ex))
+            return False
+        return True
+
+    @staticmethod
+    def __discard(db: DatabaseHandler) -> None:
+        """Disconnect a handler that won't be reused, ignoring errors."""
+        try:
+            if db.is_connected():
+                db.disconnect()
+        except Exception as ex:
+            log.debug("Error while disconnecting discarded database handler: %s" % str(ex))
+
+    @staticmethod
+    def __key(label: typing.Optional[str], do_not_check_schema_version: bool, is_template: bool) -> tuple:
+        # connect_to_db() forces the test label in tests
+        if using_test_database():
+            label = 'test'
+        return label, bool(is_template), bool(do_not_check_schema_version)
+
+    def acquire(self,
+                label: typing.Optional[str] = None,
+                do_not_check_schema_version: bool = False,
+                is_template: bool = False) -> DatabaseHandler:
+        """Return a healthy, configured handler; arguments are the same as connect_to_db()'s."""
+        label = decode_str_from_bytes_if_needed(label)
+
+        key = self.__key(label=label, do_not_check_schema_version=do_not_check_schema_version, is_template=is_template)
+
+        while True:
+            with self.__lock:
+                self.__check_pid()
+                idle_handlers = self.__idle_handlers.get(key, [])
+                if not idle_handlers:
+                    break
+                db = idle_handlers.pop()
+
+            if self.__is_healthy(db):
+                with self.__lock:
+                    self.__stats['reuses'] += 1
+                return db
+
+            with self.__lock:
+                self.__stats['failed_health_checks'] += 1
+            self.__discard(db)
+
+        db = connect_to_db(
+            label=label,
+            do_not_check_schema_version=do_not_check_schema_version,
+            is_template=is_template,
+        )
+
+        with self.__lock:
+            self.__stats['connects'] += 1
+
+        return db
+
+    def release(self,
+                db: DatabaseHandler,
+                label: typing.Optional[str] = None,
+                do_not_check_schema_version: bool = False,
+                is_template: bool = False) -> None:
+        """Reset handler's session and return it to the pool; arguments must match the ones passed to acquire()."""
+        label = decode_str_from_bytes_if_needed(label)
+
+        if db is None:
+            raise McConnectionPoolException("Handler is None.")
+
+        key = self.__key(label=label, do_not_check_schema_version=do_not_check_schema_version, is_template=is_template)
+
+        if not db.is_connected():
+            # Caller has disconnected the handler itself
+            with self.__lock:
+                self.__stats['discards'] += 1
+            return
+
+        try:
+            if db.in_transaction():
+                db.rollback()
+
+            db.query('RESET ALL; DISCARD TEMP; SELECT pg_advisory_unlock_all()')
+
+            # Prepared statements are left in place as they're not session state that jobs would rely on, unless the
+            # schema has been migrated since they were prepared
+            db.deallocate_outdated_prepared_statements()
+            _configure_session(db=db)
+
+        except Exception as ex:
+            log.warning("Unable to reset pooled database handler, discarding it: %s" % str(ex))
+            with self.__lock:
+                self.__stats['discards'] += 1
+            self.__discard(db)
+            return
+
+        with self.__lock:
+            self.__check_pid()
+            idle_handlers = self.__idle_handlers.setdefault(key, [])
+            if len(idle_handlers) < self.__max_idle:
+                idle_handlers.append(db)
+                db = None
+            else:
+                self.__stats['discards'] += 1
+
+        if db is not None:
+            self.__discard(db)
+
+    def close_all(self) -> None:
+        """Disconnect all idle handlers."""
+        with self.__lock:
+            self.__check_pid()
+            idle_handlers = [handler for handlers in self.__idle_handlers.values() for handler in handlers]
+            self.__idle_handlers = dict()
+
+        for db in idle_handlers:
+            self.__discard(db)
+
+    def idle_count(self) -> int:
+        """Return number of idle handlers in the pool."""
+        with self.__lock:
+            self.__check_pid()
+            return sum(len(handlers) for handlers in self.__idle_handlers.values())
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Return pool counters."""
+        with self.__lock:
+            return dict(self.__stats)
+
+
+# Process-wide connection pool used by pooled_db()
+__connection_pool = DatabaseConnectionPool()
+
+
+def connection_pool() -> DatabaseConnectionPool:
+    """Return process-wide connection pool."""
+    return __connection_pool
+
+
+@contextlib.contextmanager
+def pooled_db(label: typing.Optional[str] = None,
+              do_not_check_schema_version: bool = False,
+              is_template: bool = False) -> typing.Iterator[DatabaseHandler]:
+    """Context manager that yields a handler from the process-wide pool and returns it to the pool afterwards.
+
+    Arguments are the same as connect_to_db()'s. Callers shouldn't disconnect the handler themselves (although the pool
+    copes with it).
+    """
+    db = __connection_pool.acquire(
+        label=label,
+        do_not_check_schema_version=do_not_check_schema_version,
+        is_template=is_template,
+    )
+    try:
+        yield db
+    finally:
+        __connection_pool.release(
+            db=db,
+            label=label,
+            do_not_check_schema_version=do_not_check_schema_version,
+            is_template=is_template,
+        )
@@ -1,4 +1,6 @@
+import re
 import tempfile
+from typing import Any, Iterable
 
 import psycopg2
 from psycopg2.extras import DictCursor
@@ -14,12 +16,34 @@ class McCopyFromException(McDatabaseHandlerException):
     pass
 
 
-# FIXME writes everything to a temporary file first, does the actual copying in end()
+# FIXME writes everything to a buffer first, does the actual copying in end()
 class CopyFrom(object):
-    """COPY FROM helper."""
+    """COPY FROM helper.
+
+    Lines get collected in a list and written to the buffer in batches; the buffer is kept in memory and spills over to
+    a temporary file only if it grows large. put_rows() escapes rows for the TEXT format in bulk so that loading lots
+    of small rows doesn't get bound by the per-line call overhead.
+    """
 
     # Chunk size to COPY FROM
-    __COPY_CHUNK_SIZE = 100 * 1024
+    __COPY_CHUNK_SIZE = 1024 * 1024
+
+    # Size of pending lines to write to the buffer at once
+    __FLUSH_SIZE = 1024 * 1024
+
+    # Max. size of the buffer to keep in memory before spilling it over to a temporary file
+    __MAX_MEMORY_BUFFER_SIZE = 64 * 1024 * 1024
+
+    # Characters to escape in TEXT format values
+    __TEXT_ESCAPE_TABLE = str.maketrans({
+        '\\': '\\\\',
+        '\n': '\\n',
+        '\r': '\\r',
+        '\t': '\\t',
+    })
+
+    # COPY options that put_rows() doesn't support
+    __NON_TEXT_FORMAT_REGEX = re.compile(r'\b(CSV|BINARY)\b', flags=re.IGNORECASE)
 
     # SQL to run
     __sql = None
@@ -27,8 +51,14 @@ class CopyFrom(object):
     # Database cursor
     __cursor = None
 
-    # Temporary file buffer
-    __temp_file_buffer = None
+    # Buffer (in memory or in a temporary file)
+    __buffer = None
+
+    # Lines not yet written to the buffer
+    __pending_lines = None
+
+    # Total length of pending lines
+    __pending_length = 0
 
     def __init__(self, cursor: DictCursor, sql: str):
 
@@ -48,7 +78,41 @@ class CopyFrom(object):
 
         self.__sql = sql
         self.__cursor = cursor
-        self.__temp_file_buffer = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self.__buffer = tempfile.SpooledTemporaryFile(
+            max_size=self.__MAX_MEMORY_BUFFER_SIZE,
+            mode='w+',
+            encoding='utf-8',
+        )
+        self.__pending_lines = []
+        self.__pending_length = 0
+
+    def __flush(self) -> None:
+        """Write pending lines to the buffer."""
+        if self.__pending_lines:
+            self.__buffer.write(''.join(self.__pending_lines))
+            self.__pending_lines = []
+            self.__pending_length = 0
+
+    def __add_line(self, line: str) -> None:
+        """Add newline-terminated line to pending lines, flush them if there's enough of them."""
+        self.__pending_lines.append(line)
+        self.__pending_length += len(line)
+        if self.__pending_length >= self.__FLUSH_SIZE:
+            self.__flush()
+
+    @staticmethod
+    def __text_format_value(value: Any) -> str:
+        """Escape a single value for the TEXT format."""
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (int, float)):
+            return str(value)
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            # "bytea" hex format, with the backslash escaped for the TEXT format
+            return '\\\\x' + bytes(value).hex()
+        return str(value).translate(CopyFrom.__TEXT_ESCAPE_TABLE)
 
     def put_line(self, line: str) -> None:
         """Write line."""
@@ -57,16 +121,34 @@ class CopyFrom(object):
 
         line = line.rstrip('\n')
         try:
-            self.__temp_file_buffer.write("%s\n" % line)
+            self.__add_line("%s\n" % line)
         except Exception as ex:
             raise McCopyFromException("Error write writing line '%s': %s" % (line, str(ex)))
 
+    def put_rows(self, rows: Iterable[Iterable[Any]]) -> None:
+        """Write rows (lists or tuples of column values) escaped for the TEXT format.
+
+        None gets written as NULL, booleans as 't' / 'f', bytes as "bytea" in hex format, and everything else as its
+        string representation.
+        """
+        if self.__NON_TEXT_FORMAT_REGEX.search(self.__sql):
+            raise McCopyFromException("put_rows() supports only TEXT format COPY FROM: %s" % self.__sql)
+
+        text_format_value = self.__text_format_value
+
+        try:
+            for row in rows:
+                self.__add_line('\t'.join([text_format_value(value) for value in row]) + '\n')
+        except Exception as ex:
+            raise McCopyFromException("Error while writing rows: %s" % str(ex))
+
     def end(self) -> None:
         """Stop writing (and run the actual COPY FROM)."""
         try:
-            self.__temp_file_buffer.seek(0)
-            self.__cursor.copy_expert(sql=self.__sql, file=self.__temp_file_buffer, size=self.__COPY_CHUNK_SIZE)
-            self.__temp_file_buffer.close()
+            self.__flush()
+            self.__buffer.seek(0)
+            self.__cursor.copy_expert(sql=self.__sql, file=self.__buffer, size=self.__COPY_CHUNK_SIZE)
+            self.__buffer.close()
         except psycopg2.Warning as ex:
             log.warning('Warning while running COPY FROM query: %s' % str(ex))
         except Exception as ex:
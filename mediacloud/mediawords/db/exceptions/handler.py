@@ -18,6 +18,16 @@ class McQueryException(McDatabaseHandlerException):
     pass
 
 
+class McQueryStreamException(McDatabaseHandlerException):
+    """query_stream() exception."""
+    pass
+
+
+class McPreparedException(McDatabaseHandlerException):
+    """prepared() exception."""
+    pass
+
+
 class McPrimaryKeyColumnException(McDatabaseHandlerException):
     """primary_key_column() exception."""
     pass
@@ -53,6 +63,11 @@ class McUniqueConstraintException(McDatabaseHandlerException):
     pass
 
 
+class McInsertManyException(McDatabaseHandlerException):
+    """insert_many() exception."""
+    pass
+
+
 class McFindOrCreateException(McDatabaseHandlerException):
     """find_or_create() exception."""
     pass
@@ -113,19 +113,15 @@ def __print_table_csv_to_stdout(db: DatabaseHandler, table: str) -> None:
 
     csv_writer = csv.writer(sys.stdout, delimiter="\t", escapechar="\\", quoting=csv.QUOTE_NONE)
 
-    res = db.query("SELECT * FROM %(table)s ORDER BY %(primary_key_column)s" % {
+    rows = db.query_stream("SELECT * FROM %(table)s ORDER BY %(primary_key_column)s" % {
         'table': table,
         'primary_key_column': primary_key_column,
-    })
+    }, as_tuples=True)
 
     postgresql_null_value = '\\N'
     postgresql_end_of_data = r'\.'
-    while True:
-        row = res.array()
-        if row is None:
-            break
-        else:
-            csv_writer.writerow([postgresql_null_value if val is None else val for val in row])
+    for row in rows:
+        csv_writer.writerow([postgresql_null_value if val is None else val for val in row])
 
     print(postgresql_end_of_data)
 
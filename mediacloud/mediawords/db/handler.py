@@ -1,7 +1,11 @@
+import hashlib
+import json
 import os
 import re
 import socket
-from typing import Callable, Union, List, Dict, Any
+import tempfile
+import time
+from typing import Callable, Union, List, Dict, Any, Iterator, Tuple
 
 import psycopg2
 import psycopg2.extras
@@ -11,9 +15,10 @@ from mediawords.db.copy.copy_from import CopyFrom
 from mediawords.db.copy.copy_to import CopyTo
 from mediawords.db.exceptions.handler import (
     McConnectException, McDatabaseHandlerException, McSchemaIsUpToDateException, McQueryException,
-    McPrimaryKeyColumnException, McFindByIDException, McRequireByIDException, McUpdateByIDException,
-    McDeleteByIDException, McCreateException, McFindOrCreateException, McBeginException,
-    McQuoteException, McUniqueConstraintException)
+    McQueryStreamException, McPreparedException, McPrimaryKeyColumnException, McFindByIDException,
+    McRequireByIDException, McUpdateByIDException, McDeleteByIDException, McCreateException, McFindOrCreateException,
+    McBeginException, McQuoteException, McUniqueConstraintException, McInsertManyException)
+from mediawords.db.exceptions.result import McDatabaseResultException
 from mediawords.db.result.result import DatabaseResult
 from mediawords.db.schema.version import schema_version_from_lines
 
@@ -51,13 +56,50 @@ class DatabaseHandler(object):
     # * class variable because we don't need to do it on every connect_to_db())
     __deadlock_timeout_checked = False
 
+    # How long (in seconds) to trust a successful schema version check for subsequent connections to the same database
+    # within the same process
+    __DEFAULT_SCHEMA_VERSION_CHECK_TTL = 10 * 60
+
+    # Target schema version parsed from mediawords.sql (parsed once per process)
+    __target_schema_version = None
+
+    # (host, port, database) -> (PID, time of the last successful schema version check)
+    __schema_version_checks = {}
+
+    # (host, port, database) -> last schema version seen by deallocate_outdated_prepared_statements() in this process
+    __prepared_statements_known_schema_versions = {}
+
+    # Max. number of parent IDs for attach_child_query() to pass as an array parameter instead of a temporary table
+    __ATTACH_CHILD_QUERY_MAX_ARRAY_IDS = 10 * 1000
+
+    # Schema version check counters
+    __schema_version_check_stats = {'checks': 0, 'skipped': 0}
+
+    # Process-wide query hooks (see add_query_hook())
+    __query_hooks = []
+
+    # (host, port, database) -> process-wide cache of table primary key columns ([schema][table])
+    __primary_key_column_caches = {}
+
+    # (host, port, database) of databases for which the primary key cache has been prewarmed
+    __prewarmed_primary_key_caches = set()
+
     __slots__ = [
 
-        # Cache of table primary key columns ([schema][table])
+        # (host, port, database) that the handler is connected to
+        '__database_key',
+
+        # Cache of table primary key columns ([schema][table]), shared between handlers connected to the same database
         '__primary_key_columns',
 
-        # PIDs for which the schema version has been checked
-        '__schema_version_check_pids',
+        # Statements prepared on the current connection (name -> SQL)
+        '__prepared_statements',
+
+        # Database schema version at the time the first of the current statements was prepared
+        '__prepared_statements_schema_version',
+
+        # Prepared statement counters
+        '__prepared_statement_stats',
 
         # Whether or not to print PostgreSQL warnings
         '__print_warnings',
@@ -87,8 +129,11 @@ class DatabaseHandler(object):
         password = decode_object_from_bytes_if_needed(password)
         database = decode_object_from_bytes_if_needed(database)
 
+        self.__database_key = None
         self.__primary_key_columns = {}
-        self.__schema_version_check_pids = {}
+        self.__prepared_statements = {}
+        self.__prepared_statements_schema_version = None
+        self.__prepared_statement_stats = {'prepares': 0, 'executions': 0}
         self.__print_warnings = True
         self.__in_manual_transaction = False
         self.__conn = None
@@ -119,24 +164,27 @@ class DatabaseHandler(object):
         password = decode_object_from_bytes_if_needed(password)
         database = decode_object_from_bytes_if_needed(database)
 
-        # If the user didn't clearly (via 'true' or 'false') state whether or not
-        # to check schema version, check it once per PID
-        pid = os.getpid()
-
         if not (host and username and password and database):
             raise McConnectException("Database connection credentials are not set.")
 
         if not port:
             port = 5432
 
+        self.__database_key = (host, port, database,)
+        self.__primary_key_columns = DatabaseHandler.__primary_key_column_caches.setdefault(self.__database_key, {})
+
+        # Skip the schema version check if it has been done recently in this process for the same database
         if not do_not_check_schema_version:
-            if pid in self.__schema_version_check_pids:
+            if DatabaseHandler.__schema_version_was_checked_recently(self.__database_key):
+                DatabaseHandler.__schema_version_check_stats['skipped'] += 1
                 do_not_check_schema_version = True
-            else:
-                do_not_check_schema_version = False
 
         application_name = '%s %d' % (socket.gethostname(), os.getpid())
 
+        # Prepared statements don't survive reconnects
+        self.__prepared_statements = {}
+        self.__prepared_statements_schema_version = None
+
         self.__conn = psycopg2.connect(
             host=host,
             port=port,
@@ -164,14 +212,15 @@ class DatabaseHandler(object):
         self.__conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
 
         if not do_not_check_schema_version:
+            DatabaseHandler.__schema_version_check_stats['checks'] += 1
             if not self.schema_is_up_to_date():
                 # It would make sense to check the MEDIACLOUD_IGNORE_DB_SCHEMA_VERSION environment variable
                 # at this particular point too, but schema_is_up_to_date() warns the user about schema being
                 # too old on every run, and that's supposedly a good thing.
                 raise McConnectException("Database schema is not up-to-date.")
 
-        # If schema is not up-to-date, connect() dies and we don't get to set PID here
-        self.__schema_version_check_pids[pid] = True
+            # If schema is not up-to-date, connect() dies and we don't get to remember the check here
+            DatabaseHandler.__schema_version_checks[self.__database_key] = (os.getpid(), time.monotonic(),)
 
         # Check deadlock_timeout
         if not DatabaseHandler.__deadlock_timeout_checked:
@@ -195,12 +244,55 @@ class DatabaseHandler(object):
         self.__db = None
 
         self.__conn.close()
-        self.__db = None
+        self.__conn = None
+
+    def is_connected(self) -> bool:
+        """Return True if the handler has an open connection (which might have been dropped by the server though)."""
+        return self.__conn is not None and not self.__conn.closed
 
     # noinspection PyMethodMayBeStatic
     def dbh(self) -> None:
         raise McDatabaseHandlerException("Please don't use internal database handler directly")
 
+    @staticmethod
+    def __schema_version_check_ttl() -> int:
+        """Return for how long (in seconds) a successful schema version check is to be trusted."""
+        config = py_get_config()
+        return int(config['mediawords'].get('db_schema_version_check_ttl',
+                                            DatabaseHandler.__DEFAULT_SCHEMA_VERSION_CHECK_TTL))
+
+    @staticmethod
+    def __schema_version_was_checked_recently(schema_version_check_key: tuple) -> bool:
+        """Return True if the schema version of a database has been checked in this process within TTL."""
+        last_check = DatabaseHandler.__schema_version_checks.get(schema_version_check_key, None)
+        if last_check is None:
+            return False
+
+        (pid, checked_at,) = last_check
+
+        # Forked children redo the check
+        if pid != os.getpid():
+            return False
+
+        return time.monotonic() - checked_at < DatabaseHandler.__schema_version_check_ttl()
+
+    @staticmethod
+    def schema_version_check_stats() -> Dict[str, int]:
+        """Return process-wide counters of schema version checks done and skipped (thanks to an earlier check)."""
+        return dict(DatabaseHandler.__schema_version_check_stats)
+
+    @staticmethod
+    def __get_target_schema_version() -> int:
+        """Return target schema version from mediawords.sql, parsing it only once per process."""
+        if DatabaseHandler.__target_schema_version is None:
+            sql = open(mc_sql_schema_path(), 'r').read()
+            target_schema_version = schema_version_from_lines(sql)
+            if not target_schema_version:
+                raise McSchemaIsUpToDateException("Invalid target schema version.")
+            DatabaseHandler.__target_schema_version = target_schema_version
+
+        return DatabaseHandler.__target_schema_version
+
     @staticmethod
     def __should_continue_with_outdated_schema(current_schema_version: int, target_schema_version: int) -> bool:
         """Schema is outdated / too new; returns 1 if MC should continue nevertheless, 0 otherwise"""
@@ -273,10 +365,7 @@ class DatabaseHandler(object):
             raise McSchemaIsUpToDateException("Current schema version is 0")
 
         # Target schema version
-        sql = open(mc_sql_schema_path(), 'r').read()
-        target_schema_version = schema_version_from_lines(sql)
-        if not target_schema_version:
-            raise McSchemaIsUpToDateException("Invalid target schema version.")
+        target_schema_version = DatabaseHandler.__get_target_schema_version()
 
         # Check if the current schema is up-to-date
         if current_schema_version != target_schema_version:
@@ -285,6 +374,21 @@ class DatabaseHandler(object):
             # Things are fine at this point.
             return True
 
+    @staticmethod
+    def add_query_hook(query_hook: Callable[[str, float, int], None]) -> None:
+        """Add process-wide query hook, e.g. for instrumentation (see mediawords.db.instrumentation).
+
+        Hook gets called with the query, its duration (in seconds) and the number of rows it returned or affected after
+        every query run by any handler in the process."""
+        if query_hook not in DatabaseHandler.__query_hooks:
+            DatabaseHandler.__query_hooks.append(query_hook)
+
+    @staticmethod
+    def remove_query_hook(query_hook: Callable[[str, float, int], None]) -> None:
+        """Remove process-wide query hook added with add_query_hook()."""
+        if query_hook in DatabaseHandler.__query_hooks:
+            DatabaseHandler.__query_hooks.remove(query_hook)
+
     def query(self, *query_params) -> DatabaseResult:
         """Run the query, return instance of DatabaseResult for accessing the result.
 
@@ -315,7 +419,269 @@ class DatabaseHandler(object):
         return DatabaseResult(cursor=self.__db,
                               query_args=query_params,
                               double_percentage_sign_marker=DatabaseHandler.__DOUBLE_PERCENTAGE_SIGN_MARKER,
-                              print_warnings=self.__print_warnings)
+                              print_warnings=self.__print_warnings,
+                              query_hooks=DatabaseHandler.__query_hooks)
+
+    def query_tuples(self, *query_params) -> DatabaseResult:
+        """Run the query on a plain (tuple) cursor, return instance of DatabaseResult for accessing the result.
+
+        Rows don't get built as dict-like objects, so use the result's tuples() or column_arrays() (which don't
+        stringify DATE / TIMESTAMP values either) for scanning large result sets; array() and flat() work too, but
+        hash() and hashes() don't. Query parameters are the same as query()'s."""
+
+        # MC_REWRITE_TO_PYTHON: remove after porting queries to named parameter style
+        query_params = convert_dbd_pg_arguments_to_psycopg2_format(*query_params)
+
+        if len(query_params) == 0:
+            raise McQueryException("Query is unset.")
+        if len(query_params) > 2:
+            raise McQueryException("psycopg2's execute() accepts at most 2 parameters.")
+
+        return DatabaseResult(cursor=self.__conn.cursor(),
+                              query_args=query_params,
+                              double_percentage_sign_marker=DatabaseHandler.__DOUBLE_PERCENTAGE_SIGN_MARKER,
+                              print_warnings=self.__print_warnings,
+                              query_hooks=DatabaseHandler.__query_hooks)
+
+    def query_native(self, query: str, params: Union[Dict[str, Any], tuple, None] = None) -> DatabaseResult:
+        """Run a query that's already in psycopg2's native format, return instance of DatabaseResult.
+
+        Fast path for Python-only callers which skips the DBD::Pg compatibility conversion and percentage sign
+        rewriting done by query(). The query must be written for psycopg2 as-is:
+
+        * parameters are passed as '%s' or '%(name)s' placeholders with a tuple or a dictionary of values;
+        * literal percentage signs are doubled ('%%'), e.g. "WHERE name LIKE 'foo%%'";
+        * values are not to be quote()d into the query (pass them as parameters instead).
+
+            db.query_native('SELECT * FROM foo WHERE bar = %(bar)s AND baz LIKE %(baz)s', {'bar': 1, 'baz': 'a%'})
+        """
+
+        if not query:
+            raise McQueryException("Query is unset.")
+
+        if DatabaseHandler.__DOUBLE_PERCENTAGE_SIGN_MARKER in query:
+            raise McQueryException("quote()d strings are not supported by query_native(); use parameters instead.")
+
+        if params is None:
+            # Always pass parameters so that psycopg2 treats '%%' the same way regardless of whether there are any
+            params = {}
+
+        return DatabaseResult(cursor=self.__db,
+                              query_args=(query, params,),
+                              double_percentage_sign_marker=DatabaseHandler.__DOUBLE_PERCENTAGE_SIGN_MARKER,
+                              print_warnings=self.__print_warnings,
+                              query_is_normalized=True,
+                              query_hooks=DatabaseHandler.__query_hooks)
+
+    @staticmethod
+    def __is_stale_prepared_statement_error(ex: Exception) -> bool:
+        """Return True if exception was caused by a prepared statement being gone or outdated (e.g. after a schema
+        change altered the statement's result type)."""
+        message = str(ex)
+        return (
+            ('prepared statement' in message and 'does not exist' in message) or
+            'cached plan must not change result type' in message
+        )
+
+    def __current_schema_version(self) -> Union[int, None]:
+        """Return schema version that the database is currently at, or None if it's not set (e.g. empty database)."""
+
+        if not self.query_native("SELECT to_regclass('public.database_variables') IS NOT NULL").flat()[0]:
+            return None
+
+        schema_version = self.query_native("""
+            SELECT value
+            FROM database_variables
+            WHERE name = 'database-schema-version'
+        """).flat()
+        if not schema_version:
+            return None
+
+        return int(schema_version[0])
+
+    def __prepare(self, name: str, sql: str) -> None:
+        """(Re)prepare a named statement on the current connection."""
+
+        if len(self.__prepared_statements) == 0:
+            self.__prepared_statements_schema_version = self.__current_schema_version()
+            DatabaseHandler.__prepared_statements_known_schema_versions[self.__database_key] = \
+                self.__prepared_statements_schema_version
+
+        if name in self.__prepared_statements:
+            if self.query_native(
+                    "SELECT 1 FROM pg_prepared_statements WHERE name = %(name)s", {'name': name}
+            ).flat():
+                self.query_native("DEALLOCATE %s" % name)
+            del self.__prepared_statements[name]
+
+        # psycopg2 will be interpolating the PREPARE statement, so literal percentage signs have to be doubled
+        self.query_native("PREPARE %s AS %s" % (name, sql.replace('%', '%%')))
+
+        self.__prepared_statements[name] = sql
+        self.__prepared_statement_stats['prepares'] += 1
+
+    def deallocate_prepared_statements(self) -> None:
+        """DEALLOCATE all statements prepared on the current connection."""
+        self.query_native("DEALLOCATE ALL")
+        self.__prepared_statements = {}
+        self.__prepared_statements_schema_version = None
+
+    def deallocate_outdated_prepared_statements(self) -> None:
+        """DEALLOCATE all statements prepared on the current connection if the database schema has been migrated to a
+        different version since they were prepared, as the tables that they're using might have changed.
+
+        The schema version gets remembered for the whole process, so other handlers connected to the same database
+        re-prepare their statements before running them next time."""
+
+        if len(self.__prepared_statements) == 0:
+            return
+
+        schema_version = self.__current_schema_version()
+        DatabaseHandler.__prepared_statements_known_schema_versions[self.__database_key] = schema_version
+
+        if schema_version != self.__prepared_statements_schema_version:
+            log.info("Schema version has changed from %s to %s, deallocating prepared statements..." % (
+                str(self.__prepared_statements_schema_version), str(schema_version),
+            ))
+            self.deallocate_prepared_statements()
+
+    def prepared(self, name: str, sql: str, params: Union[list, tuple, None] = None) -> DatabaseResult:
+        """Run a query as a named prepared statement, return instance of DatabaseResult for accessing the result.
+
+        The statement gets PREPAREd on its first use on the current connection and EXECUTEd afterwards, so that
+        PostgreSQL doesn't have to parse and plan frequently run queries on every call. The query uses PostgreSQL's
+        native "$1", "$2", ... placeholders; parameters are passed as a list or tuple:
+
+            db.prepared('find_story', 'SELECT * FROM stories WHERE stories_id = $1', (stories_id,))
+
+        Calling prepared() with an existing name but different SQL re-prepares the statement. If the statement is
+        found to be gone or outdated (e.g. a table that the statement's "SELECT *" is reading from has been altered),
+        it gets re-prepared and run again, unless we're in a transaction which the failed EXECUTE would have aborted.
+        Statements prepared before a schema migration that deallocate_outdated_prepared_statements() has noticed get
+        re-prepared before being run, so that they don't fail in a transaction in the first place.
+        """
+
+        name = decode_object_from_bytes_if_needed(name)
+        sql = decode_object_from_bytes_if_needed(sql)
+        params = decode_object_from_bytes_if_needed(params)
+
+        if not name:
+            raise McPreparedException("Prepared statement name is unset.")
+        if not re.match(r'^[a-z_][a-z0-9_]*$', name):
+            raise McPreparedException("Prepared statement name '%s' is not a valid identifier." % name)
+        if not sql:
+            raise McPreparedException("Prepared statement SQL is unset.")
+
+        if params is None:
+            params = ()
+        params = tuple(params)
+
+        if len(self.__prepared_statements) > 0:
+            known_schema_version = DatabaseHandler.__prepared_statements_known_schema_versions.get(
+                self.__database_key, self.__prepared_statements_schema_version
+            )
+            if known_schema_version != self.__prepared_statements_schema_version:
+                log.info("Schema version has changed from %s to %s, deallocating prepared statements..." % (
+                    str(self.__prepared_statements_schema_version), str(known_schema_version),
+                ))
+                self.deallocate_prepared_statements()
+
+        if self.__prepared_statements.get(name, None) != sql:
+            self.__prepare(name=name, sql=sql)
+
+        execute_sql = "EXECUTE %s" % name
+        if len(params) > 0:
+            execute_sql += " (%s)" % ", ".join(['%s'] * len(params))
+
+        self.__prepared_statement_stats['executions'] += 1
+
+        try:
+            return self.query_native(execute_sql, params)
+        except McDatabaseResultException as ex:
+            if self.in_transaction() or not self.__is_stale_prepared_statement_error(ex):
+                raise
+
+            log.info("Prepared statement '%s' is stale, re-preparing: %s" % (name, str(ex),))
+            self.__prepare(name=name, sql=sql)
+
+            return self.query_native(execute_sql, params)
+
+    def prepared_statement_stats(self) -> Dict[str, int]:
+        """Return prepared statement counters: how many times statements were PREPAREd and EXECUTEd."""
+        return self.__prepared_statement_stats.copy()
+
+    @staticmethod
+    def __prepared_statement_name(prefix: str, table: str, columns: List[str] = None) -> str:
+        """Return prepared statement name for an automatically prepared query on a table (and columns)."""
+        name = '%s_%s' % (prefix, re.sub(r'[^a-z0-9_]', '_', table.lower()),)
+        if columns:
+            name += '_%s' % hashlib.md5(','.join(columns).encode('utf-8')).hexdigest()[:8]
+        return name
+
+    def query_stream(self,
+                     *query_params,
+                     itersize: int = 2000,
+                     as_tuples: bool = False) -> Iterator[Union[Dict[str, Any], Tuple[Any, ...]]]:
+        """Run the query, return iterator over its rows (dicts keyed by column name, or tuples if "as_tuples" is True).
+
+        Unlike query(...).hashes(), rows don't get fetched all at once: query is run in a named (server-side) cursor
+        from which rows are fetched in batches of "itersize" as the iterator gets consumed, so huge result sets can be
+        processed in constant memory. Query parameters are the same as query()'s.
+
+        The cursor is declared WITH HOLD so that it survives commits done while iterating. Outside of a transaction,
+        PostgreSQL materializes a WITH HOLD cursor's results on the server right away, so when streaming from huge
+        queries it is cheaper to do so within a transaction.
+
+        The cursor gets closed when the iterator is exhausted or garbage collected."""
+
+        # MC_REWRITE_TO_PYTHON: remove after porting queries to named parameter style
+        query_params = convert_dbd_pg_arguments_to_psycopg2_format(*query_params)
+
+        if len(query_params) == 0:
+            raise McQueryStreamException("Query is unset.")
+        if len(query_params) > 2:
+            raise McQueryStreamException("psycopg2's execute() accepts at most 2 parameters.")
+
+        if itersize is None or itersize < 1:
+            raise McQueryStreamException("'itersize' must be a positive integer.")
+
+        cursor = self.__conn.cursor(
+            name='_stream_%s' % random_string(length=16),
+            cursor_factory=psycopg2.extras.DictCursor,
+            withhold=True,
+        )
+        cursor.itersize = itersize
+
+        try:
+            result = DatabaseResult(cursor=cursor,
+                                    query_args=query_params,
+                                    double_percentage_sign_marker=DatabaseHandler.__DOUBLE_PERCENTAGE_SIGN_MARKER,
+                                    print_warnings=self.__print_warnings,
+                                    query_hooks=DatabaseHandler.__query_hooks)
+        except Exception:
+            try:
+                cursor.close()
+            except psycopg2.Error as ex:
+                # Cursor doesn't exist on the server if the query failed to get declared
+                log.debug("Unable to close streaming cursor of a failed query: %s" % str(ex))
+            raise
+
+        return self.__iterate_and_close_cursor(
+            cursor=cursor,
+            rows=result.iterate_tuples() if as_tuples else result.iterate_hashes(),
+        )
+
+    @staticmethod
+    def __iterate_and_close_cursor(cursor: psycopg2.extensions.cursor, rows: Iterator[Any]) -> Iterator[Any]:
+        """Yield rows, close the cursor afterwards."""
+        try:
+            yield from rows
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error as ex:
+                # Cursor is gone anyway if e.g. the transaction that it was declared in has been aborted
+                log.warning("Unable to close streaming cursor: %s" % str(ex))
 
     def __get_current_work_mem(self) -> str:
         current_work_mem = self.query("SHOW work_mem").flat()[0]
@@ -375,10 +741,177 @@ class DatabaseHandler(object):
         if exception is not None:
             raise exception  # pass further
 
+    # Numeric columns of tables and views together with primary index flags; filtered by schema / object name by the
+    # callers
+    # noinspection SpellCheckingInspection,SqlResolve
+    __PRIMARY_KEY_CATALOG_QUERY = """
+        SELECT
+            n.nspname AS schema_name,
+            c.relname AS object_name,
+            c.relkind AS object_type,
+            a.attname AS column_name,
+            i.indisprimary AS is_primary_index,
+            t.typname AS column_type,
+            t.typcategory AS column_type_category
+
+        FROM pg_namespace AS n
+            INNER JOIN pg_class AS c
+                ON n.oid = c.relnamespace
+            INNER JOIN pg_attribute AS a
+                ON a.attrelid = c.oid
+                AND NOT a.attisdropped
+            INNER JOIN pg_type AS t
+              ON a.atttypid = t.oid
+
+            -- Object might be a view, so LEFT JOIN
+            LEFT JOIN pg_index AS i
+                ON c.oid = i.indrelid
+                AND a.attnum = ANY(i.indkey)
+
+        WHERE
+
+          -- No xid, cid, ...
+          a.attnum > 0
+
+          -- Live column
+          AND NOT attisdropped
+
+          -- Numeric (INT or BIGINT)
+          AND t.typcategory = 'N'
+
+          AND {object_filter}
+
+        -- In case of a composite PK, select the first numeric column
+        ORDER BY n.nspname, c.relname, a.attnum
+    """
+
+    @staticmethod
+    def __primary_key_column_from_catalog(object_name: str, columns: List[Dict[str, Any]]) -> Union[str, None]:
+        """Pick primary key column of an object from its catalog query rows; return None if there isn't one."""
+        for column in columns:
+
+            column_name = column['column_name']
+
+            if column['object_type'] in ['r', 'p']:
+                # Table
+                if column['is_primary_index']:
+                    return column_name
+
+            elif column['object_type'] in ['v', 'm']:
+                # (Materialized) view
+                if column['column_name'] == 'id' or column['column_name'] == '{}_id'.format(object_name):
+                    return column_name
+
+        return None
+
+    @staticmethod
+    def __primary_key_cache_path() -> Union[str, None]:
+        """Return path to the file-backed primary key cache if one is configured."""
+        config = py_get_config()
+        return config['mediawords'].get('db_primary_key_cache_path', None)
+
+    @staticmethod
+    def __primary_key_cache_file_key(database_key: tuple) -> str:
+        """Return key of a database's primary key columns in the cache file.
+
+        Target schema version is a part of the key so that schema upgrades invalidate the cache.
+        """
+        (host, port, database,) = database_key
+        return '%s:%d/%s@%d' % (host, port, database, DatabaseHandler.__get_target_schema_version(),)
+
+    @staticmethod
+    def __read_primary_key_cache_file(database_key: tuple) -> Union[Dict[str, Dict[str, str]], None]:
+        """Read database's primary key columns from the cache file; return None if they're not there."""
+        cache_path = DatabaseHandler.__primary_key_cache_path()
+        if not cache_path or not os.path.isfile(cache_path):
+            return None
+
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached_databases = json.load(f)
+        except Exception as ex:
+            log.warning("Unable to read primary key cache from '%s': %s" % (cache_path, str(ex),))
+            return None
+
+        return cached_databases.get(DatabaseHandler.__primary_key_cache_file_key(database_key), None)
+
+    @staticmethod
+    def __write_primary_key_cache_file(database_key: tuple, primary_key_columns: Dict[str, Dict[str, str]]) -> None:
+        """Write database's primary key columns to the cache file (if one is configured)."""
+        cache_path = DatabaseHandler.__primary_key_cache_path()
+        if not cache_path:
+            return
+
+        cached_databases = {}
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached_databases = json.load(f)
+            except Exception as ex:
+                log.warning("Overwriting unreadable primary key cache at '%s': %s" % (cache_path, str(ex),))
+
+        cached_databases[DatabaseHandler.__primary_key_cache_file_key(database_key)] = primary_key_columns
+
+        # Write to a temporary file and rename it so that concurrent readers never see a partially written cache
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), prefix='.pk_cache.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cached_databases, f)
+            os.rename(temp_path, cache_path)
+        except Exception as ex:
+            log.warning("Unable to write primary key cache to '%s': %s" % (cache_path, str(ex),))
+
+    def __prewarm_primary_key_columns(self) -> None:
+        """Fill process-wide primary key cache of the database with all tables and views using a single query.
+
+        If a cache file is configured, primary key columns get read from it instead (or written to it after the query).
+        """
+        database_key = self.__database_key
+
+        primary_key_columns = DatabaseHandler.__read_primary_key_cache_file(database_key)
+
+        if primary_key_columns is None:
+            primary_key_columns = {}
+
+            # noinspection SqlResolve
+            rows = self.query(DatabaseHandler.__PRIMARY_KEY_CATALOG_QUERY.format(
+                object_filter="""
+                    c.relkind IN ('r', 'p', 'v', 'm')
+                    AND n.nspname <> 'information_schema'
+                    AND n.nspname !~ '^pg_'
+                """
+            )).hashes()
+
+            object_columns = {}
+            for row in rows:
+                object_columns.setdefault((row['schema_name'], row['object_name'],), []).append(row)
+
+            for (schema_name, object_name,), columns in object_columns.items():
+                primary_key_column = DatabaseHandler.__primary_key_column_from_catalog(object_name, columns)
+                if primary_key_column:
+                    primary_key_columns.setdefault(schema_name, {})[object_name] = primary_key_column
+
+            DatabaseHandler.__write_primary_key_cache_file(database_key, primary_key_columns)
+
+        for schema_name, schema_primary_key_columns in primary_key_columns.items():
+            self.__primary_key_columns.setdefault(schema_name, {}).update(schema_primary_key_columns)
+
+        DatabaseHandler.__prewarmed_primary_key_caches.add(database_key)
+
+    @staticmethod
+    def clear_primary_key_column_cache() -> None:
+        """Clear process-wide primary key cache, e.g. after altering or recreating tables."""
+        for primary_key_columns in DatabaseHandler.__primary_key_column_caches.values():
+            primary_key_columns.clear()
+        DatabaseHandler.__prewarmed_primary_key_caches.clear()
+
     def primary_key_column(self, object_name: str) -> str:
         """Get INT / BIGINT primary key column name for a table or a view.
 
         If the table has a composite primary key, return the first INT / BIGINT column name.
+
+        Primary key columns are cached for the whole process (shared between handlers connected to the same database),
+        and the cache gets prewarmed with all tables and views on the first call.
         """
 
         object_name = decode_object_from_bytes_if_needed(object_name)
@@ -388,53 +921,21 @@ class DatabaseHandler(object):
         else:
             schema_name = 'public'
 
+        if self.__database_key not in DatabaseHandler.__prewarmed_primary_key_caches:
+            self.__prewarm_primary_key_columns()
+
         if schema_name not in self.__primary_key_columns:
             self.__primary_key_columns[schema_name] = {}
 
         if object_name not in self.__primary_key_columns[schema_name]:
 
-            # noinspection SpellCheckingInspection,SqlResolve
-            columns = self.query("""
-                SELECT
-                    n.nspname AS schema_name,
-                    c.relname AS object_name,
-                    c.relkind AS object_type,
-                    a.attname AS column_name,
-                    i.indisprimary AS is_primary_index,
-                    t.typname AS column_type,
-                    t.typcategory AS column_type_category
-
-                FROM pg_namespace AS n
-                    INNER JOIN pg_class AS c
-                        ON n.oid = c.relnamespace
-                    INNER JOIN pg_attribute AS a
-                        ON a.attrelid = c.oid
-                        AND NOT a.attisdropped
-                    INNER JOIN pg_type AS t
-                      ON a.atttypid = t.oid
-
-                    -- Object might be a view, so LEFT JOIN
-                    LEFT JOIN pg_index AS i
-                        ON c.oid = i.indrelid
-                        AND a.attnum = ANY(i.indkey)
-
-                WHERE
-
-                  -- No xid, cid, ...
-                  a.attnum > 0
-
-                  -- Live column
-                  AND NOT attisdropped
-
-                  -- Numeric (INT or BIGINT)
-                  AND t.typcategory = 'N'
-
-                  AND n.nspname = %(schema_name)s
-                  AND c.relname = %(object_name)s
-
-                -- In case of a composite PK, select the first numeric column
-                ORDER BY a.attnum
-            """, {
+            # Object created after the cache was prewarmed
+            columns = self.query(DatabaseHandler.__PRIMARY_KEY_CATALOG_QUERY.format(
+                object_filter="""
+                    n.nspname = %(schema_name)s
+                    AND c.relname = %(object_name)s
+                """
+            ), {
                 'schema_name': schema_name,
                 'object_name': object_name,
             }).hashes()
@@ -443,23 +944,7 @@ class DatabaseHandler(object):
                     "Object '{}' in schema '{} was not found.".format(schema_name, object_name)
                 )
 
-            primary_key_column = None
-
-            for column in columns:
-
-                column_name = column['column_name']
-
-                if column['object_type'] in ['r', 'p']:
-                    # Table
-                    if column['is_primary_index']:
-                        primary_key_column = column_name
-                        break
-
-                elif column['object_type'] in ['v', 'm']:
-                    # (Materialized) view
-                    if column['column_name'] == 'id' or column['column_name'] == '{}_id'.format(object_name):
-                        primary_key_column = column_name
-                        break
+            primary_key_column = DatabaseHandler.__primary_key_column_from_catalog(object_name, columns)
 
             if not primary_key_column:
                 raise McPrimaryKeyColumnException(
@@ -484,14 +969,16 @@ class DatabaseHandler(object):
         if not primary_key_column:
             raise McFindByIDException("Primary key for table '%s' was not found" % table)
 
-        # Python substitution
-        find_by_id_query = "SELECT * FROM %(table)s WHERE %(id_column)s" % {
+        find_by_id_query = "SELECT * FROM %(table)s WHERE %(id_column)s = $1" % {
             "table": table,
             "id_column": primary_key_column,
         }
 
-        # psycopg2 substitution
-        result = self.query(find_by_id_query + " = %(id_value)s", {'id_value': object_id})
+        result = self.prepared(
+            name=self.__prepared_statement_name(prefix='find_by_id', table=table),
+            sql=find_by_id_query,
+            params=(object_id,),
+        )
         if result.rows() > 1:
             raise McFindByIDException("More than one row was found for ID '%d' from table '%s'" % (object_id, table))
         elif result.rows() == 1:
@@ -540,9 +1027,12 @@ class DatabaseHandler(object):
         if not primary_key_column:
             raise McUpdateByIDException("Primary key for table '%s' was not found" % table)
 
+        columns = sorted(update_hash.keys())
+
         keys = []
-        for key, value in update_hash.items():
-            key_value = key
+        values = []
+        for key in columns:
+            value = update_hash[key]
 
             # Cast Inline::Python's booleans to Python's booleans
             # MC_REWRITE_TO_PYTHON: remove after porting
@@ -550,19 +1040,21 @@ class DatabaseHandler(object):
                 value = bool(value)
                 update_hash[key] = value
 
-            key_value += " = %(" + key + ")s"  # "%(key)s" to be resolved by psycopg2, not Python
+            values.append(value)
+            keys.append("%s = $%d" % (key, len(values),))
 
-            keys.append(key_value)
-
-        update_hash['__object_id'] = object_id
+        values.append(object_id)
 
         sql = "UPDATE %s " % table
         sql += "SET %s " % ", ".join(keys)
-        sql += "WHERE %s = " % primary_key_column
-        sql += "%(__object_id)s"  # "%(__object_id)s" to be resolved by psycopg2, not Python
+        sql += "WHERE %s = $%d" % (primary_key_column, len(values),)
 
         try:
-            self.query(sql, update_hash)
+            self.prepared(
+                name=self.__prepared_statement_name(prefix='update_by_id', table=table, columns=columns),
+                sql=sql,
+                params=values,
+            )
         except Exception as ex:
             raise McUpdateByIDException("Update to UPDATE hash '%s': %s" % (str(update_hash), str(ex)))
 
@@ -659,6 +1151,117 @@ class DatabaseHandler(object):
 
         return inserted_row
 
+    def __insert_many_pages(self,
+                            table: str,
+                            rows: List[Dict[str, Any]],
+                            on_conflict: Union[str, None],
+                            returning: Union[str, None],
+                            page_size: int) -> Iterator[DatabaseResult]:
+        """INSERT rows in pages of multi-row VALUES lists, yield result of every page's INSERT."""
+
+        table = decode_object_from_bytes_if_needed(table)
+        rows = decode_object_from_bytes_if_needed(rows)
+        on_conflict = decode_object_from_bytes_if_needed(on_conflict)
+        returning = decode_object_from_bytes_if_needed(returning)
+
+        if not table:
+            raise McInsertManyException("Table is unset.")
+        if rows is None:
+            raise McInsertManyException("Rows to INSERT is None.")
+        if page_size is None or page_size < 1:
+            raise McInsertManyException("Page size must be a positive integer.")
+
+        rows = list(rows)
+        if len(rows) == 0:
+            return
+
+        columns = sorted(rows[0].keys())
+        if len(columns) == 0:
+            raise McInsertManyException("Rows to INSERT are empty.")
+
+        values = []
+        for row in rows:
+            if sorted(row.keys()) != columns:
+                raise McInsertManyException(
+                    "All rows must have the same columns; expected %s, got %s" % (str(columns), str(sorted(row.keys())))
+                )
+
+            row_values = []
+            for column in columns:
+                value = row[column]
+
+                # Cast Inline::Python's booleans to Python's booleans
+                # MC_REWRITE_TO_PYTHON: remove after porting
+                if type(value).__name__ == '_perl_obj':
+                    value = bool(value)
+
+                row_values.append(value)
+
+            values.append(row_values)
+
+        row_placeholder = "(%s)" % ", ".join(['%s'] * len(columns))
+
+        for page_start in range(0, len(values), page_size):
+            page_values = values[page_start:page_start + page_size]
+
+            sql = "INSERT INTO %s " % table
+            sql += "(%s) " % ", ".join(columns)
+            sql += "VALUES %s " % ", ".join([row_placeholder] * len(page_values))
+            if on_conflict:
+                sql += "ON CONFLICT %s " % on_conflict.replace('%', '%%')
+            if returning:
+                sql += "RETURNING %s" % returning.replace('%', '%%')
+
+            params = tuple(value for row_values in page_values for value in row_values)
+
+            try:
+                yield self.query_native(sql, params)
+            except Exception as ex:
+                raise McInsertManyException("Unable to INSERT %d rows into '%s': %s" % (len(page_values), table, ex,))
+
+    def insert_many(self,
+                    table: str,
+                    rows: List[Dict[str, Any]],
+                    on_conflict: str = None,
+                    page_size: int = 1000) -> int:
+        """INSERT a list of rows (dicts with the same keys) into the table, return the number of rows inserted.
+
+        Rows get inserted with multi-row "INSERT ... VALUES (...), (...), ..." statements of up to "page_size" rows
+        each, so it's one round trip per page instead of one per row. If "on_conflict" is set, it's added as the
+        "ON CONFLICT" clause of the statement, e.g.:
+
+            db.insert_many('topic_tweet_urls', rows, on_conflict='DO NOTHING')
+            db.insert_many('media_sitemap_pages', rows, on_conflict='(url) DO NOTHING')
+        """
+        inserted_count = 0
+        for result in self.__insert_many_pages(table=table,
+                                               rows=rows,
+                                               on_conflict=on_conflict,
+                                               returning=None,
+                                               page_size=page_size):
+            inserted_count += result.rows()
+
+        return inserted_count
+
+    def insert_many_returning(self,
+                              table: str,
+                              rows: List[Dict[str, Any]],
+                              returning: str = '*',
+                              on_conflict: str = None,
+                              page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Same as insert_many() but return a list of inserted rows (their "returning" columns).
+
+        Rows skipped by "ON CONFLICT ... DO NOTHING" are not returned."""
+        inserted_rows = []
+        for result in self.__insert_many_pages(table=table,
+                                               rows=rows,
+                                               on_conflict=on_conflict,
+                                               returning=returning,
+                                               page_size=page_size):
+            inserted_rows.extend(result.hashes())
+
+        return inserted_rows
+
     def select(self, table: str, what_to_select: str, condition_hash: dict = None) -> DatabaseResult:
         """SELECT chosen columns from the table that match given conditions."""
 
@@ -905,8 +1508,7 @@ class DatabaseHandler(object):
         self.query(sql)
 
         copy = self.copy_from("COPY %s (id) FROM STDIN" % table_name)
-        for single_id in ids:
-            copy.put_line("%d\n" % int(single_id))
+        copy.put_rows((int(single_id),) for single_id in ids)
         copy.end()
 
         self.query("ANALYZE %s" % table_name)
@@ -918,7 +1520,8 @@ class DatabaseHandler(object):
                            child_query: str,
                            child_field: str,
                            id_column: str,
-                           single: bool = False) -> List[Dict[str, Any]]:
+                           single: bool = False,
+                           max_array_ids: Union[int, None] = None) -> List[Dict[str, Any]]:
         """For each row in "data", attach all results in the child query that match a JOIN with the "id_column" field in
         each row of "data".
 
@@ -928,6 +1531,9 @@ class DatabaseHandler(object):
 
         * If "single" is False, a list of values for each row in "data".
 
+        Up to "max_array_ids" parent IDs get passed to the child query as an array parameter; more IDs than that get
+        copied to a temporary table (see get_temporary_ids_table()) to join against.
+
         For an example on how this works, see test_attach_child_query() in test_handler.py."""
 
         # FIXME get rid of this hard to understand reimplementation of JOIN which is here due to the sole reason that
@@ -945,28 +1551,47 @@ class DatabaseHandler(object):
         child_field = decode_object_from_bytes_if_needed(child_field)
         id_column = decode_object_from_bytes_if_needed(id_column)
 
+        if max_array_ids is None:
+            max_array_ids = DatabaseHandler.__ATTACH_CHILD_QUERY_MAX_ARRAY_IDS
+
         parent_lookup = {}
-        ids = []
         for parent in data:
             parent_id = parent[id_column]
 
             parent_lookup[parent_id] = parent
-            ids.append(parent_id)
 
-        ids_table = self.get_temporary_ids_table(ids=ids)
-        sql = """
-            -- noinspection SqlResolve
-            SELECT q.*
-            FROM ( %(child_query)s ) AS q
+        # Every parent ID only once so that children don't get attached multiple times
+        ids = list(parent_lookup.keys())
+
+        if len(ids) <= max_array_ids:
+            # Cheaper than creating, filling and analyzing a temporary table for a small-ish number of IDs
+            sql = """
+                -- noinspection SqlResolve
+                SELECT q.*
+                FROM ( %(child_query)s ) AS q
                 -- Limit rows returned by "child_query" to only IDs from "ids"
-                INNER JOIN %(ids_table)s AS ids
-                    ON q.%(id_column)s = ids.id
-        """ % {
-            'child_query': child_query,
-            'ids_table': ids_table,
-            'id_column': id_column,
-        }
-        children = self.query(sql).hashes()
+                WHERE q.%(id_column)s = ANY(%%(ids)s::bigint[])
+            """ % {
+                'child_query': child_query,
+                'id_column': id_column,
+            }
+            children = self.query(sql, {'ids': [int(parent_id) for parent_id in ids]}).hashes()
+
+        else:
+            ids_table = self.get_temporary_ids_table(ids=ids)
+            sql = """
+                -- noinspection SqlResolve
+                SELECT q.*
+                FROM ( %(child_query)s ) AS q
+                    -- Limit rows returned by "child_query" to only IDs from "ids"
+                    INNER JOIN %(ids_table)s AS ids
+                        ON q.%(id_column)s = ids.id
+            """ % {
+                'child_query': child_query,
+                'ids_table': ids_table,
+                'id_column': id_column,
+            }
+            children = self.query(sql).hashes()
 
         # if we're appending lists, make sure each parent row has an empty list
         if not single:
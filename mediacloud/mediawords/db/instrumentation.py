@@ -0,0 +1,279 @@
+"""
+Per-statement query timing instrumentation.
+
+QueryStatistics is a DatabaseHandler query hook which records call counts, latency and returned row counts for every
+normalized statement (query with literals and parameters replaced with "?"), so that the most expensive queries of a
+worker can be found without enabling "pg_stat_statements" on the server.
+
+To collect statistics in a process and log a report of the top statements when it exits, run:
+
+    enable_query_statistics()
+
+Job workers do that themselves if "db_query_statistics" is enabled in mediawords.yml.
+
+"""
+
+import atexit
+import functools
+import random
+import re
+import threading
+from typing import Dict, List, Any, Union
+
+from mediawords.db.handler import DatabaseHandler
+from mediawords.util.log import create_logger
+from mediawords.util.perl import decode_object_from_bytes_if_needed
+
+log = create_logger(__name__)
+
+
+class McQueryStatisticsException(Exception):
+    """QueryStatistics exception."""
+    pass
+
+
+# Max. number of normalized queries to keep in the cache
+__NORMALIZE_CACHE_MAX_SIZE = 4096
+
+# Max. length of a query to cache the normalized statement of; longer queries (e.g. ones with inlined ID lists) are
+# rarely repeated verbatim and would make the cache hold on to a lot of memory
+__NORMALIZE_CACHE_MAX_QUERY_LENGTH = 4096
+
+# Comments
+__COMMENT_REGEX = re.compile(r'--[^\n]*')
+
+# String literals
+__STRING_LITERAL_REGEX = re.compile(r"'(?:[^']|'')*'")
+
+# Query parameters: psycopg2 ('%s', '%(name)s'), DBD::Pg ('?') and prepared statement ('$1') style
+__PARAMETER_REGEX = re.compile(r'%\([^)]+\)s|%s|\$\d+')
+
+# Numeric literals that are not a part of an identifier
+__NUMBER_REGEX = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+
+# Lists of placeholders, e.g. "IN (?, ?, ?)" or "ARRAY[?, ?, ?]"
+__PLACEHOLDER_LIST_REGEX = re.compile(r'([(\[])\s*\?(?:\s*,\s*\?)+\s*([)\]])')
+
+# Multi-row VALUES lists
+__VALUES_LIST_REGEX = re.compile(r'(\(\?(?:, \.\.\.)?\))(?:\s*,\s*\(\?(?:, \.\.\.)?\))+')
+
+# Randomly named temporary tables, e.g. the ones created by DatabaseHandler.get_temporary_ids_table()
+__TEMPORARY_TABLE_REGEX = re.compile(r'\b_tmp_ids_\w+')
+
+# Whitespace
+__WHITESPACE_REGEX = re.compile(r'\s+')
+
+
+def __normalize_statement(query: str) -> str:
+    """Return normalized statement of a query (uncached)."""
+
+    statement = __COMMENT_REGEX.sub(' ', query)
+    statement = __STRING_LITERAL_REGEX.sub('?', statement)
+    statement = __TEMPORARY_TABLE_REGEX.sub('_tmp_ids_?', statement)
+    statement = __PARAMETER_REGEX.sub('?', statement)
+    statement = __NUMBER_REGEX.sub('?', statement)
+    statement = __WHITESPACE_REGEX.sub(' ', statement).strip()
+    statement = __PLACEHOLDER_LIST_REGEX.sub(r'\1?, ...\2', statement)
+    statement = __VALUES_LIST_REGEX.sub(r'\1, ...', statement)
+
+    return statement
+
+
+@functools.lru_cache(maxsize=__NORMALIZE_CACHE_MAX_SIZE)
+def __cached_normalize_statement(query: str) -> str:
+    """Return normalized statement of a query, cached."""
+    return __normalize_statement(query)
+
+
+def normalize_statement(query: str) -> str:
+    """Return normalized statement of a query: comments removed, literals, parameters and random parts of temporary
+    table names replaced with "?", lists of those collapsed and whitespace squeezed."""
+    query = decode_object_from_bytes_if_needed(query)
+
+    if len(query) > __NORMALIZE_CACHE_MAX_QUERY_LENGTH:
+        return __normalize_statement(query)
+
+    return __cached_normalize_statement(query)
+
+
+class QueryStatistics(object):
+    """Query hook that collects per-statement statistics.
+
+    Only the first "max_statements" distinct statements get tracked; runs of any statements beyond that are just
+    counted, so that a process running a lot of unique statements doesn't grow the statistics without bounds."""
+
+    # Default max. number of distinct statements to track
+    DEFAULT_MAX_STATEMENTS = 10000
+
+    # Max. number of latency samples to keep per statement for calculating percentiles
+    __MAX_SAMPLES = 1000
+
+    # Percentiles to report
+    __PERCENTILES = [50, 95, 99]
+
+    # Max. length of a statement to print in a report
+    __MAX_REPORT_STATEMENT_LENGTH = 300
+
+    __slots__ = [
+        '__max_statements',
+        '__statements',
+        '__untracked_calls',
+        '__lock',
+    ]
+
+    def __init__(self, max_statements: int = DEFAULT_MAX_STATEMENTS):
+        """Constructor.
+
+        Arguments:
+        max_statements - max. number of distinct statements to track
+        """
+
+        if max_statements < 1:
+            raise McQueryStatisticsException("Max. statement count must be positive.")
+
+        self.__max_statements = max_statements
+
+        # Normalized statement -> {'calls', 'total_time', 'rows', 'samples'}
+        self.__statements = dict()
+
+        # Number of runs of statements that didn't fit into "max_statements"
+        self.__untracked_calls = 0
+
+        self.__lock = threading.Lock()
+
+    def __call__(self, query: str, duration: float, rows: int) -> None:
+        """Record a query run (query hook)."""
+        statement = normalize_statement(query)
+
+        with self.__lock:
+            stats = self.__statements.get(statement, None)
+            if stats is None:
+                if len(self.__statements) >= self.__max_statements:
+                    self.__untracked_calls += 1
+                    return
+
+                stats = {'calls': 0, 'total_time': 0.0, 'rows': 0, 'samples': []}
+                self.__statements[statement] = stats
+
+            stats['calls'] += 1
+            stats['total_time'] += duration
+            if rows > 0:
+                stats['rows'] += rows
+
+            # Reservoir sampling to keep percentiles representative with a bounded memory use
+            if len(stats['samples']) < self.__MAX_SAMPLES:
+                stats['samples'].append(duration)
+            else:
+                sample_index = random.randrange(stats['calls'])
+                if sample_index < self.__MAX_SAMPLES:
+                    stats['samples'][sample_index] = duration
+
+    @staticmethod
+    def __percentile(sorted_samples: List[float], percentile: int) -> float:
+        """Return percentile (nearest rank) of sorted samples."""
+        if not sorted_samples:
+            return 0.0
+        rank = max(int(round(percentile / 100 * len(sorted_samples))), 1)
+        return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+    def statistics(self, top_n: Union[int, None] = None) -> List[Dict[str, Any]]:
+        """Return statistics of statements, most expensive (by total time) first.
+
+        Every item has "statement", "calls", "total_time", "mean_time", "rows" and "p<percentile>_time" keys; times are
+        in seconds."""
+        with self.__lock:
+            statements = [(statement, dict(stats), list(stats['samples']),)
+                          for statement, stats in self.__statements.items()]
+
+        statistics = []
+        for statement, stats, samples in statements:
+            samples.sort()
+            statement_statistics = {
+                'statement': statement,
+                'calls': stats['calls'],
+                'total_time': stats['total_time'],
+                'mean_time': stats['total_time'] / stats['calls'],
+                'rows': stats['rows'],
+            }
+            for percentile in self.__PERCENTILES:
+                statement_statistics['p%d_time' % percentile] = self.__percentile(samples, percentile)
+            statistics.append(statement_statistics)
+
+        statistics.sort(key=lambda x: x['total_time'], reverse=True)
+
+        if top_n is not None:
+            statistics = statistics[:top_n]
+
+        return statistics
+
+    def untracked_calls(self) -> int:
+        """Return number of statement runs that weren't recorded because "max_statements" statements were tracked
+        already."""
+        with self.__lock:
+            return self.__untracked_calls
+
+    def report(self, top_n: int = 20) -> str:
+        """Return a text report of the "top_n" most expensive statements."""
+        statistics = self.statistics(top_n=top_n)
+
+        lines = ["Top %d statements by total time:" % len(statistics)]
+        for rank, stats in enumerate(statistics, start=1):
+            statement = stats['statement']
+            if len(statement) > self.__MAX_REPORT_STATEMENT_LENGTH:
+                statement = statement[:self.__MAX_REPORT_STATEMENT_LENGTH] + '...'
+
+            lines.append(
+                "%(rank)d. calls: %(calls)d, total: %(total_time).3f s, mean: %(mean_time).4f s, "
+                "p50: %(p50_time).4f s, p95: %(p95_time).4f s, p99: %(p99_time).4f s, rows: %(rows)d" % {
+                    'rank': rank,
+                    **stats,
+                }
+            )
+            lines.append("    %s" % statement)
+
+        untracked_calls = self.untracked_calls()
+        if untracked_calls:
+            lines.append("%d runs of statements beyond the first %d distinct ones were not recorded." % (
+                untracked_calls, self.__max_statements,
+            ))
+
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Forget all collected statistics."""
+        with self.__lock:
+            self.__statements = dict()
+            self.__untracked_calls = 0
+
+
+# Process-wide statistics collected by enable_query_statistics()
+__query_statistics = None
+__query_statistics_lock = threading.Lock()
+
+
+def __log_query_statistics_report() -> None:
+    """Log report of process-wide statistics."""
+    if __query_statistics is not None:
+        log.info(__query_statistics.report())
+
+
+def enable_query_statistics(report_at_exit: bool = True) -> QueryStatistics:
+    """Start collecting process-wide query statistics (if not collecting already), return the collector.
+
+    If "report_at_exit" is True, a report gets logged when the process exits."""
+    global __query_statistics
+
+    with __query_statistics_lock:
+        if __query_statistics is None:
+            __query_statistics = QueryStatistics()
+            DatabaseHandler.add_query_hook(__query_statistics)
+
+            if report_at_exit:
+                atexit.register(__log_query_statistics_report)
+
+    return __query_statistics
+
+
+def log_query_statistics_report() -> None:
+    """Log report of process-wide query statistics (if they're being collected)."""
+    __log_query_statistics_report()
@@ -1,10 +1,11 @@
 import datetime
+import functools
 import itertools
 import pprint
 import re
 import textwrap
 import time
-from typing import Dict, List, Any
+from typing import Callable, Dict, Iterator, List, Any, Tuple, Union
 
 import psycopg2
 from psycopg2.extras import DictCursor
@@ -19,26 +20,71 @@ log = create_logger(__name__)
 class DatabaseResult(object):
     """Wrapper around SQL query result."""
 
+    # Max. number of rewritten queries to keep in the cache
+    __QUERY_CACHE_MAX_SIZE = 1024
+
+    # PostgreSQL type OID -> NumPy dtype of numeric columns for column_arrays()
+    __NUMPY_DTYPES = {
+        16: 'bool',  # BOOLEAN
+        20: 'int64',  # BIGINT
+        21: 'int16',  # SMALLINT
+        23: 'int32',  # INT
+        700: 'float32',  # REAL
+        701: 'float64',  # DOUBLE PRECISION
+    }
+
     __cursor = None  # psycopg2 cursor
 
     def __init__(self,
                  cursor: DictCursor,
                  query_args: tuple,
                  double_percentage_sign_marker: str,
-                 print_warnings: bool = True):
+                 print_warnings: bool = True,
+                 query_is_normalized: bool = False,
+                 query_hooks: Union[List[Callable[[str, float, int], None]], None] = None):
+        """Constructor; runs the query.
+
+        If "query_is_normalized" is True, query is expected to be in psycopg2's native format already (literal
+        percentage signs doubled, no quote()d strings) and is passed to psycopg2 as-is.
+
+        Every callable in "query_hooks" gets called with the query, its duration (in seconds) and the number of rows it
+        returned or affected after the query has been run."""
 
         # MC_REWRITE_TO_PYTHON: 'query_args' should be decoded from 'bytes' at this point
 
         self.__execute(cursor=cursor,
                        query_args=query_args,
                        double_percentage_sign_marker=double_percentage_sign_marker,
-                       print_warnings=print_warnings)
+                       print_warnings=print_warnings,
+                       query_is_normalized=query_is_normalized,
+                       query_hooks=query_hooks)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=__QUERY_CACHE_MAX_SIZE)
+    def __double_percentage_signs(query: str) -> str:
+        """Duplicate '%' everywhere except for psycopg2 parameter placeholders ('%s' and '%(...)s').
+
+        The same few hundred queries get run over and over again, so the rewritten queries are cached."""
+        return re.sub(r'%(?!(s|\(.*?\)s?))', '%%', query)
+
+    @staticmethod
+    def query_cache_stats() -> Dict[str, int]:
+        """Return rewritten query cache statistics: hits, misses, current and max. size."""
+        cache_info = DatabaseResult.__double_percentage_signs.cache_info()
+        return {
+            'hits': cache_info.hits,
+            'misses': cache_info.misses,
+            'size': cache_info.currsize,
+            'max_size': cache_info.maxsize,
+        }
 
     def __execute(self,
                   cursor: DictCursor,
                   query_args: tuple,
                   double_percentage_sign_marker: str,
-                  print_warnings: bool) -> None:
+                  print_warnings: bool,
+                  query_is_normalized: bool = False,
+                  query_hooks: Union[List[Callable[[str, float, int], None]], None] = None) -> None:
         """Execute statement, set up cursor to results."""
 
         # MC_REWRITE_TO_PYTHON: 'query_args' should be decoded from 'bytes' at this point
@@ -58,17 +104,21 @@ class DatabaseResult(object):
                 # to execute().
                 query_args = (query_args[0], {},)
 
-            query = query_args[0]
+            if not query_is_normalized:
+                query = query_args[0]
+
+                if double_percentage_sign_marker in query:
+                    # Queries with quote()d strings in them are unlikely to repeat, so don't let them evict others from
+                    # the cache
+                    query = self.__double_percentage_signs.__wrapped__(query)
 
-            # Duplicate '%' everywhere except for psycopg2 parameter placeholders ('%s' and '%(...)s')
-            query = re.sub(r'%(?!(s|\(.*?\)s?))', '%%', query)
+                    # Replace percentage signs coming from quote()d strings with double percentage signs
+                    query = query.replace(double_percentage_sign_marker, '%%')
 
-            # Replace percentage signs coming from quote()d strings with double percentage signs
-            query = query.replace(double_percentage_sign_marker, '%%')
+                else:
+                    query = self.__double_percentage_signs(query)
 
-            query_args_list = list(query_args)
-            query_args_list[0] = query
-            query_args = tuple(query_args_list)
+                query_args = (query,) + tuple(query_args[1:])
 
             log.debug("Running query: %s" % str(query_args))
 
@@ -82,6 +132,14 @@ class DatabaseResult(object):
                 query_params = textwrap.shorten(str(query_args[1:]), width=80)
                 log.info("Slow query (%d seconds): %s, %s" % (query_time, query_text, query_params))
 
+            if query_hooks:
+                self.__run_query_hooks(
+                    query_hooks=query_hooks,
+                    query=query_args[0],
+                    query_time=query_time,
+                    rows=cursor.rowcount,
+                )
+
         except psycopg2.Warning as ex:
             if print_warnings:
                 log.warning('Warning while running query: %s' % str(ex))
@@ -123,6 +181,18 @@ class DatabaseResult(object):
 
         self.__cursor = cursor  # Cursor now holds results
 
+    @staticmethod
+    def __run_query_hooks(query_hooks: List[Callable[[str, float, int], None]],
+                          query: str,
+                          query_time: float,
+                          rows: int) -> None:
+        """Run query hooks; hook errors get logged and don't fail the query."""
+        for query_hook in query_hooks:
+            try:
+                query_hook(query, query_time, rows)
+            except Exception as ex:
+                log.warning("Query hook %s failed: %s" % (str(query_hook), str(ex)))
+
     @staticmethod
     def __convert_datetime_objects_to_strings(item: Any) -> Any:
         """Covert all datetime objects to strings to be consistent what Perl code will be receiving.
@@ -193,6 +263,56 @@ class DatabaseResult(object):
 
         return rows
 
+    def iterate_hashes(self) -> Iterator[Dict[str, Any]]:
+        """Yield dicts of all returned (remaining) rows, keyed by column name, one by one.
+
+        With a named (server-side) cursor, rows get fetched from the server in batches of cursor's "itersize"."""
+        for row in self.__cursor:
+            yield {k: self.__convert_datetime_objects_to_strings(v) for k, v in row.items()}
+
+    def iterate_tuples(self) -> Iterator[Tuple[Any, ...]]:
+        """Yield tuples of all returned (remaining) rows one by one.
+
+        With a named (server-side) cursor, rows get fetched from the server in batches of cursor's "itersize"."""
+        for row in self.__cursor:
+            yield tuple(self.__convert_datetime_objects_to_strings(item) for item in row)
+
+    def tuples(self) -> List[Tuple[Any, ...]]:
+        """Return a list of tuples of all returned (remaining) rows.
+
+        Unlike other methods, values are returned as they come from psycopg2, i.e. DATE / TIMESTAMP columns are not
+        stringified. Meant for Python-only callers that scan large result sets, preferably together with
+        DatabaseHandler.query_tuples() which doesn't build dict-like rows in the first place."""
+        rows = self.__cursor.fetchall()
+        if rows and not isinstance(rows[0], tuple):
+            rows = [tuple(row) for row in rows]
+        return rows
+
+    def column_arrays(self, as_numpy: bool = False) -> Dict[str, Union[List[Any], Any]]:
+        """Return a dict of all returned (remaining) rows as column name -> list of column's raw values (see tuples()).
+
+        If "as_numpy" is True, numeric (BOOLEAN, INT, BIGINT, SMALLINT, REAL, DOUBLE PRECISION) columns without NULLs
+        are returned as NumPy arrays."""
+        column_names = self.columns()
+        type_codes = [desc[1] for desc in self.__cursor.description]
+
+        rows = self.__cursor.fetchall()
+        if rows:
+            column_values = [list(values) for values in zip(*rows)]
+        else:
+            column_values = [[] for _ in column_names]
+
+        if as_numpy:
+            # Imported only when needed as it takes a while
+            import numpy
+
+            for index, type_code in enumerate(type_codes):
+                dtype = self.__NUMPY_DTYPES.get(type_code, None)
+                if dtype is not None and None not in column_values[index]:
+                    column_values[index] = numpy.array(column_values[index], dtype=dtype)
+
+        return dict(zip(column_names, column_values))
+
     def text(self, text_type: str = 'neat') -> str:
         """Return a string of all returned (remaining) rows with a simple text representation of the data."""
 
@@ -1,12 +1,22 @@
+import datetime
+import json
+import os
 import re
+import tempfile
 
 import pytest
 
-from mediawords.db.exceptions.handler import McPrimaryKeyColumnException
+from mediawords.db import connect_to_db
+from mediawords.db.copy.copy_from import McCopyFromException
+from mediawords.db.exceptions.handler import (
+    McPreparedException, McPrimaryKeyColumnException, McQueryException, McQueryStreamException,
+)
 from mediawords.db.exceptions.result import McDatabaseResultException
 from mediawords.db.handler import (
-    McUpdateByIDException, McCreateException, McRequireByIDException, McUniqueConstraintException,
+    DatabaseHandler, McUpdateByIDException, McCreateException, McRequireByIDException, McUniqueConstraintException,
+    McInsertManyException,
 )
+from mediawords.db.result.result import DatabaseResult
 from mediawords.test.test_database import TestDatabaseTestCase
 from mediawords.util.config import (
     get_config as py_get_config,
@@ -327,6 +337,218 @@ class TestDatabaseHandler(TestDatabaseTestCase):
         assert isinstance(hashes[0]['dob'], str)
         assert isinstance(hashes[1]['dob'], str)
 
+    def test_query_tuples(self):
+        rows = self.db().query_tuples("""
+            SELECT id, name, dob FROM kardashians WHERE surname = %(surname)s ORDER BY id
+        """, {'surname': 'Jenner'}).tuples()
+        assert len(rows) == 4
+        assert rows[0] == (1, 'Kris', datetime.date(1955, 11, 5))
+
+        # Dict cursor rows get converted to tuples too
+        rows = self.db().query("SELECT id, dob FROM kardashians WHERE id = 1").tuples()
+        assert rows == [(1, datetime.date(1955, 11, 5))]
+
+        columns = self.db().query_tuples("""
+            SELECT id, name, married_to_kanye, NULL::INT AS nothing FROM kardashians ORDER BY id
+        """).column_arrays()
+        assert columns['id'] == [1, 2, 3, 4, 5, 6, 7, 8]
+        assert columns['name'][:2] == ['Kris', 'Caitlyn']
+        assert columns['married_to_kanye'][3] is True
+        assert columns['nothing'] == [None] * 8
+
+        columns = self.db().query_tuples("""
+            SELECT id, name, NULL::INT AS nothing FROM kardashians ORDER BY id
+        """).column_arrays(as_numpy=True)
+        assert str(columns['id'].dtype) == 'int32'
+        assert columns['id'].sum() == 36
+        assert isinstance(columns['name'], list)
+        assert isinstance(columns['nothing'], list)
+
+        # Empty result
+        columns = self.db().query_tuples("SELECT id FROM kardashians WHERE id = 0").column_arrays()
+        assert columns == {'id': []}
+
+    def test_query_native(self):
+        row = self.db().query_native(
+            "SELECT name, dob FROM kardashians WHERE surname = %(surname)s AND name LIKE 'Kr%%'",
+            {'surname': 'Jenner'},
+        ).hash()
+        assert row['name'] == 'Kris'
+        assert isinstance(row['dob'], str)
+
+        names = self.db().query_native(
+            "SELECT name FROM kardashians WHERE surname = %s AND name LIKE %s ORDER BY name", ('Jenner', 'K%'),
+        ).flat()
+        assert names == ['Kendall', 'Kris', 'Kylie']
+
+        # No parameters
+        assert self.db().query_native("SELECT 5 %% 3").flat() == [2]
+
+        with pytest.raises(McQueryException):
+            self.db().query_native("SELECT name FROM kardashians WHERE name = %s" % self.db().quote('100%'))
+
+    def test_query_cache(self):
+        query = "SELECT name FROM kardashians WHERE name LIKE 'Kr%' AND id = %(id)s"
+        assert self.db().query(query, {'id': 1}).flat() == ['Kris']
+
+        hits_before = DatabaseResult.query_cache_stats()['hits']
+        assert self.db().query(query, {'id': 1}).flat() == ['Kris']
+        assert DatabaseResult.query_cache_stats()['hits'] == hits_before + 1
+
+    def test_prepared(self):
+        stats_before = self.db().prepared_statement_stats()
+
+        sql = "SELECT name FROM kardashians WHERE surname = $1 AND name LIKE 'K%' ORDER BY name"
+        assert self.db().prepared('test_kardashians', sql, ('Jenner',)).flat() == ['Kendall', 'Kris', 'Kylie']
+        assert self.db().prepared('test_kardashians', sql, ['Kardashian']).flat() == ['Khloé', 'Kim', 'Kourtney']
+
+        stats = self.db().prepared_statement_stats()
+        assert stats['prepares'] == stats_before['prepares'] + 1
+        assert stats['executions'] == stats_before['executions'] + 2
+
+        # Same name, different SQL
+        assert self.db().prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+        assert self.db().prepared_statement_stats()['prepares'] == stats_before['prepares'] + 2
+
+        # Statement gone from the server
+        self.db().query("DEALLOCATE ALL")
+        assert self.db().prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+
+        # Result type changed after schema change
+        row = self.db().find_by_id(table='kardashians', object_id=1)
+        assert 'middle_name' not in row
+        self.db().query("ALTER TABLE kardashians ADD COLUMN middle_name TEXT")
+        row = self.db().find_by_id(table='kardashians', object_id=1)
+        assert row['name'] == 'Kris'
+        assert 'middle_name' in row
+
+        # Stale statements don't get retried in a transaction which the failed EXECUTE has aborted
+        self.db().begin()
+        self.db().query("ALTER TABLE kardashians DROP COLUMN middle_name")
+        with pytest.raises(McDatabaseResultException):
+            self.db().find_by_id(table='kardashians', object_id=1)
+        self.db().rollback()
+
+        with pytest.raises(McPreparedException):
+            self.db().prepared('Invalid Name', "SELECT 1")
+
+        with pytest.raises(McDatabaseResultException):
+            self.db().prepared('test_invalid_query', "SELECT * FROM nonexistent_table")
+
+    def test_deallocate_outdated_prepared_statements(self):
+        def prepared_statement_count(db: DatabaseHandler) -> int:
+            return db.query("SELECT COUNT(*) FROM pg_prepared_statements").flat()[0]
+
+        self.db().query("""
+            CREATE TABLE database_variables (
+                name    TEXT    NOT NULL UNIQUE,
+                value   TEXT    NOT NULL
+            )
+        """)
+
+        other_db = None
+
+        try:
+            self.db().query("INSERT INTO database_variables (name, value) VALUES ('database-schema-version', '1')")
+
+            self.db().deallocate_prepared_statements()
+            assert self.db().prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+            assert prepared_statement_count(self.db()) == 1
+
+            # Same schema version
+            self.db().deallocate_outdated_prepared_statements()
+            assert prepared_statement_count(self.db()) == 1
+
+            # Schema got migrated
+            self.db().query("UPDATE database_variables SET value = '2' WHERE name = 'database-schema-version'")
+            self.db().deallocate_outdated_prepared_statements()
+            assert prepared_statement_count(self.db()) == 0
+
+            stats_before = self.db().prepared_statement_stats()
+            assert self.db().prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+            assert self.db().prepared_statement_stats()['prepares'] == stats_before['prepares'] + 1
+
+            # Other handler notices the migration, so this one re-prepares its statements before running them even in
+            # a transaction
+            self.db().query("UPDATE database_variables SET value = '3' WHERE name = 'database-schema-version'")
+            other_db = connect_to_db(label='test', do_not_check_schema_version=True)
+            assert other_db.prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+            other_db.deallocate_outdated_prepared_statements()
+
+            stats_before = self.db().prepared_statement_stats()
+            self.db().begin()
+            assert self.db().prepared('test_kardashians', "SELECT COUNT(*) FROM kardashians").flat() == [8]
+            self.db().commit()
+            assert self.db().prepared_statement_stats()['prepares'] == stats_before['prepares'] + 1
+
+        finally:
+            if other_db is not None:
+                other_db.disconnect()
+
+            # Other tests connect with schema version check enabled
+            self.db().query("DROP TABLE database_variables")
+
+    def test_schema_version_check_memoized(self):
+        stats_before = DatabaseHandler.schema_version_check_stats()
+
+        # First connection might or might not do the check (setUp() has connected to the same database already), but
+        # the second one should skip it
+        for _ in range(2):
+            db = connect_to_db(label='test')
+            db.disconnect()
+
+        stats = DatabaseHandler.schema_version_check_stats()
+        assert stats['checks'] + stats['skipped'] == stats_before['checks'] + stats_before['skipped'] + 2
+        assert stats['skipped'] >= stats_before['skipped'] + 1
+
+        # Skipped when asked too, without counting it as avoided
+        db = connect_to_db(label='test', do_not_check_schema_version=True)
+        db.disconnect()
+        assert DatabaseHandler.schema_version_check_stats() == stats
+
+    def test_query_stream(self):
+        rows = self.db().query_stream("""
+            SELECT * FROM kardashians WHERE name IN (%(a)s, %(b)s) ORDER BY name
+        """, {'a': 'Caitlyn', 'b': 'Kris'}, itersize=1)
+        hashes = list(rows)
+        assert len(hashes) == 2
+
+        assert len(hashes[0]) == 5
+        assert hashes[0]['name'] == 'Caitlyn'
+        assert hashes[1]['name'] == 'Kris'
+
+        # MC_REWRITE_TO_PYTHON: remove after __convert_datetime_objects_to_strings() gets removed and database handler
+        # is made to return datetime.datetime objects again
+        assert isinstance(hashes[0]['dob'], str)
+
+        # Tuples, DBD::Pg-style parameters, percentage sign
+        tuples = list(self.db().query_stream(
+            "SELECT name, dob FROM kardashians WHERE surname = ? AND name LIKE 'K%' ORDER BY name",
+            'Jenner',
+            as_tuples=True,
+        ))
+        assert tuples == [('Kendall', '1995-11-03'), ('Kris', '1955-11-05'), ('Kylie', '1997-08-10')]
+
+        # Rows get fetched in batches while other queries are being run
+        names = []
+        for row in self.db().query_stream("SELECT id, name FROM kardashians ORDER BY id", itersize=3):
+            names.append(self.db().find_by_id(table='kardashians', object_id=row['id'])['name'])
+        assert len(names) == 8
+        assert names[0] == 'Kris'
+
+        # Streaming within a transaction (cursor survives commit)
+        self.db().begin()
+        rows = self.db().query_stream("SELECT name FROM kardashians ORDER BY id", itersize=2, as_tuples=True)
+        assert next(rows) == ('Kris',)
+        self.db().commit()
+        assert len(list(rows)) == 7
+
+        with pytest.raises(McDatabaseResultException):
+            self.db().query_stream("SELECT * FROM nonexistent_table")
+
+        with pytest.raises(McQueryStreamException):
+            self.db().query_stream("SELECT * FROM kardashians", itersize=0)
+
     def test_execute_with_large_work_mem(self):
         normal_work_mem = 256  # MB
         large_work_mem = 512  # MB
@@ -484,6 +706,50 @@ class TestDatabaseHandler(TestDatabaseTestCase):
         with pytest.raises(McPrimaryKeyColumnException):
             self.db().primary_key_column('no_primary_key')
 
+    def test_primary_key_column_cache(self):
+        assert self.db().primary_key_column('kardashians') == 'id'
+
+        # Primary key cache is shared with other handlers connected to the same database
+        self.db().query("ALTER TABLE kardashians RENAME COLUMN id TO kardashians_id")
+        other_db = connect_to_db(label='test')
+        assert other_db.primary_key_column('kardashians') == 'id'
+        other_db.disconnect()
+
+        DatabaseHandler.clear_primary_key_column_cache()
+        assert self.db().primary_key_column('kardashians') == 'kardashians_id'
+
+        # Prewarming writes to cache file
+        config = py_get_config()
+        old_config = config['mediawords'].get('db_primary_key_cache_path', None)
+        temp_dir = tempfile.mkdtemp()
+        cache_path = os.path.join(temp_dir, 'primary_keys.json')
+        config['mediawords']['db_primary_key_cache_path'] = cache_path
+        py_set_config(config)
+
+        try:
+            DatabaseHandler.clear_primary_key_column_cache()
+            assert self.db().primary_key_column('kardashians') == 'kardashians_id'
+            assert os.path.isfile(cache_path)
+
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached_databases = json.load(f)
+            assert len(cached_databases) == 1
+            primary_key_columns = list(cached_databases.values())[0]
+            assert primary_key_columns['public']['kardashians'] == 'kardashians_id'
+
+            # ...and then gets read from it
+            DatabaseHandler.clear_primary_key_column_cache()
+            self.db().query("ALTER TABLE kardashians RENAME COLUMN kardashians_id TO id")
+            assert self.db().primary_key_column('kardashians') == 'kardashians_id'
+
+        finally:
+            config['mediawords']['db_primary_key_cache_path'] = old_config
+            py_set_config(config)
+            DatabaseHandler.clear_primary_key_column_cache()
+            if os.path.isfile(cache_path):
+                os.unlink(cache_path)
+            os.rmdir(temp_dir)
+
     def test_primary_key_column_view(self):
         """Test primary_key_column() against a view (in front of a partitioned table)."""
 
@@ -592,6 +858,49 @@ class TestDatabaseHandler(TestDatabaseTestCase):
         with pytest.raises(McUniqueConstraintException):
             self.db().create('kardashians', insert_hash)
 
+    def test_insert_many(self):
+        rows = [
+            {'name': 'Lamar', 'surname': 'Odom', 'dob': '1979-11-06'},
+            {'name': 'Scott', 'surname': 'Disick', 'dob': '1983-05-26'},
+            {'name': 'Travis', 'surname': '100% Scott', 'dob': '1991-04-30'},
+        ]
+        assert self.db().insert_many(table='kardashians', rows=rows, page_size=2) == 3
+        assert self.db().query("SELECT COUNT(*) FROM kardashians").flat() == [11]
+        assert self.db().query("SELECT surname FROM kardashians WHERE name = 'Travis'").flat() == ['100% Scott']
+
+        assert self.db().insert_many(table='kardashians', rows=[]) == 0
+
+        # Conflicts
+        with pytest.raises(McInsertManyException):
+            self.db().insert_many(table='kardashians', rows=rows)
+        assert self.db().insert_many(table='kardashians', rows=rows, on_conflict='(name) DO NOTHING') == 0
+
+        # Different columns
+        with pytest.raises(McInsertManyException):
+            self.db().insert_many(table='kardashians', rows=[
+                {'name': 'Corey', 'surname': 'Gamble', 'dob': '1981-02-22'},
+                {'name': 'Tristan', 'surname': 'Thompson'},
+            ])
+
+    def test_insert_many_returning(self):
+        rows = [
+            {'name': 'Kris', 'surname': 'Jenner', 'dob': '1955-11-05'},
+            {'name': 'Lamar', 'surname': 'Odom', 'dob': '1979-11-06'},
+            {'name': 'Scott', 'surname': 'Disick', 'dob': '1983-05-26'},
+        ]
+        inserted_rows = self.db().insert_many_returning(
+            table='kardashians',
+            rows=rows,
+            returning='id, name, dob',
+            on_conflict='DO NOTHING',
+            page_size=2,
+        )
+
+        # Existing 'Kris' gets skipped
+        assert [row['name'] for row in inserted_rows] == ['Lamar', 'Scott']
+        assert inserted_rows[0]['id'] > 8
+        assert inserted_rows[0]['dob'] == '1979-11-06'
+
     def test_create_updatable_view(self):
         """Test create() against an updatable view that's in front of a partitioned table."""
 
@@ -786,6 +1095,66 @@ class TestDatabaseHandler(TestDatabaseTestCase):
         assert row['surname'] == '𝐽𝑒𝑛𝑛𝑒𝑟'
         assert str(row['dob']) == '1983-08-21'
 
+    def test_copy_from_put_rows(self):
+        copy = self.db().copy_from(sql="COPY kardashians (name, surname, dob, married_to_kanye) FROM STDIN")
+        copy.put_rows([
+            ['Lamar', 'Odom', '1979-11-06', False],
+            ['Sam\tBrody', '𝐽𝑒𝑛𝑛𝑒𝑟\\\n', '1983-08-21', True],  # UTF-8, characters to escape
+        ])
+        copy.put_rows(('Name %d' % x, 'Surname', '2000-01-01', False) for x in range(10000))
+        copy.end()
+
+        row = self.db().query("SELECT * FROM kardashians WHERE name = 'Lamar'").hash()
+        assert row['surname'] == 'Odom'
+        assert row['married_to_kanye'] is False
+
+        row = self.db().query("SELECT * FROM kardashians WHERE name = %(name)s", {'name': 'Sam\tBrody'}).hash()
+        assert row['surname'] == '𝐽𝑒𝑛𝑛𝑒𝑟\\\n'
+        assert str(row['dob']) == '1983-08-21'
+        assert row['married_to_kanye'] is True
+
+        # Rows from a generator
+        (count,) = self.db().query("SELECT COUNT(*) FROM kardashians WHERE surname = 'Surname'").flat()
+        assert count == 10000
+
+        # Only TEXT format is supported
+        copy = self.db().copy_from(sql="COPY kardashians (name, surname, dob) FROM STDIN WITH CSV")
+        with pytest.raises(McCopyFromException):
+            copy.put_rows([['Rob', 'Kardashian', '1987-03-17']])
+
+    def test_copy_from_put_rows_escaping(self):
+        self.db().query("""
+            CREATE TEMPORARY TABLE copy_from_escaping (
+                id      INT     NOT NULL,
+                text    TEXT    NULL,
+                data    BYTEA   NULL
+            )
+        """)
+
+        rows = [
+            [1, 'tab\there', b'\x00\x01\\\t\n\r\xff'],
+            [2, 'new\nline', bytearray(b'\xde\xad\xbe\xef')],
+            [3, 'back\\slash \\N \\x00', memoryview(b'\\x41')],
+            [4, 'carriage\rreturn\r\n', b''],
+            [5, None, None],
+        ]
+
+        copy = self.db().copy_from(sql="COPY copy_from_escaping (id, text, data) FROM STDIN")
+        copy.put_rows(rows)
+        copy.end()
+
+        got_rows = self.db().query("SELECT id, text, data FROM copy_from_escaping ORDER BY id").hashes()
+        assert len(got_rows) == len(rows)
+
+        for expected_row, got_row in zip(rows, got_rows):
+            expected_id, expected_text, expected_data = expected_row
+            assert got_row['id'] == expected_id
+            assert got_row['text'] == expected_text
+            if expected_data is None:
+                assert got_row['data'] is None
+            else:
+                assert bytes(got_row['data']) == bytes(expected_data)
+
     def test_copy_to(self):
         sql = """
             COPY (
@@ -949,3 +1318,24 @@ class TestDatabaseHandler(TestDatabaseTestCase):
                 ]
             }
         ]
+
+        # Temporary IDs table instead of an array parameter, duplicate parent IDs
+        owners = [
+            {'owner_id': 1, 'owner_name': 'John'},
+            {'owner_id': 2, 'owner_name': 'Jane'},
+            {'owner_id': 2, 'owner_name': 'Jane'},
+        ]
+        for max_array_ids in [0, 10]:
+            owners_and_their_dogs = self.db().attach_child_query(
+                data=[dict(owner) for owner in owners],
+                child_query='SELECT owner_id, dog_name FROM dogs',
+                child_field='owned_dogs',
+                id_column='owner_id',
+                single=False,
+                max_array_ids=max_array_ids,
+            )
+            assert [sorted(dog['dog_name'] for dog in owner['owned_dogs']) for owner in owners_and_their_dogs] == [
+                ['Bailey', 'Max'],
+                [],
+                ['Bella', 'Charlie'],
+            ]
@@ -0,0 +1,136 @@
+import pytest
+
+from mediawords.db.handler import DatabaseHandler
+from mediawords.db.instrumentation import normalize_statement, QueryStatistics, McQueryStatisticsException
+from mediawords.test.test_database import TestDatabaseTestCase
+
+
+def test_normalize_statement():
+    assert normalize_statement("""
+        SELECT *
+        FROM stories -- comment
+        WHERE stories_id = %(stories_id)s
+          AND title = 'It''s a title'
+          AND media_id IN (1, 2, 3)
+    """) == "SELECT * FROM stories WHERE stories_id = ? AND title = ? AND media_id IN (?, ...)"
+
+    # Same statement with different literals
+    assert normalize_statement("SELECT * FROM story_sentences_p_01 WHERE stories_id = 1 LIMIT 10") == \
+        normalize_statement("SELECT * FROM story_sentences_p_01 WHERE stories_id = 42 LIMIT 5")
+
+    assert normalize_statement("EXECUTE find_by_id (%s)") == "EXECUTE find_by_id (?)"
+    assert normalize_statement("SELECT * FROM foo WHERE bar = $1 AND baz = 1.5") == \
+        "SELECT * FROM foo WHERE bar = ? AND baz = ?"
+    assert normalize_statement("INSERT INTO foo (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)") == \
+        "INSERT INTO foo (a, b) VALUES (?, ...), ..."
+
+    # Randomly named temporary tables
+    assert normalize_statement("CREATE TEMPORARY TABLE _tmp_ids_Ab3dE (_tmp_ids_Ab3dE_pkey SERIAL PRIMARY KEY)") == \
+        "CREATE TEMPORARY TABLE _tmp_ids_? (_tmp_ids_? SERIAL PRIMARY KEY)"
+    assert normalize_statement("SELECT * FROM stories JOIN _tmp_ids_xYz123 AS ids ON stories_id = ids.id") == \
+        "SELECT * FROM stories JOIN _tmp_ids_? AS ids ON stories_id = ids.id"
+
+    # Long queries get normalized too (without being cached)
+    long_query = "SELECT * FROM stories WHERE stories_id IN (%s)" % ', '.join(str(x) for x in range(10000))
+    assert normalize_statement(long_query) == "SELECT * FROM stories WHERE stories_id IN (?, ...)"
+
+
+def test_query_statistics():
+    statistics = QueryStatistics()
+
+    for stories_id in range(1, 101):
+        statistics("SELECT * FROM stories WHERE stories_id = %d" % stories_id, stories_id / 1000, 1)
+    statistics("UPDATE stories SET title = 'foo'", 10.0, 5)
+    statistics("SELECT 1", 0.001, -1)
+
+    stats = statistics.statistics()
+    assert [x['statement'] for x in stats] == [
+        "UPDATE stories SET title = ?",
+        "SELECT * FROM stories WHERE stories_id = ?",
+        "SELECT ?",
+    ]
+
+    select_stats = stats[1]
+    assert select_stats['calls'] == 100
+    assert select_stats['rows'] == 100
+    assert abs(select_stats['total_time'] - 5.05) < 0.0001
+    assert abs(select_stats['mean_time'] - 0.0505) < 0.0001
+    assert select_stats['p50_time'] == 0.05
+    assert select_stats['p95_time'] == 0.095
+    assert select_stats['p99_time'] == 0.099
+
+    # Unknown row count doesn't get added up
+    assert stats[2]['rows'] == 0
+
+    assert len(statistics.statistics(top_n=1)) == 1
+
+    report = statistics.report(top_n=2)
+    assert 'UPDATE stories SET title = ?' in report
+    assert 'SELECT ?' not in report
+
+    statistics.reset()
+    assert statistics.statistics() == []
+
+
+def test_query_statistics_max_statements():
+    with pytest.raises(McQueryStatisticsException):
+        QueryStatistics(max_statements=0)
+
+    statistics = QueryStatistics(max_statements=10)
+
+    # Distinct statements beyond the limit don't get tracked
+    for table_number in range(100):
+        statistics("SELECT * FROM table_%d" % table_number, 0.001, 1)
+    assert len(statistics.statistics()) == 10
+    assert statistics.untracked_calls() == 90
+    assert '90 runs of statements' in statistics.report()
+
+    # Statements that are tracked already still get recorded
+    statistics("SELECT * FROM table_0", 0.001, 1)
+    assert {x['statement']: x for x in statistics.statistics()}['SELECT * FROM table_0']['calls'] == 2
+    assert statistics.untracked_calls() == 90
+
+    statistics.reset()
+    assert statistics.untracked_calls() == 0
+
+
+class TestQueryHook(TestDatabaseTestCase):
+
+    def test_query_hook(self):
+        statistics = QueryStatistics()
+
+        DatabaseHandler.add_query_hook(statistics)
+        try:
+            self.db().query("SELECT * FROM generate_series(1, 3)").hashes()
+            self.db().query("SELECT * FROM generate_series(1, 5)").hashes()
+            self.db().query_native("SELECT %(a)s::int AS a", {'a': 1}).hashes()
+        finally:
+            DatabaseHandler.remove_query_hook(statistics)
+
+        # Not recorded anymore
+        self.db().query("SELECT 1")
+
+        stats = {x['statement']: x for x in statistics.statistics()}
+        assert len(stats) == 2
+        assert stats['SELECT * FROM generate_series(?, ...)']['calls'] == 2
+        assert stats['SELECT * FROM generate_series(?, ...)']['rows'] == 8
+        assert stats['SELECT ?::int AS a']['calls'] == 1
+
+    def test_temporary_table_queries(self):
+        statistics = QueryStatistics()
+
+        DatabaseHandler.add_query_hook(statistics)
+        try:
+            self.db().begin()
+            for _ in range(100):
+                table_name = self.db().get_temporary_ids_table([1, 2, 3], ordered=True)
+                self.db().query("SELECT COUNT(*) FROM %s" % table_name).flat()
+            self.db().rollback()
+        finally:
+            DatabaseHandler.remove_query_hook(statistics)
+
+        # Every randomly named temporary table doesn't become a statement of its own
+        statements = [x['statement'] for x in statistics.statistics()]
+        assert len(statements) <= 10
+        assert 'SELECT COUNT(*) FROM _tmp_ids_?' in statements
+        assert statistics.untracked_calls() == 0
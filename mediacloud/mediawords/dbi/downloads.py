@@ -23,7 +23,7 @@ This module also includes extract and related functions to handle download
 extraction.
 """
 import re
-from typing import Optional
+from typing import Dict, List, Optional
 
 from mediawords.db import DatabaseHandler
 from mediawords.dbi.download_texts import create
@@ -33,6 +33,7 @@ from mediawords.key_value_store import KeyValueStore
 from mediawords.key_value_store.amazon_s3 import AmazonS3Store
 from mediawords.key_value_store.cached_amazon_s3 import CachedAmazonS3Store
 from mediawords.key_value_store.database_inline import DatabaseInlineStore
+from mediawords.key_value_store.lru_cached import LRUCachedStore, LRUObjectCache
 from mediawords.key_value_store.multiple_stores import MultipleStoresStore
 from mediawords.key_value_store.postgresql import PostgreSQLStore
 from mediawords.util.config import get_config
@@ -61,6 +62,17 @@ _amazon_s3_store = None
 _postgresql_store = None
 _store_for_writing = None
 
+# For how long (in seconds) to keep download contents in the in-memory cache if "download_memory_cache_ttl" is unset;
+# contents might get overwritten by other processes, so they shouldn't be kept forever
+DEFAULT_DOWNLOAD_MEMORY_CACHE_TTL = 600
+
+# In-memory cache of download contents shared by all the stores for reading (so that they stay within a single
+# "download_memory_cache_size" limit together), if enabled in configuration
+_memory_cache = None
+
+# Stores for reading wrapped into the in-memory cache (id of the cached store -> LRUCachedStore)
+_memory_cached_stores = dict()
+
 
 class McDBIDownloadsException(Exception):
     """Default exceptions for this package."""
@@ -77,11 +89,15 @@ def reset_store_singletons() -> None:
     global _amazon_s3_store
     global _postgresql_store
     global _store_for_writing
+    global _memory_cache
+    global _memory_cached_stores
 
     _inline_store = None
     _amazon_s3_store = None
     _postgresql_store = None
     _store_for_writing = None
+    _memory_cache = None
+    _memory_cached_stores = dict()
 
 
 def _get_inline_store() -> KeyValueStore:
@@ -180,6 +196,38 @@ def _get_store_for_writing() -> KeyValueStore:
     return _store_for_writing
 
 
+def _get_memory_cached_store(store: KeyValueStore) -> KeyValueStore:
+    """Return store wrapped into the process-wide in-memory cache if "download_memory_cache_size" is set in
+    mediawords.yml; return the store itself otherwise.
+
+    All the stores for reading share a single cache, so even if one of them reads from another one (e.g. the PostgreSQL
+    store falls back to Amazon S3), the process keeps at most "download_memory_cache_size" bytes of contents."""
+    global _memory_cache
+
+    config = get_config()
+
+    max_size = int(config['mediawords'].get('download_memory_cache_size', 0) or 0)
+    if max_size <= 0:
+        return store
+
+    # Inline content is read from the download itself
+    if isinstance(store, DatabaseInlineStore):
+        return store
+
+    if _memory_cache is None:
+        ttl = float(config['mediawords'].get('download_memory_cache_ttl', 0) or 0)
+        if ttl <= 0:
+            ttl = DEFAULT_DOWNLOAD_MEMORY_CACHE_TTL
+        _memory_cache = LRUObjectCache(max_size=max_size, ttl=ttl)
+
+    cached_store = _memory_cached_stores.get(id(store), None)
+    if cached_store is None:
+        cached_store = LRUCachedStore(store=store, cache=_memory_cache)
+        _memory_cached_stores[id(store)] = cached_store
+
+    return cached_store
+
+
 def _get_store_for_reading(download: dict) -> KeyValueStore:
     """Return the store from which to read the content for the given download."""
     download = decode_object_from_bytes_if_needed(download)
@@ -187,7 +235,7 @@ def _get_store_for_reading(download: dict) -> KeyValueStore:
     config = get_config()
 
     if config['mediawords'].get('read_all_downloads_from_s3', False):
-        return _get_amazon_s3_store()
+        return _get_memory_cached_store(_get_amazon_s3_store())
 
     path = download.get('path', 's3:')
 
@@ -210,7 +258,23 @@ def _get_store_for_reading(download: dict) -> KeyValueStore:
 
     assert download_store is not None
 
-    return download_store
+    return _get_memory_cached_store(download_store)
+
+
+def _decode_content(download: dict, content_bytes: bytes) -> str:
+    """Decode content of the download fetched from the content store."""
+
+    content = content_bytes.decode()
+
+    # horrible hack to fix old content that is not stored in unicode
+    config = get_config()
+    ascii_hack_downloads_id = config['mediawords'].get('ascii_hack_downloads_id', 0)
+    if download['downloads_id'] < ascii_hack_downloads_id:
+        # this matches all non-printable-ascii characters.  python re does not support POSIX character
+        # classes like [[:ascii:]]
+        content = re.sub(r'[^ -~]', ' ', content)
+
+    return content
 
 
 def fetch_content(db: DatabaseHandler, download: dict) -> str:
@@ -229,17 +293,54 @@ def fetch_content(db: DatabaseHandler, download: dict) -> str:
 
     content_bytes = store.fetch_content(db, download['downloads_id'], download['path'])
 
-    content = content_bytes.decode()
+    return _decode_content(download=download, content_bytes=content_bytes)
 
-    # horrible hack to fix old content that is not stored in unicode
-    config = get_config()
-    ascii_hack_downloads_id = config['mediawords'].get('ascii_hack_downloads_id', 0)
-    if download['downloads_id'] < ascii_hack_downloads_id:
-        # this matches all non-printable-ascii characters.  python re does not support POSIX character
-        # classes like [[:ascii:]]
-        content = re.sub(r'[^ -~]', ' ', content)
 
-    return content
+def fetch_contents(db: DatabaseHandler, downloads: List[dict]) -> Dict[int, str]:
+    """Fetch the content for many downloads at once, fetching from every content store in a single batch.
+
+    Return a dict of download IDs and their contents; downloads which content couldn't be fetched are left out."""
+
+    downloads = decode_object_from_bytes_if_needed(downloads)
+
+    # (store, downloads to fetch from it) in the order in which the stores were first seen
+    store_downloads = []
+
+    for download in downloads:
+
+        if 'downloads_id' not in download:
+            raise McDBIDownloadsException("downloads_id not in download")
+
+        if not download_successful(download):
+            raise McDBIDownloadsException(
+                "attempt to fetch content for unsuccessful download: %d" % (download['downloads_id']))
+
+        store = _get_store_for_reading(download)
+
+        for store_and_downloads in store_downloads:
+            if store_and_downloads[0] is store:
+                store_and_downloads[1].append(download)
+                break
+        else:
+            store_downloads.append((store, [download],))
+
+    contents = dict()
+
+    for store, downloads_to_fetch in store_downloads:
+
+        downloads_ids = [download['downloads_id'] for download in downloads_to_fetch]
+        paths = {download['downloads_id']: download.get('path', None) for download in downloads_to_fetch}
+
+        contents_bytes = store.fetch_contents(db, downloads_ids, paths)
+
+        for download in downloads_to_fetch:
+            downloads_id = download['downloads_id']
+            if downloads_id in contents_bytes:
+                contents[downloads_id] = _decode_content(download=download, content_bytes=contents_bytes[downloads_id])
+            else:
+                log.warning("Unable to fetch content for download %d" % downloads_id)
+
+    return contents
 
 
 def store_content(db: DatabaseHandler, download: dict, content: str) -> dict:
@@ -258,6 +359,10 @@ def store_content(db: DatabaseHandler, download: dict, content: str) -> dict:
     except Exception as ex:
         raise McDBIDownloadsException("error while trying to store download %d: %s" % (download['downloads_id'], ex))
 
+    # Don't serve the previous content of a redownloaded download from the in-memory cache
+    if _memory_cache is not None:
+        _memory_cache.forget(download['downloads_id'])
+
     if new_state == 'success':
         download['error_message'] = ''
 
@@ -439,6 +544,24 @@ def extract_and_create_download_text(db: DatabaseHandler, download: dict, extrac
     extraction_result = extract(db=db, download=download, extractor_args=extractor_args)
     log.debug("Done extracting download {}.".format(downloads_id))
 
+    return _create_download_text(
+        db=db,
+        download=download,
+        extraction_result=extraction_result,
+        extractor_args=extractor_args,
+    )
+
+
+def _create_download_text(db: DatabaseHandler,
+                          download: dict,
+                          extraction_result: dict,
+                          extractor_args: PyExtractorArguments) -> dict:
+    """Create a download_text from the extraction result (or fetch the existing one if "use_existing" is set)."""
+    download = decode_object_from_bytes_if_needed(download)
+    extraction_result = decode_object_from_bytes_if_needed(extraction_result)
+
+    downloads_id = download['downloads_id']
+
     download_text = None
     if extractor_args.use_existing():
         log.debug("Fetching download text for download {}...".format(downloads_id))
@@ -0,0 +1,475 @@
+"""
+Pipelined story extraction.
+
+extract_and_process_story() fetches the content of every download, extracts it and writes the results to the database
+one step after another, so the process sits idle while waiting for the content store (e.g. S3) and keeps only a single
+CPU core busy. PipelinedExtractor runs those steps as separate, overlapping stages:
+
+* a pool of threads fetches download contents (or cached extractor results) in chunks of a few downloads, so that
+  every chunk's contents get fetched from a content store in a single batch (see fetch_contents());
+* a pool of processes extracts the fetched contents (or, if the extractor processes can't be started, e.g. because
+  the current process is a daemon, the calling thread extracts them itself);
+* the calling thread writes the extraction results (download texts, story sentences, etc.) to the database, story by
+  story, in the order in which the stories were passed.
+
+At most "max_pending_downloads" downloads are in flight between the stages at any time, so a batch of any size uses a
+bounded amount of memory.
+
+Usage:
+
+    with PipelinedExtractor() as extractor:
+        failed_stories = extractor.extract_and_process_stories(db=db, stories=stories)
+
+"""
+
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple, Union
+
+from mediawords.db import DatabaseHandler, pooled_db
+# noinspection PyProtectedMember
+from mediawords.dbi.downloads import (
+    extract_content,
+    fetch_contents,
+    _create_download_text,
+    _get_extractor_results_cache,
+    _set_extractor_results_cache,
+)
+from mediawords.dbi.stories.extractor_arguments import PyExtractorArguments
+from mediawords.dbi.stories.process import process_extracted_story
+from mediawords.util.log import create_logger
+from mediawords.util.perl import decode_object_from_bytes_if_needed
+
+log = create_logger(__name__)
+
+# Fetch stage's results: download's content, future of the extraction results (None if the content is yet to be
+# extracted) and whether the results came from the extractor results cache
+_FetchedDownload = Tuple[Optional[str], Optional[concurrent.futures.Future], bool]
+
+# Fetch stage's results of a chunk: download ID -> fetched download, or exception if it couldn't be fetched
+_FetchedChunk = Dict[int, Union[_FetchedDownload, Exception]]
+
+
+class McPipelinedExtractorException(Exception):
+    """PipelinedExtractor exception."""
+    pass
+
+
+class PipelinedExtractor(object):
+    """Story extractor that overlaps fetching, extraction and database writes of downloads."""
+
+    # Default number of threads fetching download contents
+    DEFAULT_FETCH_THREADS = 8
+
+    # Default max. number of downloads that a fetch thread fetches at once
+    DEFAULT_FETCH_CHUNK_SIZE = 4
+
+    # Savepoint to roll back to if writing a story fails within the caller's transaction
+    __STORY_SAVEPOINT = 'pipelined_extract_story'
+
+    # Start method of extractor processes; forking a process which runs fetch threads might copy locks (logging, Boto3,
+    # psycopg2) held by those threads at the time into the child, so start fresh interpreters instead
+    __EXTRACT_PROCESS_START_METHOD = 'spawn'
+
+    # Max. time (in seconds) to wait for a newly started extractor process to respond
+    __EXTRACT_PROCESS_STARTUP_TIMEOUT = 60
+
+    # How many times to try extracting a download if extractor processes die while extracting it (e.g. because some
+    # other download crashed the extractor)
+    __EXTRACT_ATTEMPTS = 2
+
+    __slots__ = [
+        '__fetch_threads',
+        '__fetch_chunk_size',
+        '__extract_processes',
+        '__max_pending_downloads',
+
+        # Executors of the fetch and extraction stages, created on first use
+        '__fetch_executor',
+        '__extract_executor',
+        '__executors_lock',
+
+        # True if extractor processes couldn't be started so the calling thread extracts downloads itself
+        '__extract_in_process',
+
+        # PID of the process that created the executors
+        '__pid',
+    ]
+
+    def __init__(self,
+                 fetch_threads: int = DEFAULT_FETCH_THREADS,
+                 extract_processes: Union[int, None] = None,
+                 max_pending_downloads: Union[int, None] = None,
+                 fetch_chunk_size: int = DEFAULT_FETCH_CHUNK_SIZE):
+        """Constructor.
+
+        Arguments:
+        fetch_threads - number of threads fetching download contents
+        extract_processes - number of extractor processes (default is the number of CPUs); 0 to extract downloads in
+                            the calling thread
+        max_pending_downloads - max. number of downloads fetched or extracted but not yet written (default is twice the
+                                number of downloads that the fetch threads and extractor processes can work on at once)
+        fetch_chunk_size - max. number of downloads that a fetch thread fetches at once
+        """
+
+        if extract_processes is None:
+            extract_processes = os.cpu_count() or 1
+
+        if max_pending_downloads is None:
+            max_pending_downloads = 2 * (fetch_threads * fetch_chunk_size + extract_processes)
+
+        if fetch_threads < 1:
+            raise McPipelinedExtractorException("Fetch thread count must be positive.")
+        if fetch_chunk_size < 1:
+            raise McPipelinedExtractorException("Fetch chunk size must be positive.")
+        if extract_processes < 0:
+            raise McPipelinedExtractorException("Extractor process count must not be negative.")
+        if max_pending_downloads < 1:
+            raise McPipelinedExtractorException("Max. pending download count must be positive.")
+
+        self.__fetch_threads = fetch_threads
+        self.__fetch_chunk_size = fetch_chunk_size
+        self.__extract_processes = extract_processes
+        self.__max_pending_downloads = max_pending_downloads
+
+        self.__fetch_executor = None
+        self.__extract_executor = None
+        self.__executors_lock = threading.Lock()
+
+        self.__extract_in_process = extract_processes == 0
+
+        self.__pid = os.getpid()
+
+    def __enter__(self) -> 'PipelinedExtractor':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __check_pid(self) -> None:
+        """Forget executors inherited from a parent process (they're of no use after a fork)."""
+        if os.getpid() != self.__pid:
+            self.__fetch_executor = None
+            self.__extract_executor = None
+            self.__executors_lock = threading.Lock()
+            self.__pid = os.getpid()
+
+    def __get_fetch_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Return fetch stage's executor, create one if needed."""
+        with self.__executors_lock:
+            if self.__fetch_executor is None:
+                self.__fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.__fetch_threads)
+            return self.__fetch_executor
+
+    def __get_extract_executor(self) -> Optional[concurrent.futures.ProcessPoolExecutor]:
+        """Return extraction stage's executor, start one if needed; return None if downloads are to be extracted
+        in-process.
+
+        Should be called from the calling thread only; fetch threads get the executor passed to them."""
+        with self.__executors_lock:
+            if self.__extract_in_process:
+                return None
+            if self.__extract_executor is not None:
+                return self.__extract_executor
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.__extract_processes,
+            mp_context=multiprocessing.get_context(self.__EXTRACT_PROCESS_START_METHOD),
+        )
+
+        # Processes get started on first submit, so make sure that they can be started at all and actually run
+        try:
+            executor.submit(os.getpid).result(timeout=self.__EXTRACT_PROCESS_STARTUP_TIMEOUT)
+        except Exception as ex:
+            log.warning("Unable to start extractor processes, will extract in-process: {}".format(ex))
+            executor.shutdown(wait=False)
+            with self.__executors_lock:
+                self.__extract_in_process = True
+            return None
+
+        with self.__executors_lock:
+            self.__extract_executor = executor
+
+        return executor
+
+    def __reset_extract_executor(self, broken_executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """Forget broken extraction stage's executor (e.g. after an extractor process got killed).
+
+        Futures of all the downloads queued on a broken executor fail, so do nothing if the broken executor has been
+        replaced already."""
+        with self.__executors_lock:
+            if self.__extract_executor is not broken_executor:
+                return
+            self.__extract_executor = None
+
+        broken_executor.shutdown(wait=False)
+
+    def __fetch_chunk(self,
+                      downloads: List[dict],
+                      use_cache: bool,
+                      extract_executor: Optional[concurrent.futures.ProcessPoolExecutor]) -> _FetchedChunk:
+        """Fetch contents of a chunk of downloads and submit them for extraction (runs in a fetch thread)."""
+
+        fetched_chunk = dict()
+
+        # Handler is held only while fetching so that idle fetch threads don't keep connections out of the pool
+        with pooled_db() as db:
+            downloads_to_fetch = []
+            for download in downloads:
+                if use_cache:
+                    results = _get_extractor_results_cache(db, download)
+                    if results is not None:
+                        cached_future = concurrent.futures.Future()
+                        cached_future.set_result(results)
+                        fetched_chunk[download['downloads_id']] = (None, cached_future, True,)
+                        continue
+
+                downloads_to_fetch.append(download)
+
+            contents = fetch_contents(db, downloads_to_fetch) if downloads_to_fetch else dict()
+
+        for download in downloads_to_fetch:
+            downloads_id = download['downloads_id']
+
+            if downloads_id not in contents:
+                fetched_chunk[downloads_id] = McPipelinedExtractorException(
+                    "Unable to fetch content of download {}.".format(downloads_id)
+                )
+                continue
+
+            content = contents[downloads_id]
+
+            extract_future = None
+            if extract_executor is not None:
+                try:
+                    extract_future = extract_executor.submit(extract_content, content)
+                except (BrokenProcessPool, RuntimeError):
+                    # Executor is broken (or has been shut down because of that), so the calling thread will resubmit
+                    # the content
+                    extract_future = None
+
+            fetched_chunk[downloads_id] = (content, extract_future, False,)
+
+        return fetched_chunk
+
+    def __extraction_results(self,
+                             download: dict,
+                             content: Optional[str],
+                             extract_future: Optional[concurrent.futures.Future],
+                             extract_executor: Optional[concurrent.futures.ProcessPoolExecutor]) -> dict:
+        """Wait for download's extraction results, (re)submit the content to the current extraction stage's executor
+        (or extract it in-process) if needed."""
+
+        attempt = 0
+        while True:
+            try:
+                if extract_future is None:
+                    extract_executor = self.__get_extract_executor()
+                    if extract_executor is None:
+                        return extract_content(content)
+                    extract_future = extract_executor.submit(extract_content, content)
+
+                return extract_future.result()
+
+            except BrokenProcessPool as ex:
+                self.__reset_extract_executor(broken_executor=extract_executor)
+
+                attempt += 1
+                if attempt >= self.__EXTRACT_ATTEMPTS:
+                    raise McPipelinedExtractorException(
+                        "Extractor processes died {} times while extracting download {}: {}".format(
+                            attempt, download['downloads_id'], ex,
+                        )
+                    )
+
+                log.warning("Extractor processes died while extracting download {}, retrying...".format(
+                    download['downloads_id'],
+                ))
+                extract_future = None
+
+    def __write_story(self,
+                      db: DatabaseHandler,
+                      story: dict,
+                      extracted_downloads: List[Tuple[dict, dict, bool]],
+                      extractor_args: PyExtractorArguments) -> None:
+        """Write extraction results of story's downloads and process the extracted story in a transaction of its own
+        (or under a savepoint if the handler is in a transaction already)."""
+
+        in_transaction = db.in_transaction()
+        if in_transaction:
+            db.query("SAVEPOINT {}".format(self.__STORY_SAVEPOINT))
+        else:
+            db.begin()
+
+        try:
+            for download, results, results_are_cached in extracted_downloads:
+                if extractor_args.use_cache() and not results_are_cached:
+                    log.debug("Caching extractor results for download {}...".format(download['downloads_id']))
+                    _set_extractor_results_cache(db, download, results)
+
+                _create_download_text(
+                    db=db,
+                    download=download,
+                    extraction_result=results,
+                    extractor_args=extractor_args,
+                )
+
+            log.debug("Processing extracted story {}...".format(story['stories_id']))
+            process_extracted_story(db=db, story=story, extractor_args=extractor_args)
+
+        except Exception:
+            if in_transaction:
+                db.query("ROLLBACK TO SAVEPOINT {}".format(self.__STORY_SAVEPOINT))
+            else:
+                db.rollback()
+            raise
+
+        if in_transaction:
+            db.query("RELEASE SAVEPOINT {}".format(self.__STORY_SAVEPOINT))
+        else:
+            db.commit()
+
+    def extract_and_process_stories(
+            self,
+            db: DatabaseHandler,
+            stories: List[dict],
+            extractor_args: PyExtractorArguments = PyExtractorArguments(),
+    ) -> Dict[int, Exception]:
+        """Extract all the downloads of every story and call process_extracted_story() on it, like
+        extract_and_process_story() does for a single story.
+
+        Every story gets written separately so that a failure affects only that story. Return a dict of story IDs that
+        failed to extract and exceptions that they failed with."""
+
+        stories = decode_object_from_bytes_if_needed(stories)
+
+        self.__check_pid()
+
+        if not stories:
+            return {}
+
+        downloads = db.query("""
+            SELECT *
+            FROM downloads
+            WHERE stories_id = ANY(%(stories_ids)s)
+              AND type = 'content'
+              AND state = 'success'
+            ORDER BY stories_id, downloads_id
+        """, {'stories_ids': [int(story['stories_id']) for story in stories]}).hashes()
+
+        # Story ID -> downloads
+        story_downloads = dict()
+        for download in downloads:
+            story_downloads.setdefault(download['stories_id'], []).append(download)
+
+        use_cache = extractor_args.use_cache()
+
+        # Start extractor processes (if any) before fetch threads
+        extract_executor = self.__get_extract_executor()
+        fetch_executor = self.__get_fetch_executor()
+
+        # Downloads in the order in which their results get written
+        unsubmitted_downloads = iter([
+            download for story in stories for download in story_downloads.get(story['stories_id'], [])
+        ])
+
+        # (download, future of fetch stage's results of download's chunk, extraction stage's executor the download was
+        # submitted to) in the order in which they were submitted
+        pending_downloads = collections.deque()
+
+        def submit_downloads() -> None:
+            """Top up the pipeline with chunks of downloads to fetch and extract."""
+
+            # Wait for a whole chunk to fit so that the pipeline doesn't get topped up one download at a time
+            chunk_size = min(self.__fetch_chunk_size, self.__max_pending_downloads)
+            while len(pending_downloads) + chunk_size <= self.__max_pending_downloads:
+                chunk = list(itertools.islice(unsubmitted_downloads, chunk_size))
+                if not chunk:
+                    break
+
+                chunk_future = fetch_executor.submit(self.__fetch_chunk, chunk, use_cache, extract_executor)
+                for chunk_download in chunk:
+                    pending_downloads.append((chunk_download, chunk_future, extract_executor,))
+
+        # Story ID -> exception
+        failed_stories = dict()
+
+        for story in stories:
+            stories_id = story['stories_id']
+
+            submit_downloads()
+
+            extracted_downloads = []
+            error = None
+
+            for _ in story_downloads.get(stories_id, []):
+                download, fetch_future, download_extract_executor = pending_downloads.popleft()
+
+                # Keep the fetch and extraction stages busy while waiting for this download
+                submit_downloads()
+
+                if error is not None:
+                    # Some other download of the same story has failed already
+                    continue
+
+                try:
+                    fetched_download = fetch_future.result()[download['downloads_id']]
+                    if isinstance(fetched_download, Exception):
+                        raise fetched_download
+
+                    content, extract_future, results_are_cached = fetched_download
+                    results = self.__extraction_results(
+                        download=download,
+                        content=content,
+                        extract_future=extract_future,
+                        extract_executor=download_extract_executor,
+                    )
+                    extracted_downloads.append((download, results, results_are_cached,))
+
+                    # Replace the broken executor for downloads that are yet to be submitted
+                    extract_executor = self.__get_extract_executor()
+
+                except Exception as ex:
+                    error = McPipelinedExtractorException(
+                        "Unable to extract download {}: {}".format(download['downloads_id'], ex)
+                    )
+
+            if error is None:
+                try:
+                    self.__write_story(
+                        db=db,
+                        story=story,
+                        extracted_downloads=extracted_downloads,
+                        extractor_args=extractor_args,
+                    )
+                except Exception as ex:
+                    # Passed as is so that the caller could tell what went wrong (e.g. whether to retry later)
+                    error = ex
+
+            if error is not None:
+                log.warning("Extracting story {} failed: {}".format(stories_id, error))
+                failed_stories[stories_id] = error
+            else:
+                log.info("Done extracting story {}.".format(stories_id))
+
+        return failed_stories
+
+    def close(self) -> None:
+        """Stop the fetch threads and extractor processes."""
+        self.__check_pid()
+
+        with self.__executors_lock:
+            fetch_executor = self.__fetch_executor
+            extract_executor = self.__extract_executor
+            self.__fetch_executor = None
+            self.__extract_executor = None
+
+        if fetch_executor is not None:
+            fetch_executor.shutdown(wait=True)
+        if extract_executor is not None:
+            extract_executor.shutdown(wait=True)
@@ -0,0 +1,68 @@
+from mediawords.dbi.downloads import RAW_DOWNLOADS_POSTGRESQL_KVS_TABLE_NAME
+from mediawords.dbi.stories.extractor_arguments import PyExtractorArguments
+from mediawords.dbi.stories.pipelined_extract import PipelinedExtractor
+from mediawords.test.db.create import create_test_story_stack, add_content_to_test_story_stack
+from mediawords.test.test_database import TestDatabaseWithSchemaTestCase
+
+
+class TestPipelinedExtract(TestDatabaseWithSchemaTestCase):
+
+    def _test_extract_and_process_stories(self, extract_processes: int):
+        db = self.db()
+
+        story_stack = create_test_story_stack(db=db, data={
+            'A': {'B': [1, 2, 3]},
+            'C': {'D': [4, 5]},
+        })
+        story_stack = add_content_to_test_story_stack(db=db, story_stack=story_stack)
+
+        stories = [story_stack[str(story_number)] for story_number in range(1, 6)]
+        stories_ids = [story['stories_id'] for story in stories]
+
+        db.query("DELETE FROM story_sentences")
+        db.query("DELETE FROM download_texts")
+
+        # Content of one of the downloads is missing from the store
+        broken_story = stories[1]
+        db.query("""
+            DELETE FROM {table}
+            WHERE object_id = %(downloads_id)s
+        """.format(table=RAW_DOWNLOADS_POSTGRESQL_KVS_TABLE_NAME), {
+            'downloads_id': broken_story['download']['downloads_id'],
+        })
+
+        with PipelinedExtractor(
+            fetch_threads=2,
+            extract_processes=extract_processes,
+            max_pending_downloads=3,
+            fetch_chunk_size=2,
+        ) as extractor:
+            failed_stories = extractor.extract_and_process_stories(
+                db=db,
+                stories=stories,
+                extractor_args=PyExtractorArguments(use_cache=True),
+            )
+
+        # Failure of one story doesn't prevent the rest of them from being extracted
+        assert list(failed_stories.keys()) == [broken_story['stories_id']]
+
+        extracted_stories_ids = db.query("""
+            SELECT DISTINCT stories_id
+            FROM story_sentences
+            ORDER BY stories_id
+        """).flat()
+        assert extracted_stories_ids == sorted(set(stories_ids) - {broken_story['stories_id']})
+
+        download_text_count = db.query("SELECT COUNT(*) FROM download_texts").flat()[0]
+        assert download_text_count == len(stories) - 1
+
+        cached_result_count = db.query("SELECT COUNT(*) FROM cache.extractor_results_cache").flat()[0]
+        assert cached_result_count == len(stories) - 1
+
+        assert db.in_transaction() is False
+
+    def test_extract_and_process_stories(self):
+        self._test_extract_and_process_stories(extract_processes=2)
+
+    def test_extract_and_process_stories_in_process(self):
+        self._test_extract_and_process_stories(extract_processes=0)
@@ -17,6 +17,7 @@ from mediawords.test.test_database import TestDatabaseWithSchemaTestCase
 from mediawords.key_value_store.amazon_s3 import AmazonS3Store
 from mediawords.key_value_store.cached_amazon_s3 import CachedAmazonS3Store
 from mediawords.key_value_store.database_inline import DatabaseInlineStore
+from mediawords.key_value_store.lru_cached import LRUCachedStore
 from mediawords.key_value_store.postgresql import PostgreSQLStore
 from mediawords.key_value_store.multiple_stores import MultipleStoresStore
 from mediawords.test.text import TestCaseTextUtilities
@@ -157,6 +158,36 @@ class TestDownloads(TestCase, TestCaseTextUtilities):
         with self.assertRaises(mediawords.dbi.downloads.McDBIDownloadsException):
             mediawords.dbi.downloads._get_store_for_reading({'path': 'invalidpath:'})
 
+    def test_get_memory_cached_store_for_reading(self) -> None:
+        """Test _get_store_for_reading with the in-memory cache enabled."""
+        self.config['mediawords']['read_all_downloads_from_s3'] = False
+        self.config['mediawords']['fallback_postgresql_downloads_to_s3'] = False
+        self.config['mediawords']['download_memory_cache_size'] = 1024 * 1024
+
+        store = mediawords.dbi.downloads._get_store_for_reading({'path': 'postgresql:'})
+        assert isinstance(store, LRUCachedStore)
+        assert type(store.store()) == PostgreSQLStore
+
+        # Contents don't get kept forever if TTL is unset
+        assert store.ttl() == mediawords.dbi.downloads.DEFAULT_DOWNLOAD_MEMORY_CACHE_TTL
+
+        # Every cached store has a single cache
+        assert store is mediawords.dbi.downloads._get_store_for_reading({'path': 'gridfs:'})
+
+        postgresql_store = store
+
+        store = mediawords.dbi.downloads._get_store_for_reading({'path': 's3:'})
+        assert isinstance(store, LRUCachedStore)
+        assert type(store.store()) == AmazonS3Store
+
+        # All cached stores share a single size limit
+        assert store.cache() is postgresql_store.cache()
+        assert store.cache().max_size() == 1024 * 1024
+
+        # Inline content doesn't get cached
+        store = mediawords.dbi.downloads._get_store_for_reading({'path': 'content:'})
+        assert type(store) == DatabaseInlineStore
+
     def test_extract_content_basic(self) -> None:
         """Test extract_content()."""
         results = mediawords.dbi.downloads.extract_content("<script>foo<</script><p>bar</p>")
@@ -256,6 +287,34 @@ class TestDownloadsDB(TestDatabaseWithSchemaTestCase):
         got_content = mediawords.dbi.downloads.fetch_content(db, self.test_download)
         assert got_content == 'foo   bar'
 
+    def test_fetch_contents(self) -> None:
+        """Test fetch_contents() with an inline download, a stored download and a download without content."""
+        db = self.db()
+
+        with self.assertRaises(mediawords.dbi.downloads.McDBIDownloadsException):
+            mediawords.dbi.downloads.fetch_contents(db, [{'downloads_id': 1, 'state': 'error'}])
+
+        self.config['mediawords']['read_all_downloads_from_s3'] = False
+        self.config['mediawords']['fallback_postgresql_downloads_to_s3'] = False
+
+        assert mediawords.dbi.downloads.fetch_contents(db, []) == {}
+
+        inline_download = create_download_for_story(db, feed=self.test_feed, story=self.test_story)
+        inline_download['path'] = 'content:inline content'
+        inline_download['state'] = 'success'
+
+        missing_download = create_download_for_story(db, feed=self.test_feed, story=self.test_story)
+        missing_download['path'] = 'postgresql:foo'
+        missing_download['state'] = 'success'
+
+        got_contents = mediawords.dbi.downloads.fetch_contents(
+            db, [self.test_download, inline_download, missing_download]
+        )
+        assert got_contents == {
+            self.test_download['downloads_id']: self.__TEST_CONTENT,
+            inline_download['downloads_id']: 'inline content',
+        }
+
     def test_store_content(self) -> None:
         """Test store_content by calling store_content and then calling fetch_content() on the postgresql store."""
         db = self.db()
@@ -4,8 +4,10 @@ import uuid
 from typing import Type, Any
 
 import celery
+from celery.signals import worker_process_shutdown
 from kombu import Exchange, Queue
 
+from mediawords.db.instrumentation import enable_query_statistics, log_query_statistics_report
 from mediawords.util.config import get_config as py_get_config
 from mediawords.util.log import create_logger
 
@@ -195,6 +197,18 @@ class JobBrokerApp(celery.Celery):
         """Start worker for the job."""
         node_name = '%s-%s@%s' % (self.__job_class.__name__, uuid.uuid4(), socket.gethostname(),)
         log.info("Starting worker %s..." % node_name)
+
+        config = py_get_config()
+        if config.get('mediawords', {}).get('db_query_statistics', False):
+            log.info("Collecting database query statistics, will report them on worker process exit.")
+            enable_query_statistics()
+
+            # Jobs get run in pool processes which don't necessarily get to run "atexit" handlers
+            # noinspection PyUnusedLocal
+            def __report_query_statistics(*args_, **kwargs_):
+                log_query_statistics_report()
+
+            worker_process_shutdown.connect(__report_query_statistics, weak=False)
         self.worker_main(argv=[
             'worker',
             '--loglevel', 'info',
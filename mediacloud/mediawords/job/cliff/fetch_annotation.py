@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 from mediawords.annotator.cliff import CLIFFAnnotator
-from mediawords.db import connect_to_db
+from mediawords.db import pooled_db
 from mediawords.job import AbstractJob, McAbstractJobException, JobBrokerApp
 from mediawords.job.cliff.update_story_tags import CLIFFUpdateStoryTagsJob
 from mediawords.util.log import create_logger
@@ -36,24 +36,23 @@ class CLIFFFetchAnnotationJob(AbstractJob):
 
         stories_id = int(stories_id)
 
-        db = connect_to_db()
+        with pooled_db() as db:
+            log.info("Fetching annotation for story ID %d..." % stories_id)
 
-        log.info("Fetching annotation for story ID %d..." % stories_id)
+            story = db.find_by_id(table='stories', object_id=stories_id)
+            if story is None:
+                raise McCLIFFFetchAnnotationJobException("Story with ID %d was not found." % stories_id)
 
-        story = db.find_by_id(table='stories', object_id=stories_id)
-        if story is None:
-            raise McCLIFFFetchAnnotationJobException("Story with ID %d was not found." % stories_id)
+            cliff = CLIFFAnnotator()
+            try:
+                cliff.annotate_and_store_for_story(db=db, stories_id=stories_id)
+            except Exception as ex:
+                raise McCLIFFFetchAnnotationJobException("Unable to process story $stories_id with CLIFF: %s" % str(ex))
 
-        cliff = CLIFFAnnotator()
-        try:
-            cliff.annotate_and_store_for_story(db=db, stories_id=stories_id)
-        except Exception as ex:
-            raise McCLIFFFetchAnnotationJobException("Unable to process story $stories_id with CLIFF: %s" % str(ex))
+            log.info("Adding story ID %d to the update story tags queue..." % stories_id)
+            CLIFFUpdateStoryTagsJob.add_to_queue(stories_id=stories_id)
 
-        log.info("Adding story ID %d to the update story tags queue..." % stories_id)
-        CLIFFUpdateStoryTagsJob.add_to_queue(stories_id=stories_id)
-
-        log.info("Finished fetching annotation for story ID %d" % stories_id)
+            log.info("Finished fetching annotation for story ID %d" % stories_id)
 
     @classmethod
     def queue_name(cls) -> str:
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 
-import time
+import os
+from typing import List
 
-from mediawords.db import connect_to_db
+from celery.signals import worker_process_shutdown
+
+from mediawords.db import pooled_db
 from mediawords.dbi.stories.extractor_arguments import PyExtractorArguments
+from mediawords.dbi.stories.pipelined_extract import PipelinedExtractor
 from mediawords.dbi.stories.stories import extract_and_process_story
 from mediawords.job import AbstractJob, McAbstractJobException, JobBrokerApp
-from mediawords.story_vectors import medium_is_locked
+from mediawords.story_vectors import McStorySentencesLockTimeoutException
+from mediawords.util.config import get_config
 from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
@@ -23,68 +28,160 @@ class ExtractAndVectorJob(AbstractJob):
 
     Extract, vector and process a story.
 
+    If "stories_ids" is passed instead of "stories_id", extract a batch of stories using a single database connection
+    and one transaction per story; contents of the batch's downloads get fetched, extracted and written in a pipeline
+    (see PipelinedExtractor).
+
     Start this worker script by running:
 
         ./script/run_in_env.sh ./mediacloud/mediawords/job/extract_and_vector.py
 
     """
 
-    # Sleep for one second if there are more than this number of consecutive requeues
-    _SLEEP_AFTER_REQUEUES = 100
-
-    # Count the number of consecutive requeues
-    _consecutive_requeues = 0
+    # Pipelined extractor for batches (created on first use and kept for the lifetime of the worker process, so that
+    # extractor processes don't have to be started for every batch)
+    _pipelined_extractor = None
 
     @classmethod
-    def run_job(cls, stories_id: int, use_cache: bool = False) -> None:
+    def run_job(cls, stories_id: int = None, use_cache: bool = False, stories_ids: List[int] = None) -> None:
+
+        if stories_ids:
+            cls._run_batch(stories_ids=stories_ids, use_cache=use_cache)
+            return
 
         # MC_REWRITE_TO_PYTHON: remove after Python rewrite
         if isinstance(stories_id, bytes):
             stories_id = decode_object_from_bytes_if_needed(stories_id)
-        stories_id = int(stories_id)
+        stories_id = int(stories_id or 0)
 
         if not stories_id:
             raise McExtractAndVectorException("'stories_id' is not set.")
 
-        db = connect_to_db()
+        with pooled_db() as db:
+            story = db.find_by_id(table='stories', object_id=stories_id)
+            if not story:
+                raise McExtractAndVectorException("Story with ID {} was not found.".format(stories_id))
 
-        story = db.find_by_id(table='stories', object_id=stories_id)
-        if not story:
-            raise McExtractAndVectorException("Story with ID {} was not found.".format(stories_id))
+            log.info("Extracting story {}...".format(stories_id))
 
-        if medium_is_locked(db=db, media_id=story['media_id']):
-            log.warning("Requeueing job for story {} in locked medium {}...".format(stories_id, story['media_id']))
-            ExtractAndVectorJob._consecutive_requeues += 1
+            db.begin()
 
-            # Prevent spamming these requeue events if the locked media source is the only one in the queue
-            if ExtractAndVectorJob._consecutive_requeues > ExtractAndVectorJob._SLEEP_AFTER_REQUEUES:
-                log.warning(
-                    "Story extraction job has been requeued more than {} times, waiting before requeueing...".format(
-                        ExtractAndVectorJob._consecutive_requeues
-                    )
-                )
-                time.sleep(1)
+            try:
+                extractor_args = PyExtractorArguments(use_cache=use_cache)
+                extract_and_process_story(db=db, story=story, extractor_args=extractor_args)
 
-            ExtractAndVectorJob.add_to_queue(stories_id=stories_id)
+            except McStorySentencesLockTimeoutException as ex:
+                # Medium week has been locked by other workers for too long
+                log.warning("Requeueing job for story {}: {}".format(stories_id, ex))
 
-            return
+                if db.in_transaction():
+                    db.rollback()
+
+                ExtractAndVectorJob.add_to_queue(stories_id=stories_id, use_cache=use_cache)
+
+                return
 
-        ExtractAndVectorJob._consecutive_requeues = 0
+            except Exception as ex:
+                raise McExtractAndVectorException("Extractor died while extracting story {}: {}".format(stories_id, ex))
 
-        log.info("Extracting story {}...".format(stories_id))
+            db.commit()
 
-        db.begin()
+            log.info("Done extracting story {}.".format(stories_id))
+
+    @classmethod
+    def _extract_processes(cls) -> int:
+        """Return number of extractor processes for a worker: CPUs divided between all the workers that Supervisor
+        starts, or 0 (extract in-process) if there are no more CPUs than workers."""
+        config = get_config()
 
-        try:
-            extractor_args = PyExtractorArguments(use_cache=use_cache)
-            extract_and_process_story(db=db, story=story, extractor_args=extractor_args)
+        supervisor_programs = (config.get('supervisor', None) or {}).get('programs', None) or {}
+        worker_count = int((supervisor_programs.get('extract_and_vector', None) or {}).get('numprocs', 1) or 1)
 
-        except Exception as ex:
-            raise McExtractAndVectorException("Extractor died while extracting story {}: {}".format(stories_id, ex))
+        extract_processes = (os.cpu_count() or 1) // max(worker_count, 1)
+        if extract_processes < 2:
+            # Extractor processes would only compete for CPUs with the other workers
+            extract_processes = 0
 
-        db.commit()
+        return extract_processes
 
-        log.info("Done extracting story {}.".format(stories_id))
+    @classmethod
+    def _get_pipelined_extractor(cls) -> PipelinedExtractor:
+        """Return pipelined extractor for batches, create one if needed."""
+        if ExtractAndVectorJob._pipelined_extractor is None:
+            ExtractAndVectorJob._pipelined_extractor = PipelinedExtractor(extract_processes=cls._extract_processes())
+
+            # Jobs get run in pool processes which don't necessarily get to run "atexit" handlers
+            worker_process_shutdown.connect(cls._close_pipelined_extractor, weak=False)
+
+        return ExtractAndVectorJob._pipelined_extractor
+
+    # noinspection PyUnusedLocal
+    @classmethod
+    def _close_pipelined_extractor(cls, *args, **kwargs) -> None:
+        """Stop pipelined extractor's fetch threads and extractor processes (if any)."""
+        if ExtractAndVectorJob._pipelined_extractor is not None:
+            ExtractAndVectorJob._pipelined_extractor.close()
+            ExtractAndVectorJob._pipelined_extractor = None
+
+    @classmethod
+    def _run_batch(cls, stories_ids: List[int], use_cache: bool = False) -> None:
+        """Extract a batch of stories, requeue the ones which medium week stayed locked for too long; raise after the
+        whole batch if some of the other stories failed."""
+
+        # MC_REWRITE_TO_PYTHON: remove after Python rewrite
+        stories_ids = decode_object_from_bytes_if_needed(stories_ids)
+        stories_ids = sorted(set(int(stories_id) for stories_id in stories_ids))
+
+        with pooled_db() as db:
+            stories = db.query("""
+                SELECT *
+                FROM stories
+                WHERE stories_id IN %(stories_ids)s
+                ORDER BY stories_id
+            """, {'stories_ids': tuple(stories_ids)}).hashes()
+
+            # Story ID -> error message
+            failed_stories = dict()
+
+            found_stories_ids = {story['stories_id'] for story in stories}
+            for stories_id in stories_ids:
+                if stories_id not in found_stories_ids:
+                    failed_stories[stories_id] = "Story with ID {} was not found.".format(stories_id)
+
+            log.info("Extracting {} stories...".format(len(stories)))
+
+            # Every story gets written in a transaction of its own, and _insert_story_sentences() holds the story's
+            # medium week lock only while writing the sentences, so stories of the same medium week extracted by
+            # other workers don't have to wait for the whole batch
+            extraction_errors = cls._get_pipelined_extractor().extract_and_process_stories(
+                db=db,
+                stories=stories,
+                extractor_args=PyExtractorArguments(use_cache=use_cache),
+            )
+
+        locked_stories_ids = []
+        for stories_id, error in extraction_errors.items():
+            if isinstance(error, McStorySentencesLockTimeoutException):
+                # Medium week has been locked by other workers for too long
+                locked_stories_ids.append(stories_id)
+            else:
+                failed_stories[stories_id] = str(error)
+
+        if locked_stories_ids:
+            log.warning("Requeueing {} stories which medium weeks are still locked...".format(len(locked_stories_ids)))
+            ExtractAndVectorJob.add_to_queue(stories_ids=sorted(locked_stories_ids), use_cache=use_cache)
+
+        if failed_stories:
+            for stories_id in sorted(failed_stories.keys()):
+                log.error("Extractor died while extracting story {}: {}".format(stories_id, failed_stories[stories_id]))
+
+            raise McExtractAndVectorException(
+                "Extractor died while extracting {} out of {} stories: {}".format(
+                    len(failed_stories),
+                    len(stories_ids),
+                    sorted(failed_stories.keys()),
+                )
+            )
 
     @classmethod
     def queue_name(cls) -> str:
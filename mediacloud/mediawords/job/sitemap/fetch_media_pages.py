@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from mediawords.db import connect_to_db
+from mediawords.db import pooled_db
 from mediawords.job import AbstractJob, JobBrokerApp
 from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
@@ -27,9 +27,8 @@ class FetchMediaPages(AbstractJob):
 
         media_id = int(media_id)
 
-        db = connect_to_db()
-
-        fetch_sitemap_pages_for_media_id(db=db, media_id=media_id)
+        with pooled_db() as db:
+            fetch_sitemap_pages_for_media_id(db=db, media_id=media_id)
 
     @classmethod
     def queue_name(cls) -> str:
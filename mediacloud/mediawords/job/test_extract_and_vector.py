@@ -0,0 +1,43 @@
+import pytest
+
+from mediawords.job.extract_and_vector import ExtractAndVectorJob, McExtractAndVectorException
+from mediawords.test.db.create import create_test_story_stack, add_content_to_test_story_stack
+from mediawords.test.test_database import TestDatabaseWithSchemaTestCase
+
+
+class TestExtractAndVectorJob(TestDatabaseWithSchemaTestCase):
+
+    def test_run_job_batch(self):
+        db = self.db()
+
+        story_stack = create_test_story_stack(db=db, data={
+            'A': {'B': [1, 2]},
+            'C': {'D': [3]},
+        })
+        story_stack = add_content_to_test_story_stack(db=db, story_stack=story_stack)
+
+        stories_ids = [
+            story_stack['A']['feeds']['B']['stories']['1']['stories_id'],
+            story_stack['A']['feeds']['B']['stories']['2']['stories_id'],
+            story_stack['C']['feeds']['D']['stories']['3']['stories_id'],
+        ]
+
+        db.query("DELETE FROM story_sentences")
+
+        nonexistent_stories_id = max(stories_ids) + 1000
+
+        # Nonexistent story gets reported but doesn't prevent the rest of the batch from being extracted
+        with pytest.raises(McExtractAndVectorException) as ex:
+            ExtractAndVectorJob.run_job(stories_ids=stories_ids + [nonexistent_stories_id])
+        assert str(nonexistent_stories_id) in str(ex.value)
+
+        extracted_stories_ids = db.query("""
+            SELECT DISTINCT stories_id
+            FROM story_sentences
+            ORDER BY stories_id
+        """).flat()
+        assert extracted_stories_ids == sorted(stories_ids)
+
+        # No advisory locks left behind
+        locks = db.query("SELECT objid FROM pg_locks WHERE locktype = 'advisory'").flat()
+        assert len(locks) == 0
@@ -4,7 +4,7 @@
 
 import traceback
 
-from mediawords.db import connect_to_db
+from mediawords.db import pooled_db
 from mediawords.job import AbstractJob, McAbstractJobException, JobBrokerApp
 import mediawords.tm.extract_story_links
 from mediawords.util.log import create_logger
@@ -47,10 +47,10 @@ class ExtractStoryLinksJob(AbstractJob):
         log.info("Start fetching extracting links for stories_id %d topics_id %d" % (stories_id, topics_id))
 
         try:
-            db = connect_to_db()
-            story = db.require_by_id(table='stories', object_id=stories_id)
-            topic = db.require_by_id(table='topics', object_id=topics_id)
-            mediawords.tm.extract_story_links.extract_links_for_topic_story(db, story, topic)
+            with pooled_db() as db:
+                story = db.require_by_id(table='stories', object_id=stories_id)
+                topic = db.require_by_id(table='topics', object_id=topics_id)
+                mediawords.tm.extract_story_links.extract_links_for_topic_story(db, story, topic)
 
         except Exception as ex:
             log.error("Error while processing story {}: {}".format(stories_id, ex))
@@ -5,7 +5,7 @@ if they match the topic pattern.
 
 import traceback
 
-from mediawords.db import connect_to_db
+from mediawords.db import pooled_db
 from mediawords.job import AbstractJob, McAbstractJobException, JobBrokerApp
 import mediawords.tm.fetch_twitter_urls
 from mediawords.util.log import create_logger
@@ -46,24 +46,21 @@ class FetchTwitterUrlsJob(AbstractJob):
 
         log.info("Start fetch twitter urls for %d topic_fetch_urls" % len(topic_fetch_urls_ids))
 
-        db = connect_to_db()
-
-        try:
-            mediawords.tm.fetch_twitter_urls.fetch_twitter_urls(db=db, topic_fetch_urls_ids=topic_fetch_urls_ids)
-        except Exception as ex:
-            log.error("Error while fetching URL with ID {}: {}".format(topic_fetch_urls_ids, str(ex)))
-            db.query(
-                """
-                update topic_fetch_urls set state = %(a)s, message = %(b)s, fetch_date = now()
-                    where topic_fetch_urls_id = any(%(c)s)
-                """,
-                {
-                    'a': mediawords.tm.fetch_link.FETCH_STATE_PYTHON_ERROR,
-                    'b': traceback.format_exc(),
-                    'c': topic_fetch_urls_ids
-                })
-
-        db.disconnect()
+        with pooled_db() as db:
+            try:
+                mediawords.tm.fetch_twitter_urls.fetch_twitter_urls(db=db, topic_fetch_urls_ids=topic_fetch_urls_ids)
+            except Exception as ex:
+                log.error("Error while fetching URL with ID {}: {}".format(topic_fetch_urls_ids, str(ex)))
+                db.query(
+                    """
+                    update topic_fetch_urls set state = %(a)s, message = %(b)s, fetch_date = now()
+                        where topic_fetch_urls_id = any(%(c)s)
+                    """,
+                    {
+                        'a': mediawords.tm.fetch_link.FETCH_STATE_PYTHON_ERROR,
+                        'b': traceback.format_exc(),
+                        'c': topic_fetch_urls_ids
+                    })
 
         log.info("Finished fetching twitter url")
 
@@ -1,11 +1,14 @@
 import abc
 from enum import Enum
-from typing import Union
+from typing import Dict, List, Union
 
 from mediawords.db import DatabaseHandler
 from mediawords.util.compress import gzip, gunzip, bzip2, bunzip2
+from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
+log = create_logger(__name__)
+
 
 class McKeyValueStoreException(Exception):
     """Key-value store exception."""
@@ -29,6 +32,34 @@ class KeyValueStore(metaclass=abc.ABCMeta):
         """Read object. Returns content (in bytes) on success, None if content is not found, raises on error."""
         raise NotImplementedError("Abstract method.")
 
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Read many objects at once; "object_paths" is an optional dict of object IDs and their paths.
+
+        Returns a dict of object IDs and their contents (in bytes); objects that couldn't be fetched (e.g. because they
+        don't exist) are left out of it.
+
+        Stores that can fetch many objects faster than one by one should override this."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+
+        object_paths = decode_object_from_bytes_if_needed(object_paths)
+        if object_paths is None:
+            object_paths = dict()
+
+        contents = dict()
+
+        for object_id in object_ids:
+            try:
+                # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+                contents[object_id] = self.fetch_content(db, object_id, object_paths.get(object_id, None))
+            except Exception as ex:
+                log.debug("Unable to fetch object ID %d: %s" % (object_id, str(ex),))
+
+        return contents
+
     @abc.abstractmethod
     def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
         """Write object (str or bytes). Returns path to the object on success, raises on error."""
@@ -123,6 +154,25 @@ class KeyValueStore(metaclass=abc.ABCMeta):
 
         return object_id
 
+    @staticmethod
+    def _prepare_object_ids(object_ids: List[int]) -> List[int]:
+        """Prepare a list of object IDs by validating and decoding them, removing duplicates."""
+
+        if object_ids is None:
+            raise McKeyValueStoreException("Object IDs is None.")
+
+        object_ids = decode_object_from_bytes_if_needed(object_ids)
+
+        unique_object_ids = []
+        seen_object_ids = set()
+        for object_id in object_ids:
+            object_id = KeyValueStore._prepare_object_id(object_id)
+            if object_id not in seen_object_ids:
+                seen_object_ids.add(object_id)
+                unique_object_ids.append(object_id)
+
+        return unique_object_ids
+
     @staticmethod
     def _prepare_content(content: Union[str, bytes]) -> bytes:
         """Prepare content to store by validating and decoding it."""
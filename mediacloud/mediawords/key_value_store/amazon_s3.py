@@ -1,5 +1,7 @@
+import concurrent.futures
 import os
-from typing import Union
+import threading
+from typing import Dict, List, Union
 
 import boto3
 from botocore.config import Config as BotoCoreConfig
@@ -46,6 +48,12 @@ class AmazonS3Store(KeyValueStore):
     __READ_ATTEMPTS = 3
     __WRITE_ATTEMPTS = 3
 
+    # Number of threads fetching objects concurrently in fetch_contents()
+    __FETCH_CONTENTS_THREADS = 16
+
+    # Max. number of GETs that fetch_contents() keeps submitted at once
+    __FETCH_CONTENTS_WINDOW = __FETCH_CONTENTS_THREADS * 2
+
     __slots__ = [
         '__access_key_id',
         '__secret_access_key',
@@ -54,8 +62,16 @@ class AmazonS3Store(KeyValueStore):
 
         '__compression_method',
 
-        # Boto3 objects
-        '__s3',
+        # Thread-local storage for Boto3 objects (which are not thread-safe)
+        '__thread_local',
+
+        # Whether the bucket's existence was verified (in this process)
+        '__bucket_verified',
+        '__bucket_verified_lock',
+
+        # Thread pool for fetching many objects concurrently, created on first use
+        '__fetch_executor',
+        '__fetch_executor_lock',
 
         # Process PID (to prevent forks attempting to clone the Net::Amazon::S3 accessor objects)
         '__pid',
@@ -100,15 +116,27 @@ class AmazonS3Store(KeyValueStore):
         self.__compression_method = compression_method
 
         self.__pid = os.getpid()
-        self.__s3 = None
+        self.__thread_local = threading.local()
+        self.__bucket_verified = False
+        self.__bucket_verified_lock = threading.Lock()
+        self.__fetch_executor = None
+        self.__fetch_executor_lock = threading.Lock()
 
     def __initialize_s3(self) -> None:
-        """Initialize S3 or raise an exception."""
+        """Initialize S3 for the current thread or raise an exception."""
 
-        if os.getpid() == self.__pid:
-            if self.__s3 is not None:
-                # Already initialized on the very same process
-                return
+        if os.getpid() != self.__pid:
+            # Don't reuse parent's objects in a forked process
+            self.__thread_local = threading.local()
+            self.__bucket_verified = False
+            self.__bucket_verified_lock = threading.Lock()
+            self.__fetch_executor = None
+            self.__fetch_executor_lock = threading.Lock()
+            self.__pid = os.getpid()
+
+        if getattr(self.__thread_local, 's3', None) is not None:
+            # Already initialized on the very same process and thread
+            return
 
         # Timeout should "fit in" at least $AMAZON_S3_READ_ATTEMPTS number of retries within the time period
         request_timeout = int((self.__TIMEOUT / self.__READ_ATTEMPTS) - 1)
@@ -119,25 +147,29 @@ class AmazonS3Store(KeyValueStore):
                                 read_timeout=request_timeout)
 
         try:
-            self.__s3 = boto3.resource(service_name='s3',
-                                       aws_access_key_id=self.__access_key_id,
-                                       aws_secret_access_key=self.__secret_access_key,
-                                       use_ssl=self.__USE_SSL,
-                                       config=config)
+            # Default session is not thread-safe either, so every thread gets its own
+            s3 = boto3.session.Session().resource(service_name='s3',
+                                                  aws_access_key_id=self.__access_key_id,
+                                                  aws_secret_access_key=self.__secret_access_key,
+                                                  use_ssl=self.__USE_SSL,
+                                                  config=config)
         except Exception as ex:
             raise McAmazonS3StoreException("Unable to create S3 client: %s" % str(ex))
 
-        # Verify that the bucket exists
-        bucket_found = False
-        for bucket in self.__s3.buckets.all():
-            if bucket.name == self.__bucket_name:
-                bucket_found = True
-                break
-        if not bucket_found:
-            raise McAmazonS3StoreException("Bucket '%s' was not found." % self.__bucket_name)
+        # Verify that the bucket exists (once per process)
+        with self.__bucket_verified_lock:
+            if not self.__bucket_verified:
+                bucket_found = False
+                for bucket in s3.buckets.all():
+                    if bucket.name == self.__bucket_name:
+                        bucket_found = True
+                        break
+                if not bucket_found:
+                    raise McAmazonS3StoreException("Bucket '%s' was not found." % self.__bucket_name)
 
-        # Save PID
-        self.__pid = os.getpid()
+                self.__bucket_verified = True
+
+        self.__thread_local.s3 = s3
 
     def __s3_key_for_object_id(self, object_id: int) -> str:
         """Return S3 path for object ID."""
@@ -146,18 +178,47 @@ class AmazonS3Store(KeyValueStore):
     # FIXME add return type
     def __object_for_object_id(self, object_id: int):
         """Return S3.Object() for object ID."""
-        return self.__s3.Object(bucket_name=self.__bucket_name,
-                                key=self.__s3_key_for_object_id(object_id=object_id))
+        return self.__thread_local.s3.Object(bucket_name=self.__bucket_name,
+                                             key=self.__s3_key_for_object_id(object_id=object_id))
 
-    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
-        """Read object from Amazon S3."""
+    def __get_fetch_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Return thread pool for fetching many objects concurrently, create one if needed."""
 
-        object_id = self._prepare_object_id(object_id)
+        # Resets the executor in a forked process
+        self.__initialize_s3()
+
+        with self.__fetch_executor_lock:
+            if self.__fetch_executor is None:
+                self.__fetch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.__FETCH_CONTENTS_THREADS,
+                )
+            return self.__fetch_executor
+
+    def __s3_object_exists(self, object_id: int) -> bool:
+        """Test if object exists in Amazon S3 (doesn't use the database so it's safe to call from any thread)."""
+
+        self.__initialize_s3()
+
+        try:
+            o = self.__object_for_object_id(object_id)
+            o.load()
+        except ClientError as ex:
+            if ex.response['Error']['Code'] == '404':
+                return False
+            else:
+                raise ex
+        except Exception as ex:
+            raise McAmazonS3StoreException("Unable to test if object ID %d exists: %s" % (object_id, str(ex),))
+        else:
+            return True
+
+    def __fetch_content_from_s3(self, object_id: int) -> bytes:
+        """Read object from Amazon S3 (doesn't use the database so it's safe to call from any thread)."""
 
         self.__initialize_s3()
 
         if self.__CHECK_IF_EXISTS_BEFORE_FETCHING:
-            if not self.content_exists(db=db, object_id=object_id, object_path=object_path):
+            if not self.__s3_object_exists(object_id=object_id):
                 raise McAmazonS3StoreException("Object ID %d does not exist." % object_id)
 
         content = None
@@ -199,6 +260,53 @@ class AmazonS3Store(KeyValueStore):
 
         return content
 
+    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
+        """Read object from Amazon S3."""
+
+        object_id = self._prepare_object_id(object_id)
+
+        return self.__fetch_content_from_s3(object_id=object_id)
+
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Read many objects from Amazon S3 concurrently; objects that couldn't be fetched are left out."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+
+        if len(object_ids) == 0:
+            return dict()
+
+        executor = self.__get_fetch_executor()
+
+        contents = dict()
+
+        # Keep a bounded window of GETs in flight instead of queueing all of them at once, so that a huge batch doesn't
+        # make the shared executor hold thousands of pending requests
+        remaining_object_ids = iter(object_ids)
+        pending_futures = dict()
+
+        while True:
+            for object_id in remaining_object_ids:
+                pending_futures[executor.submit(self.__fetch_content_from_s3, object_id)] = object_id
+                if len(pending_futures) >= self.__FETCH_CONTENTS_WINDOW:
+                    break
+
+            if len(pending_futures) == 0:
+                break
+
+            done_futures, _ = concurrent.futures.wait(pending_futures, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done_futures:
+                object_id = pending_futures.pop(future)
+                try:
+                    contents[object_id] = future.result()
+                except Exception as ex:
+                    log.debug("Unable to fetch object ID %d: %s" % (object_id, str(ex),))
+
+        return contents
+
     def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
         """Write object to Amazon S3."""
 
@@ -274,17 +382,4 @@ class AmazonS3Store(KeyValueStore):
 
         object_id = self._prepare_object_id(object_id)
 
-        self.__initialize_s3()
-
-        try:
-            o = self.__object_for_object_id(object_id)
-            o.load()
-        except ClientError as ex:
-            if ex.response['Error']['Code'] == '404':
-                return False
-            else:
-                raise ex
-        except Exception as ex:
-            raise McAmazonS3StoreException("Unable to test if object ID %d exists: %s" % (object_id, str(ex),))
-        else:
-            return True
+        return self.__s3_object_exists(object_id=object_id)
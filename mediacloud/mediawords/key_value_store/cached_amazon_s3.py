@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Dict, List, Union
 
 from mediawords.db import DatabaseHandler
 from mediawords.key_value_store import KeyValueStore, McKeyValueStoreException
@@ -81,6 +81,36 @@ class CachedAmazonS3Store(AmazonS3Store):
         except Exception as ex:
             log.warning("Unable to cache object ID %d: %s" % (object_id, str(ex),))
 
+    def __uncompress_cached_content(self, object_id: int, raw_data: Union[bytes, memoryview, list]) -> bytes:
+        """Return uncompressed content of cached object's "raw_data" value."""
+
+        content = raw_data
+
+        # MC_REWRITE_TO_PYTHON: Perl database handler returns value as array of bytes
+        if isinstance(content, list):
+            content = b''.join(content)
+
+        if isinstance(content, memoryview):
+            content = content.tobytes()
+
+        if not isinstance(content, bytes):
+            raise McCachedAmazonS3StoreException("Content is not bytes for object %d." % object_id)
+
+        try:
+            content = self._uncompress_data_for_method(data=content,
+                                                       compression_method=self.__cache_compression_method)
+        except Exception as ex:
+            raise McCachedAmazonS3StoreException(
+                "Unable to uncompress data for object ID %d: %s" % (object_id, str(ex),))
+
+        if content is None:
+            raise McCachedAmazonS3StoreException("Content is None after uncompression for object ID %d" % object_id)
+        if not isinstance(content, bytes):
+            raise McCachedAmazonS3StoreException(
+                "Content is not bytes after uncompression for object ID %d" % object_id)
+
+        return content
+
     def __try_retrieving_object_from_cache(self, db: DatabaseHandler, object_id: int) -> Union[bytes, None]:
         """Attempt to retrieve object from cache, don't worry too much if it fails."""
 
@@ -96,37 +126,39 @@ class CachedAmazonS3Store(AmazonS3Store):
             if content is None or len(content) == 0:
                 raise McCachedAmazonS3StoreException("Object with ID %d was not found." % object_id)
 
-            content = content['raw_data']
+            content = self.__uncompress_cached_content(object_id=object_id, raw_data=content['raw_data'])
 
-            # MC_REWRITE_TO_PYTHON: Perl database handler returns value as array of bytes
-            if isinstance(content, list):
-                content = b''.join(content)
+        except Exception as ex:
+            log.debug("Unable to retrieve object ID %d from cache: %s" % (object_id, str(ex),))
+            return None
 
-            if isinstance(content, memoryview):
-                content = content.tobytes()
+        else:
+            return content
 
-            if not isinstance(content, bytes):
-                raise McCachedAmazonS3StoreException("Content is not bytes for object %d." % object_id)
+    def __try_retrieving_objects_from_cache(self, db: DatabaseHandler, object_ids: List[int]) -> Dict[int, bytes]:
+        """Attempt to retrieve many objects from cache with a single query, return the ones that were found."""
 
-            try:
-                content = self._uncompress_data_for_method(data=content,
-                                                           compression_method=self.__cache_compression_method)
-            except Exception as ex:
-                raise McCachedAmazonS3StoreException(
-                    "Unable to uncompress data for object ID %d: %s" % (object_id, str(ex),))
+        contents = dict()
 
-            if content is None:
-                raise McCachedAmazonS3StoreException("Content is None after uncompression for object ID %d" % object_id)
-            if not isinstance(content, bytes):
-                raise McCachedAmazonS3StoreException(
-                    "Content is not bytes after uncompression for object ID %d" % object_id)
+        try:
+            sql = "SELECT object_id, raw_data "
+            sql += "FROM %s " % self.__cache_table  # interpolated by Python
+            sql += "WHERE object_id = ANY(%(object_ids)s)"  # interpolated by psycopg2
+
+            rows = db.query(sql, {'object_ids': object_ids}).hashes()
 
         except Exception as ex:
-            log.debug("Unable to retrieve object ID %d from cache: %s" % (object_id, str(ex),))
-            return None
+            log.debug("Unable to retrieve %d objects from cache: %s" % (len(object_ids), str(ex),))
+            return contents
 
-        else:
-            return content
+        for row in rows:
+            object_id = row['object_id']
+            try:
+                contents[object_id] = self.__uncompress_cached_content(object_id=object_id, raw_data=row['raw_data'])
+            except Exception as ex:
+                log.debug("Unable to retrieve object ID %d from cache: %s" % (object_id, str(ex),))
+
+        return contents
 
     def __remove_object_from_cache(self, db: DatabaseHandler, object_id: int) -> None:
         """Attempt to remove object from cache.
@@ -155,6 +187,31 @@ class CachedAmazonS3Store(AmazonS3Store):
 
         return content
 
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Read many objects, try local cache first and fetch the rest from Amazon S3 concurrently."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+
+        if len(object_ids) == 0:
+            return dict()
+
+        contents = self.__try_retrieving_objects_from_cache(db=db, object_ids=object_ids)
+
+        missing_object_ids = [object_id for object_id in object_ids if object_id not in contents]
+        if len(missing_object_ids) > 0:
+            fetched_contents = super().fetch_contents(db=db, object_ids=missing_object_ids, object_paths=object_paths)
+
+            # Cache the retrieved objects because we might need them soon
+            for object_id, content in fetched_contents.items():
+                self.__try_storing_object_in_cache(db=db, object_id=object_id, content=content)
+
+            contents.update(fetched_contents)
+
+        return contents
+
     def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
         """Write object to Amazon S3, cache it locally too."""
 
@@ -0,0 +1,304 @@
+import collections
+import os
+import threading
+import time
+from typing import Dict, List, Union
+
+from mediawords.db import DatabaseHandler
+from mediawords.key_value_store import KeyValueStore, McKeyValueStoreException
+from mediawords.util.log import create_logger
+from mediawords.util.perl import decode_object_from_bytes_if_needed
+
+log = create_logger(__name__)
+
+
+class McLRUCachedStoreException(McKeyValueStoreException):
+    """LRU cached key-value store exception."""
+    pass
+
+
+class LRUObjectCache(object):
+    """In-memory cache of objects (by their ID) with the least recently used ones getting evicted first.
+
+    Cache is limited by the total size of the cached objects (in bytes) and, optionally, by for how long the objects
+    get to stay in it. A single cache might be shared by multiple LRUCachedStore instances so that they stay within
+    one size limit together, as long as the stores don't hold objects with the same IDs."""
+
+    __slots__ = [
+        '__max_size',
+        '__ttl',
+
+        # Object ID -> (content, expiry time or None), least recently used first
+        '__cache',
+        '__cache_size',
+        '__lock',
+
+        # Process PID (to not reuse a lock that might have been held while forking)
+        '__pid',
+    ]
+
+    def __init__(self, max_size: int, ttl: Union[float, None] = None):
+        """Constructor.
+
+        Arguments:
+        max_size - max. total size of cached objects (in bytes)
+        ttl - for how long (in seconds) to keep objects in cache (None to keep them until they get evicted)
+        """
+
+        if max_size is None or int(max_size) < 1:
+            raise McLRUCachedStoreException("Max. cache size must be positive.")
+        if ttl is not None and float(ttl) <= 0:
+            raise McLRUCachedStoreException("Cache TTL must be positive.")
+
+        self.__max_size = int(max_size)
+        self.__ttl = float(ttl) if ttl is not None else None
+
+        self.__cache = collections.OrderedDict()
+        self.__cache_size = 0
+        self.__lock = threading.Lock()
+
+        self.__pid = os.getpid()
+
+    def max_size(self) -> int:
+        """Return max. total size of cached objects (in bytes)."""
+        return self.__max_size
+
+    def ttl(self) -> Union[float, None]:
+        """Return for how long (in seconds) objects are kept in cache, None if they're kept until they get evicted."""
+        return self.__ttl
+
+    def cache_size(self) -> int:
+        """Return total size of the cached objects (in bytes)."""
+        return self.__cache_size
+
+    def __check_pid(self) -> None:
+        """Renew the lock in a forked process (cached objects themselves are still valid)."""
+        if os.getpid() != self.__pid:
+            self.__lock = threading.Lock()
+            self.__pid = os.getpid()
+
+    def __get(self, object_id: int) -> Union[bytes, None]:
+        """Return cached object if it's in cache and hasn't expired yet, None otherwise; lock should be held."""
+
+        cached = self.__cache.get(object_id, None)
+        if cached is None:
+            return None
+
+        content, expires_at = cached
+
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.__forget(object_id)
+            return None
+
+        self.__cache.move_to_end(object_id)
+
+        return content
+
+    def __forget(self, object_id: int) -> None:
+        """Remove object from cache (if it's there); lock should be held."""
+
+        cached = self.__cache.pop(object_id, None)
+        if cached is not None:
+            self.__cache_size -= len(cached[0])
+
+    def get(self, object_ids: List[int]) -> Dict[int, bytes]:
+        """Return cached objects (that haven't expired yet) out of the ones with the given IDs."""
+
+        self.__check_pid()
+
+        contents = dict()
+
+        with self.__lock:
+            for object_id in object_ids:
+                content = self.__get(object_id)
+                if content is not None:
+                    contents[object_id] = content
+
+        return contents
+
+    def add(self, contents: Dict[int, bytes]) -> None:
+        """Add objects to cache, evict least recently used objects to fit them in."""
+
+        self.__check_pid()
+
+        with self.__lock:
+            for object_id, content in contents.items():
+                self.__forget(object_id)
+
+                if len(content) > self.__max_size:
+                    # Wouldn't fit even into an empty cache
+                    continue
+
+                expires_at = time.monotonic() + self.__ttl if self.__ttl is not None else None
+
+                self.__cache[object_id] = (content, expires_at,)
+                self.__cache_size += len(content)
+
+                while self.__cache_size > self.__max_size:
+                    _, (evicted_content, _) = self.__cache.popitem(last=False)
+                    self.__cache_size -= len(evicted_content)
+
+    def forget(self, object_id: int) -> None:
+        """Remove object from cache (if it's there)."""
+
+        self.__check_pid()
+
+        with self.__lock:
+            self.__forget(object_id)
+
+    def clear(self) -> None:
+        """Remove all objects from cache."""
+
+        self.__check_pid()
+
+        with self.__lock:
+            self.__cache = collections.OrderedDict()
+            self.__cache_size = 0
+
+
+class LRUCachedStore(KeyValueStore):
+    """Key-value store wrapper that keeps recently fetched (uncompressed) objects of another store in memory.
+
+    Objects are kept in a LRUObjectCache by their ID (not path), so the wrapped store should be the only one holding
+    objects with those IDs (out of the stores that share the cache)."""
+
+    __slots__ = [
+        '__store',
+        '__cache',
+    ]
+
+    def __init__(self,
+                 store: KeyValueStore,
+                 max_size: Union[int, None] = None,
+                 ttl: Union[float, None] = None,
+                 cache: Union[LRUObjectCache, None] = None):
+        """Constructor.
+
+        Arguments:
+        store - store to cache objects of
+        max_size - max. total size of cached objects (in bytes)
+        ttl - for how long (in seconds) to keep objects in cache (None to keep them until they get evicted)
+        cache - cache (possibly shared with other stores) to use instead of creating one with "max_size" and "ttl"
+        """
+
+        if store is None:
+            raise McLRUCachedStoreException("Store is None.")
+        if not isinstance(store, KeyValueStore):
+            raise McLRUCachedStoreException("Store is not KeyValueStore.")
+
+        if cache is None:
+            cache = LRUObjectCache(max_size=max_size, ttl=ttl)
+        elif max_size is not None or ttl is not None:
+            raise McLRUCachedStoreException("Either cache or its max. size and TTL should be set, not both.")
+
+        self.__store = store
+        self.__cache = cache
+
+    def store(self) -> KeyValueStore:
+        """Return cached store."""
+        return self.__store
+
+    def cache(self) -> LRUObjectCache:
+        """Return cache of objects."""
+        return self.__cache
+
+    def ttl(self) -> Union[float, None]:
+        """Return for how long (in seconds) objects are kept in cache, None if they're kept until they get evicted."""
+        return self.__cache.ttl()
+
+    def cache_size(self) -> int:
+        """Return total size of the cached objects (in bytes)."""
+        return self.__cache.cache_size()
+
+    def forget_content(self, object_id: int) -> None:
+        """Remove object from cache (e.g. after it got overwritten in the cached store by someone else)."""
+
+        object_id = self._prepare_object_id(object_id)
+
+        self.__cache.forget(object_id)
+
+    def clear(self) -> None:
+        """Remove all objects from cache."""
+        self.__cache.clear()
+
+    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
+        """Read object from memory cache, fetch it from the cached store if it's not there."""
+
+        object_id = self._prepare_object_id(object_id)
+        object_path = decode_object_from_bytes_if_needed(object_path)
+
+        content = self.__cache.get([object_id]).get(object_id, None)
+
+        if content is None:
+            # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+            content = self.__store.fetch_content(db, object_id, object_path)
+
+            if content is None:
+                raise McLRUCachedStoreException("Fetched content is None for object ID %d." % object_id)
+
+            self.__cache.add({object_id: content})
+
+        return content
+
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Read many objects from memory cache, fetch the ones that are not there from the cached store at once."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+        object_paths = decode_object_from_bytes_if_needed(object_paths)
+
+        contents = self.__cache.get(object_ids)
+
+        missing_object_ids = [object_id for object_id in object_ids if object_id not in contents]
+        if len(missing_object_ids) > 0:
+            # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+            fetched_contents = self.__store.fetch_contents(db, missing_object_ids, object_paths)
+
+            fetched_contents = {
+                object_id: content for object_id, content in fetched_contents.items() if content is not None
+            }
+            self.__cache.add(fetched_contents)
+            contents.update(fetched_contents)
+
+        return contents
+
+    def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
+        """Write object to the cached store, remove its previous version from memory cache."""
+
+        object_id = self._prepare_object_id(object_id)
+        content = self._prepare_content(content)
+
+        # Forget before storing too so that a failed write doesn't leave a stale version in cache
+        self.__cache.forget(object_id)
+
+        # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+        path = self.__store.store_content(db, object_id, content)
+
+        self.__cache.forget(object_id)
+
+        return path
+
+    def remove_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> None:
+        """Remove object from memory cache and the cached store."""
+
+        object_id = self._prepare_object_id(object_id)
+        object_path = decode_object_from_bytes_if_needed(object_path)
+
+        self.__cache.forget(object_id)
+
+        # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+        self.__store.remove_content(db, object_id, object_path)
+
+    def content_exists(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bool:
+        """Test if object exists in memory cache or the cached store."""
+
+        object_id = self._prepare_object_id(object_id)
+        object_path = decode_object_from_bytes_if_needed(object_path)
+
+        if object_id in self.__cache.get([object_id]):
+            return True
+
+        # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+        return self.__store.content_exists(db, object_id, object_path)
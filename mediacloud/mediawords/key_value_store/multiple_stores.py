@@ -1,9 +1,12 @@
-from typing import List, Union
+from typing import Dict, List, Union
 
 from mediawords.db import DatabaseHandler
 from mediawords.key_value_store import KeyValueStore, McKeyValueStoreException
+from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
+log = create_logger(__name__)
+
 
 class McMultipleStoresStoreException(McKeyValueStoreException):
     """Multiple stores exception."""
@@ -88,6 +91,49 @@ class MultipleStoresStore(KeyValueStore):
 
         return content
 
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Fetch many objects from the stores, asking every next store only for the objects that the previous ones
+        didn't return; objects that none of the stores have are left out."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+
+        object_paths = decode_object_from_bytes_if_needed(object_paths)
+
+        if len(self.__stores_for_reading) == 0:
+            raise McMultipleStoresStoreException("List of stores for reading objects is empty.")
+
+        contents = dict()
+
+        missing_object_ids = object_ids
+        for store in self.__stores_for_reading:
+
+            if len(missing_object_ids) == 0:
+                break
+
+            try:
+                # MC_REWRITE_TO_PYTHON: use named parameters after Python rewrite
+                store_contents = store.fetch_contents(db, missing_object_ids, object_paths)
+
+            except Exception as ex:
+                # Silently skip through errors as the rest of the stores might have the objects
+                log.debug("Error fetching %(count)d objects from store %(store)s: %(exception)s" % {
+                    'count': len(missing_object_ids),
+                    'store': store,
+                    'exception': str(ex),
+                })
+
+            else:
+                for object_id, content in store_contents.items():
+                    if content is not None:
+                        contents[object_id] = content
+
+                missing_object_ids = [object_id for object_id in missing_object_ids if object_id not in contents]
+
+        return contents
+
     def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
         """Store content to all stores; raise if one of them fails."""
 
@@ -1,9 +1,12 @@
-from typing import Union
+from typing import Dict, List, Union
 
 from mediawords.db import DatabaseHandler
 from mediawords.key_value_store import KeyValueStore, McKeyValueStoreException
+from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
+log = create_logger(__name__)
+
 
 class McPostgreSQLStoreException(McKeyValueStoreException):
     """PostgreSQL key-value store exception."""
@@ -39,22 +42,10 @@ class PostgreSQLStore(KeyValueStore):
         self.__table = table
         self.__compression_method = compression_method
 
-    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
-        """Read object from PostgreSQL table."""
-
-        object_id = self._prepare_object_id(object_id)
-
-        sql = "SELECT raw_data "
-        sql += "FROM %s " % self.__table  # interpolated by Python
-        sql += "WHERE object_id = %(object_id)s"  # interpolated by psycopg2
-
-        content = db.query(sql, {'object_id': object_id}).hash()
-
-        if content is None or len(content) == 0:
-            # Clients are expected to do content_exists() before attempting to fetch content that might not exist
-            raise McPostgreSQLStoreException("Object with ID %d was not found." % object_id)
+    def __uncompress_raw_data(self, object_id: int, raw_data: Union[bytes, memoryview, list]) -> bytes:
+        """Return uncompressed content of object's "raw_data" value."""
 
-        content = content['raw_data']
+        content = raw_data
 
         # MC_REWRITE_TO_PYTHON: Perl database handler returns value as array of bytes
         if isinstance(content, list):
@@ -78,6 +69,52 @@ class PostgreSQLStore(KeyValueStore):
 
         return content
 
+    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
+        """Read object from PostgreSQL table."""
+
+        object_id = self._prepare_object_id(object_id)
+
+        sql = "SELECT raw_data "
+        sql += "FROM %s " % self.__table  # interpolated by Python
+        sql += "WHERE object_id = %(object_id)s"  # interpolated by psycopg2
+
+        content = db.query(sql, {'object_id': object_id}).hash()
+
+        if content is None or len(content) == 0:
+            # Clients are expected to do content_exists() before attempting to fetch content that might not exist
+            raise McPostgreSQLStoreException("Object with ID %d was not found." % object_id)
+
+        return self.__uncompress_raw_data(object_id=object_id, raw_data=content['raw_data'])
+
+    def fetch_contents(self,
+                       db: DatabaseHandler,
+                       object_ids: List[int],
+                       object_paths: Dict[int, str] = None) -> Dict[int, bytes]:
+        """Read many objects from PostgreSQL table with a single query; objects that don't exist or can't be
+        uncompressed are left out."""
+
+        object_ids = self._prepare_object_ids(object_ids)
+
+        if len(object_ids) == 0:
+            return dict()
+
+        sql = "SELECT object_id, raw_data "
+        sql += "FROM %s " % self.__table  # interpolated by Python
+        sql += "WHERE object_id = ANY(%(object_ids)s)"  # interpolated by psycopg2
+
+        contents = dict()
+
+        for row in db.query(sql, {'object_ids': object_ids}).hashes():
+            object_id = row['object_id']
+
+            # One broken object shouldn't fail the whole batch
+            try:
+                contents[object_id] = self.__uncompress_raw_data(object_id=object_id, raw_data=row['raw_data'])
+            except Exception as ex:
+                log.warning("Unable to fetch object ID %d: %s" % (object_id, str(ex),))
+
+        return contents
+
     def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
         """Write object to PostgreSQL table."""
 
@@ -27,3 +27,6 @@ class TestAmazonS3StoreTestCase(TestAmazonS3CredentialsTestCase):
 
     def test_key_value_store(self):
         self._test_key_value_store()
+
+    def test_fetch_contents(self):
+        self._test_fetch_contents()
@@ -28,3 +28,6 @@ class TestCachedAmazonS3StoreTestCase(TestAmazonS3CredentialsTestCase):
 
     def test_key_value_store(self):
         self._test_key_value_store()
+
+    def test_fetch_contents(self):
+        self._test_fetch_contents()
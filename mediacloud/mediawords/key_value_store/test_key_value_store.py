@@ -121,3 +121,28 @@ class TestKeyValueStoreTestCase(TestDatabaseWithSchemaTestCase, metaclass=abc.AB
             self.store().fetch_content(db=self.db(),
                                        object_id=self._TEST_OBJECT_ID,
                                        object_path=path)
+
+    def _test_fetch_contents(self):
+        """Test fetch_contents()."""
+
+        assert self.store().fetch_contents(db=self.db(), object_ids=[]) == {}
+
+        path = self.store().store_content(db=self.db(),
+                                          object_id=self._TEST_OBJECT_ID,
+                                          content=self._TEST_CONTENT_UTF_8)
+
+        # Nonexistent objects are left out, duplicate IDs are fetched once
+        contents = self.store().fetch_contents(
+            db=self.db(),
+            object_ids=[self._TEST_OBJECT_ID, self._TEST_OBJECT_ID_NONEXISTENT, self._TEST_OBJECT_ID],
+            object_paths={self._TEST_OBJECT_ID: path},
+        )
+        assert contents == {self._TEST_OBJECT_ID: self._TEST_CONTENT_UTF_8}
+
+        # Fetched again (e.g. from cache)
+        contents = self.store().fetch_contents(db=self.db(), object_ids=[self._TEST_OBJECT_ID])
+        assert contents == {self._TEST_OBJECT_ID: self._TEST_CONTENT_UTF_8}
+
+        self.store().remove_content(db=self.db(), object_id=self._TEST_OBJECT_ID, object_path=path)
+
+        assert self.store().fetch_contents(db=self.db(), object_ids=[self._TEST_OBJECT_ID]) == {}
@@ -0,0 +1,183 @@
+import time
+from typing import Union
+
+import pytest
+
+from mediawords.db import DatabaseHandler
+from mediawords.key_value_store import KeyValueStore, McKeyValueStoreException
+from mediawords.key_value_store.lru_cached import LRUCachedStore, LRUObjectCache, McLRUCachedStoreException
+from mediawords.key_value_store.postgresql import PostgreSQLStore
+from mediawords.key_value_store.test_mock_download import TestMockDownloadTestCase
+
+
+class TestLRUCachedStoreTestCase(TestMockDownloadTestCase):
+    def _initialize_store(self) -> LRUCachedStore:
+        return LRUCachedStore(store=PostgreSQLStore(table='raw_downloads'), max_size=1024 * 1024)
+
+    def _expected_path_prefix(self) -> str:
+        return 'postgresql:'
+
+    def test_key_value_store(self):
+        self._test_key_value_store()
+
+    def test_fetch_contents(self):
+        self._test_fetch_contents()
+
+
+class _InMemoryStore(KeyValueStore):
+    """Store that keeps objects in a dict and counts fetches."""
+
+    def __init__(self):
+        self.objects = dict()
+        self.fetch_count = 0
+
+    def fetch_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bytes:
+        self.fetch_count += 1
+        if object_id not in self.objects:
+            raise McKeyValueStoreException("Object ID %d was not found." % object_id)
+        return self.objects[object_id]
+
+    def store_content(self, db: DatabaseHandler, object_id: int, content: Union[str, bytes]) -> str:
+        self.objects[object_id] = self._prepare_content(content)
+        return 'memory:%d' % object_id
+
+    def remove_content(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> None:
+        self.objects.pop(object_id, None)
+
+    def content_exists(self, db: DatabaseHandler, object_id: int, object_path: str = None) -> bool:
+        return object_id in self.objects
+
+
+def test_lru_cached_store_hits():
+    store = _InMemoryStore()
+    cached_store = LRUCachedStore(store=store, max_size=100)
+
+    cached_store.store_content(db=None, object_id=1, content=b'foo')
+
+    assert cached_store.fetch_content(db=None, object_id=1) == b'foo'
+    assert cached_store.fetch_content(db=None, object_id=1) == b'foo'
+    assert store.fetch_count == 1
+    assert cached_store.cache_size() == 3
+
+    # Overwritten object doesn't get served from cache
+    cached_store.store_content(db=None, object_id=1, content=b'bar')
+    assert cached_store.fetch_content(db=None, object_id=1) == b'bar'
+    assert store.fetch_count == 2
+
+    # Nor does a removed one
+    cached_store.remove_content(db=None, object_id=1)
+    assert cached_store.content_exists(db=None, object_id=1) is False
+    with pytest.raises(McKeyValueStoreException):
+        cached_store.fetch_content(db=None, object_id=1)
+    assert cached_store.cache_size() == 0
+
+
+def test_lru_cached_store_eviction():
+    store = _InMemoryStore()
+    cached_store = LRUCachedStore(store=store, max_size=10)
+
+    for object_id in range(1, 4):
+        store.store_content(db=None, object_id=object_id, content=b'x' * 4)
+
+    cached_store.fetch_content(db=None, object_id=1)
+    cached_store.fetch_content(db=None, object_id=2)
+
+    # Object 1 becomes the most recently used one
+    cached_store.fetch_content(db=None, object_id=1)
+    assert store.fetch_count == 2
+
+    # Object 2 gets evicted to fit object 3 in
+    cached_store.fetch_content(db=None, object_id=3)
+    assert cached_store.cache_size() == 8
+
+    cached_store.fetch_content(db=None, object_id=1)
+    assert store.fetch_count == 3
+
+    cached_store.fetch_content(db=None, object_id=2)
+    assert store.fetch_count == 4
+
+    # Objects bigger than the cache don't get cached at all
+    store.store_content(db=None, object_id=4, content=b'x' * 11)
+    cached_store.fetch_content(db=None, object_id=4)
+    cached_store.fetch_content(db=None, object_id=4)
+    assert store.fetch_count == 6
+    assert cached_store.cache_size() <= 10
+
+
+def test_lru_cached_store_ttl():
+    store = _InMemoryStore()
+    cached_store = LRUCachedStore(store=store, max_size=100, ttl=0.1)
+    assert cached_store.ttl() == 0.1
+
+    store.store_content(db=None, object_id=1, content=b'foo')
+
+    cached_store.fetch_content(db=None, object_id=1)
+    cached_store.fetch_content(db=None, object_id=1)
+    assert store.fetch_count == 1
+
+    time.sleep(0.2)
+
+    cached_store.fetch_content(db=None, object_id=1)
+    assert store.fetch_count == 2
+
+
+def test_lru_cached_store_fetch_contents():
+    store = _InMemoryStore()
+    cached_store = LRUCachedStore(store=store, max_size=100)
+
+    store.store_content(db=None, object_id=1, content=b'foo')
+    store.store_content(db=None, object_id=2, content=b'bar')
+
+    cached_store.fetch_content(db=None, object_id=1)
+    assert store.fetch_count == 1
+
+    # Only the objects missing from cache get fetched
+    assert cached_store.fetch_contents(db=None, object_ids=[1, 2, 3]) == {1: b'foo', 2: b'bar'}
+    assert store.fetch_count == 3
+
+    assert cached_store.fetch_contents(db=None, object_ids=[1, 2]) == {1: b'foo', 2: b'bar'}
+    assert store.fetch_count == 3
+
+
+def test_lru_cached_store_shared_cache():
+    cache = LRUObjectCache(max_size=10)
+
+    first_store = _InMemoryStore()
+    first_cached_store = LRUCachedStore(store=first_store, cache=cache)
+
+    second_store = _InMemoryStore()
+    second_cached_store = LRUCachedStore(store=second_store, cache=cache)
+
+    first_store.store_content(db=None, object_id=1, content=b'12345')
+    first_store.store_content(db=None, object_id=2, content=b'12345')
+    second_store.store_content(db=None, object_id=3, content=b'12345')
+
+    first_cached_store.fetch_content(db=None, object_id=1)
+    first_cached_store.fetch_content(db=None, object_id=2)
+    assert cache.cache_size() == 10
+
+    # Both stores stay within a single size limit
+    second_cached_store.fetch_content(db=None, object_id=3)
+    assert cache.cache_size() == 10
+    assert first_cached_store.cache_size() == second_cached_store.cache_size() == 10
+
+    # Least recently used object of the other store got evicted
+    first_cached_store.fetch_content(db=None, object_id=2)
+    assert first_store.fetch_count == 2
+    first_cached_store.fetch_content(db=None, object_id=1)
+    assert first_store.fetch_count == 3
+
+
+def test_lru_cached_store_invalid_arguments():
+    with pytest.raises(McLRUCachedStoreException):
+        # noinspection PyTypeChecker
+        LRUCachedStore(store=None, max_size=100)
+
+    with pytest.raises(McLRUCachedStoreException):
+        LRUCachedStore(store=_InMemoryStore(), max_size=0)
+
+    with pytest.raises(McLRUCachedStoreException):
+        LRUCachedStore(store=_InMemoryStore(), max_size=100, ttl=0)
+
+    with pytest.raises(McLRUCachedStoreException):
+        LRUCachedStore(store=_InMemoryStore(), max_size=100, cache=LRUObjectCache(max_size=100))
@@ -11,3 +11,6 @@ class TestPostgreSQLStoreTestCase(TestMockDownloadTestCase):
 
     def test_key_value_store(self):
         self._test_key_value_store()
+
+    def test_fetch_contents(self):
+        self._test_fetch_contents()
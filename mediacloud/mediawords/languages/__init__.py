@@ -24,6 +24,7 @@ end points, but the results will not be stemmed or get their stop words removed.
 """
 
 import abc
+import functools
 import os
 import re
 from typing import Dict, List
@@ -32,6 +33,7 @@ from nltk import TweetTokenizer
 from sentence_splitter import SentenceSplitter
 from Stemmer import Stemmer as PyStemmer
 
+from mediawords.languages.stop_words import McStopWordsException, language_stop_words, language_stop_words_map
 from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
@@ -81,6 +83,12 @@ class AbstractLanguage(object, metaclass=abc.ABCMeta):
         """
         raise NotImplementedError("Abstract method.")
 
+    def is_stop_word(self, words: List[str]) -> List[bool]:
+        """For a list of words, return a list of flags of whether each of the words is a stop word."""
+        words = decode_object_from_bytes_if_needed(words)
+        stop_words_map = self.stop_words_map()
+        return [word in stop_words_map for word in words]
+
     @abc.abstractmethod
     def stem_words(self, words: List[str]) -> List[str]:
         """Return list of stems for a list of words.
@@ -142,6 +150,18 @@ class SentenceSplitterMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
     # Max. text length to try to split into sentences
     __MAX_TEXT_LENGTH = 1024 * 1024
 
+    # Single line break between two other characters
+    __SINGLE_LINE_BREAK_REGEX = re.compile(r'([^\n])\n([^\n])')
+
+    # Line with a single list asterisk
+    __ASTERISK_LINE_REGEX = re.compile(r'\n\s\*\n')
+
+    # Run of spaces, tabs and non-breaking spaces
+    __SPACES_REGEX = re.compile(r'[ \t\xa0]+')
+
+    # Missing space after a sentence ending period
+    __MISSING_SPACE_AFTER_PERIOD_REGEX = re.compile(r'([a-z]{2,})\.([A-Z][a-z]+)')
+
     def __init__(self):
         """Constructor."""
         super().__init__()
@@ -149,6 +169,43 @@ class SentenceSplitterMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
         # SentenceSplitter instance (lazy initialized)
         self.__sentence_splitter = None
 
+    @staticmethod
+    def __normalize_text_before_splitting(text: str) -> str:
+        """Normalize line breaks, whitespace and punctuation in text before splitting it into sentences.
+
+        Steps are order-dependent; literal substitutions are done with str.replace(), and the rest of them use
+        precompiled regular expressions.
+        """
+
+        # Only "\n\n" (not a single "\n") denotes the end of sentence, so remove single line breaks
+        text = SentenceSplitterMixIn.__SINGLE_LINE_BREAK_REGEX.sub(r"\1 \2", text)
+
+        # Remove asterisks from lists
+        text = text.replace("  *", " ")
+
+        text = SentenceSplitterMixIn.__ASTERISK_LINE_REGEX.sub("\n\n", text)
+        text = text.replace("\n\n\n*", "\n\n")
+        text = text.replace("\n\n", "\n")
+
+        # Replace tabs and non-breaking spaces with normal spaces, and multiple spaces with a single space
+        text = SentenceSplitterMixIn.__SPACES_REGEX.sub(" ", text)
+
+        # The above regexp and HTML stripping often leave a space before the period at the end of a sentence (spaces
+        # have been collapsed already, so there's at most one)
+        text = text.replace(" .", ".")
+
+        # We see lots of cases of missing spaces after sentence ending periods (has a hardcoded lower limit of
+        # characters because otherwise it breaks Portuguese "a.C.." abbreviations and such)
+        text = SentenceSplitterMixIn.__MISSING_SPACE_AFTER_PERIOD_REGEX.sub(r"\1. \2", text)
+
+        # Replace Unicode's "…" with "..."
+        text = text.replace("…", "...")
+
+        # Trim whitespace from start / end of the whole string
+        text = text.strip()
+
+        return text
+
     def split_text_to_sentences(self, text: str) -> List[str]:
         """Splits text into sentences with "sentence_splitter" module.
 
@@ -174,37 +231,7 @@ class SentenceSplitterMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
         if len(text) > self.__MAX_TEXT_LENGTH:
             text = text[:self.__MAX_TEXT_LENGTH]
 
-        # Only "\n\n" (not a single "\n") denotes the end of sentence, so remove single line breaks
-        text = re.sub('([^\n])\n([^\n])', r"\1 \2", text, flags=re.DOTALL)
-
-        # Remove asterisks from lists
-        text = re.sub(r" {2}\*", " ", text, flags=re.DOTALL)
-
-        text = re.sub(r"\n\s\*\n", "\n\n", text, flags=re.DOTALL)
-        text = re.sub(r"\n\n\n\*", "\n\n", text, flags=re.DOTALL)
-        text = re.sub(r"\n\n", "\n", text, flags=re.DOTALL)
-
-        # Replace tabs with spaces
-        text = re.sub(r"\t", " ", text, flags=re.DOTALL)
-
-        # Replace non-breaking spaces with normal spaces
-        text = re.sub(r"\xa0", " ", text, flags=re.DOTALL)
-
-        # Replace multiple spaces with a single space
-        text = re.sub(" +", " ", text, flags=re.DOTALL)
-
-        # The above regexp and HTML stripping often leave a space before the period at the end of a sentence
-        text = re.sub(r" +\.", ".", text, flags=re.DOTALL)
-
-        # We see lots of cases of missing spaces after sentence ending periods (has a hardcoded lower limit of
-        # characters because otherwise it breaks Portuguese "a.C.." abbreviations and such)
-        text = re.sub(r"([a-z]{2,})\.([A-Z][a-z]+)", r"\1. \2", text, flags=re.DOTALL)
-
-        # Replace Unicode's "…" with "..."
-        text = text.replace("…", "...")
-
-        # Trim whitespace from start / end of the whole string
-        text = text.strip()
+        text = self.__normalize_text_before_splitting(text)
 
         # FIXME: fix "bla bla... yada yada"? is it two sentences?
         # FIXME: fix "text . . some more text."?
@@ -230,6 +257,10 @@ class SentenceSplitterMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
 class PyStemmerMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
     """Language which is supported by "PyStemmer" Python module."""
 
+    # Default max. number of word -> stem pairs to keep in every language's stem cache (news text vocabulary follows
+    # Zipf's law so a cache of the most frequent words gets most of the hits)
+    DEFAULT_STEM_CACHE_MAX_SIZE = 50 * 1000
+
     def __init__(self):
         """Constructor."""
         super().__init__()
@@ -237,15 +268,42 @@ class PyStemmerMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
         # PyStemmer instance (lazy initialized)
         self.__pystemmer = None
 
-    def stem_words(self, words: List[str]) -> List[str]:
-        """Stem list of words with PyStemmer."""
-        language_code = self.language_code()
-        words = decode_object_from_bytes_if_needed(words)
+        # Bounded word -> stem cache
+        self.__stem_word = None
+        self.set_stem_cache_max_size(self.DEFAULT_STEM_CACHE_MAX_SIZE)
+
+    def set_stem_cache_max_size(self, max_size: int) -> None:
+        """(Re)create stem cache with a given max. number of words to cache; 0 disables caching."""
+        if max_size is None or max_size < 0:
+            raise McLanguageException("Stem cache max. size must be a non-negative integer.")
+
+        self.__stem_word = functools.lru_cache(maxsize=max_size)(self.__stem_word_uncached)
+
+    def stem_cache_stats(self) -> Dict[str, int]:
+        """Return stem cache statistics: hits, misses, current and max. size."""
+        cache_info = self.__stem_word.cache_info()
+        return {
+            'hits': cache_info.hits,
+            'misses': cache_info.misses,
+            'size': cache_info.currsize,
+            'max_size': cache_info.maxsize,
+        }
+
+    def __stem_word_uncached(self, word: str) -> str:
+        """Stem a single word with PyStemmer."""
 
         # Normalize apostrophe so that "it’s" and "it's" get treated identically (it's being done in
         # _tokenize_with_spaces() too but let's not assume that all tokens that are to be stemmed go through sentence
         # tokenization first)
-        words = [word.replace("’", "'") for word in words]
+        word = word.replace("’", "'")
+
+        # Perl's Snowball implementation used to return lowercase stems
+        return self.__pystemmer.stemWord(word).lower()
+
+    def stem_words(self, words: List[str]) -> List[str]:
+        """Stem list of words with PyStemmer."""
+        language_code = self.language_code()
+        words = decode_object_from_bytes_if_needed(words)
 
         if language_code is None:
             raise McLanguageException("Language code is None.")
@@ -263,52 +321,35 @@ class PyStemmerMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
                     "Unable to initialize PyStemmer for language '%s': %s" % (language_code, str(ex),)
                 )
 
-        stems = self.__pystemmer.stemWords(words)
-
-        if len(words) != len(stems):
-            log.warning("Stem count is not the same as word count; words: %s; stems: %s" % (str(words), str(stems),))
-
-        # Perl's Snowball implementation used to return lowercase stems
-        stems = [stem.lower() for stem in stems]
+            # Stems get cached by our own cache
+            self.__pystemmer.maxCacheSize = 0
 
-        return stems
+        return [self.__stem_word(word) for word in words]
 
 
 class StopWordsFromFileMixIn(AbstractLanguage, metaclass=abc.ABCMeta):
-    """Language for which the stop words are being stored in "<language_code>/<language_code>_stop_words.txt" file."""
+    """Language for which the stop words are being stored in "<language_code>/<language_code>_stop_words.txt" file.
 
-    def __init__(self):
-        """Constructor."""
-
-        # Stop words map (lazy initialized)
-        self.__stop_words_map = None
+    Stop words are read once per process and shared by all language instances; see mediawords.languages.stop_words.
+    """
 
     def stop_words_map(self) -> Dict[str, bool]:
         """Return stop word map read from a file."""
-        if self.__stop_words_map is None:
-
-            stop_words_path = os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                self.language_code(),
-                '%s_stop_words.txt' % self.language_code(),
-            )
-            if stop_words_path is None:
-                raise McLanguageException("Stop words file path is None.")
+        try:
+            return language_stop_words_map(self.language_code())
+        except McStopWordsException as ex:
+            raise McLanguageException("Unable to load stop words: %s" % str(ex))
 
-            if not os.path.isfile(stop_words_path):
-                raise McLanguageException("Stop words file does not exist at path '%s'." % stop_words_path)
-
-            stop_words = dict()
-            with open(stop_words_path, 'r', encoding='utf-8') as f:
-                for stop_word in f.readlines():
-                    # Remove comments
-                    stop_word = re.sub(r'\s*?#.*?$', '', stop_word)
-
-                    stop_word = stop_word.strip()
+    def is_stop_word(self, words: List[str]) -> List[bool]:
+        """For a list of words, return a list of flags of whether each of the words is a stop word."""
+        words = decode_object_from_bytes_if_needed(words)
 
-                    if len(stop_word) > 0:
-                        stop_words[stop_word] = True
+        if words is None:
+            raise McLanguageException("Words to check is None.")
 
-            self.__stop_words_map = stop_words
+        try:
+            stop_words = language_stop_words(self.language_code())
+        except McStopWordsException as ex:
+            raise McLanguageException("Unable to load stop words: %s" % str(ex))
 
-        return self.__stop_words_map
+        return [word in stop_words for word in words]
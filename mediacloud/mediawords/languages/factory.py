@@ -1,64 +1,88 @@
-from typing import Union
-
-from mediawords.languages import AbstractLanguage
-from mediawords.languages.ca import CatalanLanguage
-from mediawords.languages.da import DanishLanguage
-from mediawords.languages.de import GermanLanguage
-from mediawords.languages.en import EnglishLanguage
-from mediawords.languages.es import SpanishLanguage
-from mediawords.languages.fi import FinnishLanguage
-from mediawords.languages.fr import FrenchLanguage
-from mediawords.languages.ha import HausaLanguage
-from mediawords.languages.hi import HindiLanguage
-from mediawords.languages.hu import HungarianLanguage
-from mediawords.languages.it import ItalianLanguage
-from mediawords.languages.ja import JapaneseLanguage
-from mediawords.languages.lt import LithuanianLanguage
-from mediawords.languages.nl import DutchLanguage
-from mediawords.languages.no import NorwegianLanguage
-from mediawords.languages.pt import PortugueseLanguage
-from mediawords.languages.ro import RomanianLanguage
-from mediawords.languages.ru import RussianLanguage
-from mediawords.languages.sv import SwedishLanguage
-from mediawords.languages.tr import TurkishLanguage
-from mediawords.languages.zh import ChineseLanguage
+import importlib
+import multiprocessing
+import os
+from typing import List, Type, Union
+
+from mediawords.languages import AbstractLanguage, McLanguageException
 from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
 log = create_logger(__name__)
 
 
+def _pool_initializer(language_codes: List[str]) -> None:
+    """Pre-initialize language instances (together with their lazily initialized splitters, tokenizers, etc.) in a
+    worker process of the language pool."""
+    for language_code in language_codes:
+        language = LanguageFactory.language_for_code(language_code)
+        if language is None:
+            continue
+
+        for sentence in language.split_text_to_sentences(language.sample_sentence()):
+            language.split_sentence_to_words(sentence)
+
+
+def _pool_split_texts_to_sentences(language_code: str, texts: List[str]) -> List[List[str]]:
+    """Split a chunk of texts into sentences in a worker process of the language pool."""
+    language = LanguageFactory.language_for_code(language_code)
+    return [language.split_text_to_sentences(text) for text in texts]
+
+
+def _pool_split_sentences_to_words(language_code: str, sentences: List[str]) -> List[List[str]]:
+    """Split a chunk of sentences into words in a worker process of the language pool."""
+    language = LanguageFactory.language_for_code(language_code)
+    return [language.split_sentence_to_words(sentence) for sentence in sentences]
+
+
 class LanguageFactory(object):
     """Language instance factory."""
 
-    # Supported + enabled language codes and their corresponding classes
+    # Supported + enabled language codes and their corresponding class names; classes get imported from
+    # "mediawords.languages.<language_code>" only on first use as some of the language modules pull in large
+    # dependencies (MeCab, Jieba, Hunspell dictionaries, etc.)
     __ENABLED_LANGUAGES = {
-        CatalanLanguage.language_code(): CatalanLanguage,
-        ChineseLanguage.language_code(): ChineseLanguage,
-        DanishLanguage.language_code(): DanishLanguage,
-        DutchLanguage.language_code(): DutchLanguage,
-        EnglishLanguage.language_code(): EnglishLanguage,
-        FinnishLanguage.language_code(): FinnishLanguage,
-        FrenchLanguage.language_code(): FrenchLanguage,
-        GermanLanguage.language_code(): GermanLanguage,
-        HausaLanguage.language_code(): HausaLanguage,
-        HindiLanguage.language_code(): HindiLanguage,
-        HungarianLanguage.language_code(): HungarianLanguage,
-        ItalianLanguage.language_code(): ItalianLanguage,
-        JapaneseLanguage.language_code(): JapaneseLanguage,
-        LithuanianLanguage.language_code(): LithuanianLanguage,
-        NorwegianLanguage.language_code(): NorwegianLanguage,
-        PortugueseLanguage.language_code(): PortugueseLanguage,
-        RomanianLanguage.language_code(): RomanianLanguage,
-        RussianLanguage.language_code(): RussianLanguage,
-        SpanishLanguage.language_code(): SpanishLanguage,
-        SwedishLanguage.language_code(): SwedishLanguage,
-        TurkishLanguage.language_code(): TurkishLanguage,
+        'ca': 'CatalanLanguage',
+        'da': 'DanishLanguage',
+        'de': 'GermanLanguage',
+        'en': 'EnglishLanguage',
+        'es': 'SpanishLanguage',
+        'fi': 'FinnishLanguage',
+        'fr': 'FrenchLanguage',
+        'ha': 'HausaLanguage',
+        'hi': 'HindiLanguage',
+        'hu': 'HungarianLanguage',
+        'it': 'ItalianLanguage',
+        'ja': 'JapaneseLanguage',
+        'lt': 'LithuanianLanguage',
+        'nl': 'DutchLanguage',
+        'no': 'NorwegianLanguage',
+        'pt': 'PortugueseLanguage',
+        'ro': 'RomanianLanguage',
+        'ru': 'RussianLanguage',
+        'sv': 'SwedishLanguage',
+        'tr': 'TurkishLanguage',
+        'zh': 'ChineseLanguage',
     }
 
+    # Default language code
+    __DEFAULT_LANGUAGE_CODE = 'en'
+
     # Static language object instances ({'language code': language object, ... })
     __language_instances = dict()
 
+    # Don't bother sending work to the pool if there are fewer items than this
+    __POOL_MIN_ITEMS = 100
+
+    # How many chunks per worker process to split pool's work into
+    __POOL_CHUNKS_PER_PROCESS = 4
+
+    # Process pool with warm language instances (lazy initialized)
+    __pool = None
+    __pool_processes = None
+
+    # Whether the pool couldn't be started, so the work has to be done in-process
+    __pool_unavailable = False
+
     @staticmethod
     def enabled_languages() -> set:
         """Return set of enabled languages (their codes)."""
@@ -76,6 +100,24 @@ class LanguageFactory(object):
 
         return language_code in LanguageFactory.__ENABLED_LANGUAGES
 
+    @staticmethod
+    def __language_class(language_code: str) -> Type[AbstractLanguage]:
+        """Import and return language class for an enabled language code."""
+
+        module_name = 'mediawords.languages.%s' % language_code
+        class_name = LanguageFactory.__ENABLED_LANGUAGES[language_code]
+
+        try:
+            module = importlib.import_module(module_name)
+        except Exception as ex:
+            raise McLanguageException("Unable to import language module '%s': %s" % (module_name, str(ex),))
+
+        language_class = getattr(module, class_name, None)
+        if language_class is None:
+            raise McLanguageException("Language class '%s' was not found in '%s'." % (class_name, module_name,))
+
+        return language_class
+
     @staticmethod
     def language_for_code(language_code: str) -> Union[AbstractLanguage, None]:
         """Return language module instance for the language code, None if language is not supported."""
@@ -86,7 +128,7 @@ class LanguageFactory(object):
             return None
 
         if language_code not in LanguageFactory.__language_instances:
-            language_class = LanguageFactory.__ENABLED_LANGUAGES[language_code]
+            language_class = LanguageFactory.__language_class(language_code)
             language = language_class()
             LanguageFactory.__language_instances[language_code] = language
 
@@ -95,9 +137,128 @@ class LanguageFactory(object):
     @staticmethod
     def default_language_code() -> str:
         """Return default language code ('en' for English)."""
-        return EnglishLanguage.language_code()
+        return LanguageFactory.__DEFAULT_LANGUAGE_CODE
 
     @staticmethod
     def default_language() -> AbstractLanguage:
         """Return default language module instance (English)."""
         return LanguageFactory.language_for_code(LanguageFactory.default_language_code())
+
+    @staticmethod
+    def __get_pool(language_code: str, processes: Union[int, None]) -> Union[multiprocessing.Pool, None]:
+        """Return process pool for splitting and tokenization, (re)creating it if needed; return None if the work is
+        to be done in-process.
+
+        Daemonic processes (e.g. Celery's prefork workers) are not allowed to have children, so the pool doesn't get
+        started in those."""
+
+        if LanguageFactory.__pool_unavailable:
+            return None
+
+        if multiprocessing.current_process().daemon:
+            log.info("Current process is a daemon, will split and tokenize in-process.")
+            LanguageFactory.__pool_unavailable = True
+            return None
+
+        if not processes:
+            processes = os.cpu_count() or 1
+
+        if LanguageFactory.__pool is not None and LanguageFactory.__pool_processes != processes:
+            LanguageFactory.shutdown_pool()
+
+        if LanguageFactory.__pool is None:
+            log.info("Starting language pool with {} processes...".format(processes))
+
+            # Worker processes keep their language instances warm between calls, so other languages will get
+            # initialized there on first use
+            warm_language_codes = sorted({language_code, LanguageFactory.default_language_code()})
+
+            try:
+                LanguageFactory.__pool = multiprocessing.Pool(
+                    processes=processes,
+                    initializer=_pool_initializer,
+                    initargs=(warm_language_codes,),
+                )
+            except Exception as ex:
+                log.warning("Unable to start language pool, will split and tokenize in-process: {}".format(ex))
+                LanguageFactory.__pool_unavailable = True
+                return None
+
+            LanguageFactory.__pool_processes = processes
+
+        return LanguageFactory.__pool
+
+    @staticmethod
+    def __map_over_pool(function, language_code: str, items: List[str], processes: Union[int, None]) -> List[List[str]]:
+        """Run function(language_code, chunk) over chunks of items in the pool, return flattened results in order."""
+
+        pool = LanguageFactory.__get_pool(language_code=language_code, processes=processes)
+        if pool is None:
+            return function(language_code, items)
+
+        chunk_count = LanguageFactory.__pool_processes * LanguageFactory.__POOL_CHUNKS_PER_PROCESS
+        chunk_size = max(1, -(-len(items) // chunk_count))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        results = []
+        for chunk_results in pool.starmap(function, [(language_code, chunk) for chunk in chunks]):
+            results.extend(chunk_results)
+
+        return results
+
+    @staticmethod
+    def split_many(texts: List[str], language_code: str, processes: int = None) -> List[List[str]]:
+        """Split a list of texts into sentences using a process pool; return a list of sentence lists.
+
+        Worker processes get started on first use and are kept around with the language instances initialized, so
+        subsequent calls don't have to pay for loading sentence splitters, dictionaries, etc. If "processes" is unset,
+        pool uses all CPU cores."""
+
+        texts = decode_object_from_bytes_if_needed(texts)
+        language_code = decode_object_from_bytes_if_needed(language_code)
+
+        language = LanguageFactory.language_for_code(language_code)
+        if language is None:
+            raise McLanguageException("Language '%s' is not enabled." % language_code)
+
+        if len(texts) < LanguageFactory.__POOL_MIN_ITEMS or processes == 1:
+            return _pool_split_texts_to_sentences(language_code=language_code, texts=texts)
+
+        return LanguageFactory.__map_over_pool(
+            function=_pool_split_texts_to_sentences,
+            language_code=language_code,
+            items=texts,
+            processes=processes,
+        )
+
+    @staticmethod
+    def tokenize_many(sentences: List[str], language_code: str, processes: int = None) -> List[List[str]]:
+        """Split a list of sentences into words using a process pool; return a list of word lists.
+
+        See split_many() for details about the process pool."""
+
+        sentences = decode_object_from_bytes_if_needed(sentences)
+        language_code = decode_object_from_bytes_if_needed(language_code)
+
+        language = LanguageFactory.language_for_code(language_code)
+        if language is None:
+            raise McLanguageException("Language '%s' is not enabled." % language_code)
+
+        if len(sentences) < LanguageFactory.__POOL_MIN_ITEMS or processes == 1:
+            return _pool_split_sentences_to_words(language_code=language_code, sentences=sentences)
+
+        return LanguageFactory.__map_over_pool(
+            function=_pool_split_sentences_to_words,
+            language_code=language_code,
+            items=sentences,
+            processes=processes,
+        )
+
+    @staticmethod
+    def shutdown_pool() -> None:
+        """Stop process pool used by split_many() and tokenize_many(), if it's running."""
+        if LanguageFactory.__pool is not None:
+            LanguageFactory.__pool.close()
+            LanguageFactory.__pool.join()
+            LanguageFactory.__pool = None
+            LanguageFactory.__pool_processes = None
@@ -0,0 +1,103 @@
+"""
+Stop words of languages.
+
+Stop word lists are stored as "<language_code>/<language_code>_stop_words.txt" text files with comments. Every process
+parses a language's list only once, on first use, into a frozen set (and a stop word map for the callers that need one)
+which all the instances of the language in the process share.
+
+"""
+
+import os
+import re
+import threading
+from typing import Dict, FrozenSet, List
+
+from mediawords.util.log import create_logger
+from mediawords.util.perl import decode_object_from_bytes_if_needed
+
+log = create_logger(__name__)
+
+# Comments in stop word files
+__COMMENT_REGEX = re.compile(r'\s*?#.*?$')
+
+
+class McStopWordsException(Exception):
+    """Stop words exception."""
+    pass
+
+
+def read_stop_words_file(stop_words_path: str) -> List[str]:
+    """Read stop words text file, return a list of stop words (without comments and empty lines)."""
+    stop_words_path = decode_object_from_bytes_if_needed(stop_words_path)
+
+    if not os.path.isfile(stop_words_path):
+        raise McStopWordsException("Stop words file does not exist at path '%s'." % stop_words_path)
+
+    stop_words = []
+    with open(stop_words_path, 'r', encoding='utf-8') as f:
+        for stop_word in f.readlines():
+            # Remove comments
+            stop_word = __COMMENT_REGEX.sub('', stop_word)
+
+            stop_word = stop_word.strip()
+
+            if len(stop_word) > 0:
+                stop_words.append(stop_word)
+
+    return stop_words
+
+
+def stop_words_file_path(language_code: str) -> str:
+    """Return path to the stop words text file of a language."""
+    language_code = decode_object_from_bytes_if_needed(language_code)
+
+    if not language_code:
+        raise McStopWordsException("Language code is empty.")
+
+    return os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        language_code,
+        '%s_stop_words.txt' % language_code,
+    )
+
+
+# Language code -> frozen set of stop words
+__language_stop_words = dict()
+
+# Language code -> stop word map (stop word -> True)
+__language_stop_words_maps = dict()
+
+__language_stop_words_lock = threading.Lock()
+
+
+def language_stop_words(language_code: str) -> FrozenSet[str]:
+    """Return (process-wide shared) set of stop words of a language."""
+    language_code = decode_object_from_bytes_if_needed(language_code)
+
+    stop_words = __language_stop_words.get(language_code, None)
+    if stop_words is None:
+        with __language_stop_words_lock:
+            stop_words = __language_stop_words.get(language_code, None)
+            if stop_words is None:
+                stop_words = frozenset(read_stop_words_file(stop_words_file_path(language_code)))
+                __language_stop_words[language_code] = stop_words
+
+    return stop_words
+
+
+def language_stop_words_map(language_code: str) -> Dict[str, bool]:
+    """Return (process-wide shared) stop word map (stop word -> True) of a language.
+
+    Callers are not supposed to modify the map."""
+    language_code = decode_object_from_bytes_if_needed(language_code)
+
+    stop_words_map = __language_stop_words_maps.get(language_code, None)
+    if stop_words_map is None:
+        stop_words = language_stop_words(language_code)
+        with __language_stop_words_lock:
+            stop_words_map = __language_stop_words_maps.get(language_code, None)
+            if stop_words_map is None:
+                stop_words_map = dict.fromkeys(stop_words, True)
+                __language_stop_words_maps[language_code] = stop_words_map
+
+    return stop_words_map
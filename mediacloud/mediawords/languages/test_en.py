@@ -40,6 +40,24 @@ class TestEnglishLanguage(TestCase):
         actual_stems = self.__tokenizer.stem_words(input_words)
         assert expected_stems == actual_stems
 
+    def test_stem_cache(self):
+        """Stem cache."""
+        language = EnglishLanguage()
+        language.set_stem_cache_max_size(2)
+
+        assert language.stem_words(["stemming", "stemming", "it’s", "it's"]) == ['stem', 'stem', 'it', 'it']
+        assert language.stem_words(["toasted"]) == ['toast']
+
+        stats = language.stem_cache_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 4
+        assert stats['size'] == 2
+        assert stats['max_size'] == 2
+
+        language.set_stem_cache_max_size(0)
+        assert language.stem_words(["stemming", "stemming"]) == ['stem', 'stem']
+        assert language.stem_cache_stats()['hits'] == 0
+
     def test_split_text_to_sentences_period_in_number(self):
         """Period in number."""
         input_text = "Sentence contain version 2.0 of the text. Foo."
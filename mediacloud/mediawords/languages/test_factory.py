@@ -1,10 +1,25 @@
+import importlib
+import multiprocessing
+import subprocess
+import sys
 from unittest import TestCase
 
+import pytest
+
+from mediawords.languages import McLanguageException
 from mediawords.languages.en import EnglishLanguage
 from mediawords.languages.factory import LanguageFactory
 from mediawords.languages.lt import LithuanianLanguage
 
 
+def _tokenize_many_in_daemon_process(sentences: list, results_queue: multiprocessing.Queue) -> None:
+    """Tokenize sentences from a daemonic process, e.g. the way a Celery worker would do it."""
+    try:
+        results_queue.put(('ok', LanguageFactory.tokenize_many(sentences=sentences, language_code='en', processes=2)))
+    except Exception as ex:
+        results_queue.put(('error', str(ex)))
+
+
 class TestLanguageFactory(TestCase):
 
     def test_enabled_languages(self):
@@ -30,8 +45,85 @@ class TestLanguageFactory(TestCase):
         assert LanguageFactory.language_for_code('') is None
         assert LanguageFactory.language_for_code('xx') is None
 
+    def test_enabled_language_classes(self):
+        for language_code in LanguageFactory.enabled_languages():
+            module = importlib.import_module('mediawords.languages.%s' % language_code)
+            language_classes = [
+                cls for cls in vars(module).values()
+                if isinstance(cls, type) and cls.__module__ == module.__name__
+            ]
+            assert len(language_classes) == 1
+            assert language_classes[0].language_code() == language_code
+
+    def test_language_modules_imported_lazily(self):
+        imported_language_modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; '
+            'from mediawords.languages.factory import LanguageFactory; '
+            'LanguageFactory.language_for_code("en"); '
+            'print(" ".join(sorted(m for m in sys.modules if m.startswith("mediawords.languages."))))',
+        ]).decode('utf-8').split()
+
+        assert 'mediawords.languages.en' in imported_language_modules
+        assert 'mediawords.languages.ja' not in imported_language_modules
+        assert 'mediawords.languages.zh' not in imported_language_modules
+
     def test_default_language_code(self):
         assert LanguageFactory.default_language_code() == 'en'
 
     def test_default_language(self):
         assert isinstance(LanguageFactory.default_language(), EnglishLanguage)
+
+    def test_split_many(self):
+        language = LanguageFactory.language_for_code('en')
+        texts = ['{} Sentence number {}.'.format(language.sample_sentence(), x) for x in range(200)]
+
+        try:
+            assert LanguageFactory.split_many(texts=texts, language_code='en', processes=2) == [
+                language.split_text_to_sentences(text) for text in texts
+            ]
+
+            # Small batches get processed in the same process
+            assert LanguageFactory.split_many(texts=texts[:2], language_code='en') == [
+                language.split_text_to_sentences(text) for text in texts[:2]
+            ]
+
+            with pytest.raises(McLanguageException):
+                LanguageFactory.split_many(texts=texts, language_code='xx')
+
+        finally:
+            LanguageFactory.shutdown_pool()
+
+    def test_tokenize_many(self):
+        language = LanguageFactory.language_for_code('lt')
+        sentences = ['{} {}'.format(language.sample_sentence(), x) for x in range(200)]
+
+        try:
+            assert LanguageFactory.tokenize_many(sentences=sentences, language_code='lt', processes=2) == [
+                language.split_sentence_to_words(sentence) for sentence in sentences
+            ]
+
+            with pytest.raises(McLanguageException):
+                LanguageFactory.tokenize_many(sentences=sentences, language_code='xx')
+
+        finally:
+            LanguageFactory.shutdown_pool()
+
+    def test_tokenize_many_in_daemon_process(self):
+        language = LanguageFactory.language_for_code('en')
+        sentences = ['{} {}'.format(language.sample_sentence(), x) for x in range(200)]
+
+        results_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_tokenize_many_in_daemon_process,
+            args=(sentences, results_queue,),
+            daemon=True,
+        )
+        process.start()
+
+        # Daemon can't start a pool of its own so it should fall back to tokenizing in-process
+        status, results = results_queue.get(timeout=60)
+        process.join()
+
+        assert status == 'ok', results
+        assert results == [language.split_sentence_to_words(sentence) for sentence in sentences]
@@ -0,0 +1,70 @@
+import os
+import re
+from typing import List
+
+from sentence_splitter import SentenceSplitter
+
+from mediawords.languages import SentenceSplitterMixIn
+from mediawords.languages.factory import LanguageFactory
+from mediawords.util.parse_html import html_strip
+from mediawords.util.paths import mc_root_path
+
+
+def _reference_normalize_text(text: str) -> str:
+    """Text normalization as it was done before it got rewritten to use precompiled regular expressions."""
+    text = re.sub('([^\n])\n([^\n])', r"\1 \2", text, flags=re.DOTALL)
+    text = re.sub(r" {2}\*", " ", text, flags=re.DOTALL)
+    text = re.sub(r"\n\s\*\n", "\n\n", text, flags=re.DOTALL)
+    text = re.sub(r"\n\n\n\*", "\n\n", text, flags=re.DOTALL)
+    text = re.sub(r"\n\n", "\n", text, flags=re.DOTALL)
+    text = re.sub(r"\t", " ", text, flags=re.DOTALL)
+    text = re.sub(r"\xa0", " ", text, flags=re.DOTALL)
+    text = re.sub(" +", " ", text, flags=re.DOTALL)
+    text = re.sub(r" +\.", ".", text, flags=re.DOTALL)
+    text = re.sub(r"([a-z]{2,})\.([A-Z][a-z]+)", r"\1. \2", text, flags=re.DOTALL)
+    text = text.replace("…", "...")
+    text = text.strip()
+    return text
+
+
+def _reference_split_text_to_sentences(language_code: str, text: str) -> List[str]:
+    """Split text into sentences using the reference normalization."""
+    text = _reference_normalize_text(text)
+    if len(text) == 0:
+        return []
+
+    sentences = SentenceSplitter(language=language_code).split(text=text)
+
+    return [sentence.strip() for sentence in sentences if len(sentence.strip()) > 0]
+
+
+def _golden_texts(sample_sentence: str) -> List[str]:
+    """Return texts with whitespace, list and punctuation quirks that normalization is supposed to deal with."""
+    html_path = os.path.join(mc_root_path(), 'mediacloud', 'test-data', 'html', 'strip.html')
+    with open(html_path, 'r', encoding='utf-8') as f:
+        html_text = html_strip(f.read())
+
+    return [
+        '',
+        ' \n\t\xa0 ',
+        sample_sentence,
+        "{s}\n{s}\n\n{s}\n\n\n{s}".format(s=sample_sentence),
+        "{s}  * {s}\n * \n{s}\n\n\n* {s}".format(s=sample_sentence),
+        "{s}\t\t{s}\xa0\xa0 {s} .{s}   .".format(s=sample_sentence),
+        "Missing space after period.Next sentence is here.Another one… And another…{s}".format(s=sample_sentence),
+        "Portuguese abbreviation a.C.. and version 2.0 of text . . {s}".format(s=sample_sentence),
+        html_text,
+    ]
+
+
+def test_split_text_to_sentences_golden_output():
+    """Make sure that sentences are byte-identical to the ones from the reference normalization."""
+    for language_code in sorted(LanguageFactory.enabled_languages()):
+        language = LanguageFactory.language_for_code(language_code)
+        if not isinstance(language, SentenceSplitterMixIn):
+            continue
+
+        for text in _golden_texts(sample_sentence=language.sample_sentence()):
+            expected_sentences = _reference_split_text_to_sentences(language_code=language_code, text=text)
+            actual_sentences = language.split_text_to_sentences(text)
+            assert actual_sentences == expected_sentences, "Language: {}, text: {}".format(language_code, text)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from mediawords.languages.stop_words import (
+    language_stop_words,
+    language_stop_words_map,
+    McStopWordsException,
+    read_stop_words_file,
+    stop_words_file_path,
+)
+
+
+class TestStopWords(TestCase):
+
+    def setUp(self):
+        self.__temp_dir = tempfile.mkdtemp('test')
+        self.__stop_words_path = os.path.join(self.__temp_dir, 'xx_stop_words.txt')
+        with open(self.__stop_words_path, 'w', encoding='utf-8') as f:
+            f.write("# Comment\n\nthe\nand  # Trailing comment\n\n  été\nthe\nдля\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.__temp_dir)
+
+    def test_read_stop_words_file(self):
+        assert read_stop_words_file(self.__stop_words_path) == ['the', 'and', 'été', 'the', 'для']
+
+        with pytest.raises(McStopWordsException):
+            read_stop_words_file(os.path.join(self.__temp_dir, 'does_not_exist.txt'))
+
+    def test_stop_words_file_path(self):
+        assert stop_words_file_path('en').endswith(os.path.join('languages', 'en', 'en_stop_words.txt'))
+
+        with pytest.raises(McStopWordsException):
+            stop_words_file_path('')
+
+
+def test_language_stop_words():
+    stop_words = language_stop_words('en')
+    assert isinstance(stop_words, frozenset)
+    assert 'the' in stop_words
+    assert 'elephant' not in stop_words
+
+    # Shared by all callers in a process
+    assert language_stop_words('en') is stop_words
+
+    with pytest.raises(McStopWordsException):
+        language_stop_words('xx')
+
+
+def test_language_stop_words_map():
+    stop_words_map = language_stop_words_map('en')
+    assert stop_words_map == dict.fromkeys(language_stop_words('en'), True)
+
+    # Cached per language code, not per language instance
+    assert language_stop_words_map('en') is stop_words_map
+    assert language_stop_words_map('de') is not stop_words_map
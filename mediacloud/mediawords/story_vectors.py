@@ -1,22 +1,57 @@
+import datetime
 import re
-from typing import List, Dict
+import time
+from typing import Any, List, Dict, Union
 
 from mediawords.db import DatabaseHandler
 from mediawords.dbi.stories.ap import is_syndicated
 from mediawords.dbi.stories.extract import get_text_for_word_counts
 from mediawords.dbi.stories.extractor_arguments import PyExtractorArguments
 from mediawords.languages.factory import LanguageFactory
-from mediawords.util.identify_language import language_code_for_text, identification_would_be_reliable
+from mediawords.util.identify_language import (
+    language_code_for_text,
+    language_codes_for_texts,
+    identification_would_be_reliable,
+)
 from mediawords.util.log import create_logger
 from mediawords.util.perl import decode_object_from_bytes_if_needed
 
 log = create_logger(__name__)
 
+# Temporary table to COPY new story sentences into before deduplicating and inserting them
+__STORY_SENTENCES_STAGING_TABLE = '_story_sentences_staging'
 
-class McMediumIsLockedException(Exception):
-    """medium_is_locked() exception.
+# Number of low bits of a medium week lock key that hold the week number
+__MEDIUM_WEEK_LOCK_WEEK_BITS = 20
 
-    If thrown, doesn't mean that medium is (un)locked, just that an error has occurred while testing if it is."""
+# Monday from which week numbers of medium week locks are counted
+__MEDIUM_WEEK_LOCK_EPOCH = datetime.date(1970, 1, 5)
+
+# Initial and max. delay (in seconds) between attempts to get a medium week lock while waiting for it
+__MEDIUM_WEEK_LOCK_MIN_POLL_INTERVAL = 0.01
+__MEDIUM_WEEK_LOCK_MAX_POLL_INTERVAL = 0.5
+
+# Max. time (in seconds) that _insert_story_sentences() waits for a medium week lock
+__INSERT_STORY_SENTENCES_LOCK_TIMEOUT = 60
+
+# Savepoint that _insert_story_sentences() rolls back to on errors in caller's transaction
+__INSERT_STORY_SENTENCES_SAVEPOINT = 'insert_story_sentences'
+
+
+class McMediumWeekIsLockedException(Exception):
+    """medium_week_is_locked() exception.
+
+    If thrown, doesn't mean that medium week is (un)locked, just that an error has occurred while testing if it is."""
+    pass
+
+
+class McInsertStorySentencesException(Exception):
+    """_insert_story_sentences() exception."""
+    pass
+
+
+class McStorySentencesLockTimeoutException(McInsertStorySentencesException):
+    """_insert_story_sentences() exception thrown when the medium week lock couldn't be acquired in time."""
     pass
 
 
@@ -25,49 +60,110 @@ class McUpdateStorySentencesAndLanguageException(Exception):
     pass
 
 
-def medium_is_locked(db: DatabaseHandler, media_id: int) -> bool:
-    """Use a new blocking check to see if the given media_id is locked by a postgres advisory lock (used within
-    _insert_story_sentences below). Return True if it is locked, False otherwise."""
+def medium_week_lock_key(media_id: int, publish_date: Union[str, datetime.datetime]) -> int:
+    """Return key of a postgres advisory lock that serializes deduplication of sentences of a medium's stories
+    published on the same week as "publish_date" (deduplication doesn't look beyond that week).
+
+    Keys are single bigint values so that they don't conflict with two key locks from mediawords.db.locks."""
 
     if isinstance(media_id, bytes):
         media_id = decode_object_from_bytes_if_needed(media_id)
     media_id = int(media_id)
 
-    got_lock = db.query("SELECT pg_try_advisory_lock(%(media_id)s)", {'media_id': media_id}).flat()[0]
-    if got_lock:
-        db.query("SELECT pg_advisory_unlock(%(media_id)s)", {'media_id': media_id})
+    publish_date = decode_object_from_bytes_if_needed(publish_date)
+
+    # Both "YYYY-MM-DD HH:MM:SS" strings and datetime objects start with the date
+    publish_day = datetime.datetime.strptime(str(publish_date)[:10], '%Y-%m-%d').date()
+
+    # Same week as week_start_date() in PostgreSQL, i.e. starting on Monday
+    week_number = (publish_day - __MEDIUM_WEEK_LOCK_EPOCH).days // 7
+
+    week_mask = (1 << __MEDIUM_WEEK_LOCK_WEEK_BITS) - 1
+
+    return (media_id << __MEDIUM_WEEK_LOCK_WEEK_BITS) | (week_number & week_mask)
+
+
+def lock_medium_week(db: DatabaseHandler,
+                     media_id: int,
+                     publish_date: Union[str, datetime.datetime],
+                     timeout: Union[float, None] = None) -> bool:
+    """Get the medium week lock for the medium and publish date.
+
+    If "timeout" is None, block until the lock gets acquired; otherwise, retry getting it for up to "timeout" seconds
+    (with 0 meaning a single attempt). Return True if the lock was acquired, False otherwise.
+
+    The lock is a session one and has to be released with unlock_medium_week()."""
+
+    lock_key = medium_week_lock_key(media_id=media_id, publish_date=publish_date)
+
+    if isinstance(timeout, bytes):
+        timeout = decode_object_from_bytes_if_needed(timeout)
+
+    if timeout is None:
+        db.query("SELECT pg_advisory_lock(%(lock_key)s)", {'lock_key': lock_key})
+        return True
+
+    deadline = time.monotonic() + float(timeout)
+    poll_interval = __MEDIUM_WEEK_LOCK_MIN_POLL_INTERVAL
+
+    while True:
+        got_lock = db.query("SELECT pg_try_advisory_lock(%(lock_key)s)", {'lock_key': lock_key}).flat()[0]
+        if got_lock:
+            return True
+
+        remaining_time = deadline - time.monotonic()
+        if remaining_time <= 0:
+            return False
+
+        time.sleep(min(poll_interval, remaining_time))
+        poll_interval = min(poll_interval * 2, __MEDIUM_WEEK_LOCK_MAX_POLL_INTERVAL)
+
+
+def unlock_medium_week(db: DatabaseHandler, media_id: int, publish_date: Union[str, datetime.datetime]) -> None:
+    """Release the medium week lock acquired with lock_medium_week()."""
+
+    lock_key = medium_week_lock_key(media_id=media_id, publish_date=publish_date)
+
+    db.query("SELECT pg_advisory_unlock(%(lock_key)s)", {'lock_key': lock_key})
+
+
+def medium_week_is_locked(db: DatabaseHandler, media_id: int, publish_date: Union[str, datetime.datetime]) -> bool:
+    """Use a new blocking check to see if the medium week of the given media_id and publish date is locked by a
+    postgres advisory lock (used within _insert_story_sentences below). Return True if it is locked, False otherwise."""
+
+    try:
+        got_lock = lock_medium_week(db=db, media_id=media_id, publish_date=publish_date, timeout=0)
+        if got_lock:
+            unlock_medium_week(db=db, media_id=media_id, publish_date=publish_date)
+
+    except Exception as ex:
+        raise McMediumWeekIsLockedException("Unable to test if medium week is locked: {}".format(ex))
 
     return not got_lock
 
 
-def _get_db_escaped_story_sentence_dicts(
-        db: DatabaseHandler,
-        story: dict,
-        sentences: List[str],
-) -> List[Dict[str, str]]:
-    """Given a list of text sentences, return a list of sentences with properly escaped values for insertion."""
+def _get_story_sentence_dicts(story: dict, sentences: List[str]) -> List[Dict[str, Any]]:
+    """Given a list of text sentences, return a list of sentence dicts with their numbers and identified languages."""
     story = decode_object_from_bytes_if_needed(story)
     sentences = decode_object_from_bytes_if_needed(sentences)
 
+    # Identify the language of each of the sentences
+    sentence_langs = language_codes_for_texts(sentences)
+
     sentence_dicts = []
 
     sentence_num = 0
-    for sentence in sentences:
+    for sentence, sentence_lang in zip(sentences, sentence_langs):
 
-        # Identify the language of each of the sentences
-        sentence_lang = language_code_for_text(sentence)
         if (sentence_lang or '') != (story['language'] or ''):
             # Mark the language as unknown if the results for the sentence are not reliable
             if not identification_would_be_reliable(text=sentence):
                 sentence_lang = ''
 
         sentence_dicts.append({
-            'sentence': db.quote_varchar(sentence),
-            'language': db.quote_varchar(sentence_lang),
-            'sentence_number': str(sentence_num),
-            'stories_id': str(story['stories_id']),
-            'media_id': str(story['media_id']),
-            'publish_date': db.quote_timestamp(story['publish_date']),
+            'sentence_number': sentence_num,
+            'sentence': sentence,
+            'language': sentence_lang,
         })
 
         sentence_num += 1
@@ -75,6 +171,104 @@ def _get_db_escaped_story_sentence_dicts(
     return sentence_dicts
 
 
+def _copy_sentences_to_staging_table(db: DatabaseHandler, sentence_dicts: List[Dict[str, Any]]) -> None:
+    """(Re)create a temporary sentence staging table for the current transaction and COPY the sentences into it.
+
+    Sentences get streamed to the server instead of being embedded into the query itself, so the size of the
+    insertion query (and the time it takes to parse and plan it) doesn't depend on the number of sentences.
+    """
+    sentence_dicts = decode_object_from_bytes_if_needed(sentence_dicts)
+
+    if not db.in_transaction():
+        raise McInsertStorySentencesException("Sentences can only be staged within a transaction.")
+
+    db.query("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {table} (
+            sentence_number INT         NOT NULL,
+            sentence        TEXT        NOT NULL,
+            language        VARCHAR(3)  NULL
+        ) ON COMMIT DROP
+    """.format(table=__STORY_SENTENCES_STAGING_TABLE))
+
+    # Might have been used by a previous story within the same transaction
+    db.query("TRUNCATE {table}".format(table=__STORY_SENTENCES_STAGING_TABLE))
+
+    copy = db.copy_from("COPY {table} (sentence_number, sentence, language) FROM STDIN".format(
+        table=__STORY_SENTENCES_STAGING_TABLE,
+    ))
+
+    # Unreliably identified (empty) language gets written as an empty string, and missing one (None) as NULL
+    copy.put_rows(
+        (sentence_dict['sentence_number'], sentence_dict['sentence'], sentence_dict['language'],)
+        for sentence_dict in sentence_dicts
+    )
+
+    copy.end()
+
+
+def _claim_sentence_hashes(db: DatabaseHandler, media_id: int, publish_date: str) -> Union[int, None]:
+    """Add hashes of the staged sentences to the medium's and week's sentence deduplication index.
+
+    Returns number of hashes that were already in the index, i.e. of the staged sentences that might be duplicates of
+    sentences already in "story_sentences"; if zero, none of them are, so deduplication can be skipped. Returns None if
+    the week is too old to be indexed (see story_sentence_hashes_start_date()), so deduplication has to be run.
+    """
+    publish_date = decode_object_from_bytes_if_needed(publish_date)
+
+    # Hashes get inserted in a sorted order so that concurrent claims of the same ones don't deadlock
+    return db.query("""
+        -- noinspection SqlResolve
+        WITH new_hashes AS (
+            SELECT DISTINCT half_md5(sentence) AS sentence_half_md5
+            FROM {staging_table}
+        ),
+        claimed_hashes AS (
+            INSERT INTO story_sentence_hashes (media_id, week_start_date, sentence_half_md5)
+                SELECT
+                    %(media_id)s,
+                    week_start_date(%(publish_date)s::date),
+                    sentence_half_md5
+                FROM new_hashes
+                WHERE week_start_date(%(publish_date)s::date) >= story_sentence_hashes_start_date()
+                ORDER BY sentence_half_md5
+            ON CONFLICT DO NOTHING
+            RETURNING sentence_half_md5
+        )
+        SELECT CASE
+            WHEN week_start_date(%(publish_date)s::date) >= story_sentence_hashes_start_date()
+            THEN (SELECT COUNT(*) FROM new_hashes) - (SELECT COUNT(*) FROM claimed_hashes)
+        END AS known_hash_count
+    """.format(staging_table=__STORY_SENTENCES_STAGING_TABLE), {
+        'media_id': media_id,
+        'publish_date': publish_date,
+    }).flat()[0]
+
+
+def claim_story_sentence_hashes(db: DatabaseHandler, stories_id: int) -> None:
+    """Add hashes of the story's sentences in "story_sentences" to the sentence deduplication index.
+
+    To be used for sentences that get into "story_sentences" without going through _insert_story_sentences(), e.g. the
+    ones copied from another story, so that sentences of later stories get deduplicated against them.
+    """
+    if isinstance(stories_id, bytes):
+        stories_id = decode_object_from_bytes_if_needed(stories_id)
+    stories_id = int(stories_id)
+
+    # Hashes get inserted in a sorted order so that concurrent claims of the same ones don't deadlock
+    db.query("""
+        INSERT INTO story_sentence_hashes (media_id, week_start_date, sentence_half_md5)
+            SELECT DISTINCT
+                media_id,
+                week_start_date(publish_date::date),
+                half_md5(sentence)
+            FROM story_sentences
+            WHERE stories_id = %(stories_id)s
+              AND week_start_date(publish_date::date) >= story_sentence_hashes_start_date()
+            ORDER BY 1, 2, 3
+        ON CONFLICT DO NOTHING
+    """, {'stories_id': stories_id})
+
+
 def _get_unique_sentences_in_story(sentences: List[str]) -> List[str]:
     """Get unique sentences from the list, maintaining the original order."""
     sentences = decode_object_from_bytes_if_needed(sentences)
@@ -99,6 +293,10 @@ def _insert_story_sentences(
     """Insert the story sentences into story_sentences, optionally skipping duplicate sentences by setting is_dup = 't'
     to the found duplicates that are already in the table.
 
+    Sentence hashes get claimed in the "story_sentence_hashes" deduplication index first; if none of them were there
+    already, the story has no duplicate sentences so the (slower) is_dup UPDATE gets skipped and the medium week's
+    advisory lock gets released before the insertion.
+
     Returns list of sentences that were inserted into the table.
     """
 
@@ -111,23 +309,22 @@ def _insert_story_sentences(
     stories_id = story['stories_id']
     media_id = story['media_id']
 
-    # Story's publish date is the same for all the sentences, so we might as well pass it as a constant
-    escaped_story_publish_date = db.quote_date(story['publish_date'])
-
     if len(sentences) == 0:
         log.warning("Story sentences are empty for story {}.".format(stories_id))
         return []
 
-    if no_dedup_sentences:
-        log.debug("Won't de-duplicate sentences for story {} because 'no_dedup_sentences' is set.".format(stories_id))
+    no_dedup_sentences_statement = """
 
-        dedup_sentences_statement = """
+        -- Nothing to deduplicate, return empty list
+        SELECT NULL AS sentence
+        WHERE 1 = 0
 
-            -- Nothing to deduplicate, return empty list
-            SELECT NULL
-            WHERE 1 = 0
+    """
 
-        """
+    if no_dedup_sentences:
+        log.debug("Won't de-duplicate sentences for story {} because 'no_dedup_sentences' is set.".format(stories_id))
+
+        dedup_sentences_statement = no_dedup_sentences_statement
 
     else:
 
@@ -141,38 +338,20 @@ def _insert_story_sentences(
             -- noinspection SqlResolve
             UPDATE story_sentences
             SET is_dup = 't'
-            FROM new_sentences
+            FROM {staging_table} AS new_sentences
             WHERE half_md5(story_sentences.sentence) = half_md5(new_sentences.sentence)
-              AND week_start_date(story_sentences.publish_date::date) = week_start_date({})
-              AND story_sentences.media_id = new_sentences.media_id
+              AND week_start_date(story_sentences.publish_date::date) = week_start_date(%(publish_date)s::date)
+              AND story_sentences.media_id = %(media_id)s
             RETURNING story_sentences.sentence
 
-        """.format(escaped_story_publish_date)
-
-    # Convert to list of dicts (values escaped for insertion into database)
-    sentence_dicts = _get_db_escaped_story_sentence_dicts(db=db, story=story, sentences=sentences)
+        """.format(staging_table=__STORY_SENTENCES_STAGING_TABLE)
 
-    # Ordered list of columns
-    story_sentences_columns = sorted(sentence_dicts[0].keys())
-    str_story_sentences_columns = ', '.join(story_sentences_columns)
+    sentence_dicts = _get_story_sentence_dicts(story=story, sentences=sentences)
 
-    # List of sentences (in predefined column order)
-    new_sentences_sql = []
-    for sentence_dict in sentence_dicts:
-        new_sentence_sql = []
-        for column in story_sentences_columns:
-            new_sentence_sql.append(sentence_dict[column])
-        new_sentences_sql.append('({})'.format(', '.join(new_sentence_sql)))
-    str_new_sentences_sql = "\n{}".format(",\n".join(new_sentences_sql))
-
-    sql = """
+    insert_sql = """
 
         -- noinspection SqlType,SqlResolve
-        WITH new_sentences ({str_story_sentences_columns}) AS (VALUES
-            -- New sentences to potentially insert
-            {str_new_sentences_sql}
-        ),
-        duplicate_sentences AS (
+        WITH duplicate_sentences AS (
             -- Either a list of duplicate sentences already found in the table or an empty list if deduplication is
             -- disabled
             --
@@ -180,32 +359,119 @@ def _insert_story_sentences(
             -- if you are reextracting a story, DELETE its sentences from "story_sentences" before running this query.
             {dedup_sentences_statement}
         )
-        INSERT INTO story_sentences ({str_story_sentences_columns})
-        SELECT {str_story_sentences_columns}
-        FROM new_sentences
-        WHERE sentence NOT IN (
+        INSERT INTO story_sentences (sentence, language, sentence_number, stories_id, media_id, publish_date)
+        SELECT
+            new_sentences.sentence,
+            new_sentences.language,
+            new_sentences.sentence_number,
+            %(stories_id)s,
+            %(media_id)s,
+            %(publish_date)s::timestamp
+        FROM {staging_table} AS new_sentences
+        WHERE new_sentences.sentence NOT IN (
             -- Skip the ones for which we've just set is_dup = 't'
             SELECT sentence
             FROM duplicate_sentences
         )
+        ORDER BY new_sentences.sentence_number
         RETURNING story_sentences.sentence
 
-    """.format(
-        str_story_sentences_columns=str_story_sentences_columns,
-        str_new_sentences_sql=str_new_sentences_sql,
-        dedup_sentences_statement=dedup_sentences_statement,
+    """
+
+    use_transaction = not db.in_transaction()
+
+    if use_transaction:
+        db.begin()
+
+    # Stream sentences to the staging table before taking the lock so that it's being held for a shorter time
+    _copy_sentences_to_staging_table(db=db, sentence_dicts=sentence_dicts)
+
+    log.debug("Adding advisory lock on media ID {}, publish date {}...".format(media_id, story['publish_date']))
+    got_lock = lock_medium_week(
+        db=db,
+        media_id=media_id,
+        publish_date=story['publish_date'],
+        timeout=__INSERT_STORY_SENTENCES_LOCK_TIMEOUT,
     )
+    if not got_lock:
+        if use_transaction:
+            db.rollback()
+
+        raise McStorySentencesLockTimeoutException(
+            "Unable to lock medium {}, publish date {} within {} seconds.".format(
+                media_id, story['publish_date'], __INSERT_STORY_SENTENCES_LOCK_TIMEOUT,
+            )
+        )
+
+    # Session-level advisory lock can't be released in an aborted transaction, so a failed query gets rolled back (to
+    # a savepoint if it's the caller's transaction) before unlocking
+    if not use_transaction:
+        db.query("SAVEPOINT {}".format(__INSERT_STORY_SENTENCES_SAVEPOINT))
+
+    holding_lock = True
 
-    log.debug("Adding advisory lock on media ID {}...".format(media_id))
-    db.query("SELECT pg_advisory_lock(%(media_id)s)", {'media_id': media_id})
+    try:
 
-    log.debug("Running sentence insertion + deduplication query:\n{}".format(sql))
+        # Hashes get claimed even if deduplication is disabled so that later stories get deduplicated against these
+        # sentences
+        known_hash_count = _claim_sentence_hashes(db=db, media_id=media_id, publish_date=story['publish_date'])
+
+        insert_params = {
+            'stories_id': stories_id,
+            'media_id': media_id,
+            'publish_date': story['publish_date'],
+        }
 
-    # Insert sentences
-    inserted_sentences = db.query(sql).flat()
+        if no_dedup_sentences or known_hash_count == 0:
 
-    log.debug("Removing advisory lock on media ID {}...".format(media_id))
-    db.query("SELECT pg_advisory_unlock(%(media_id)s)", {'media_id': media_id})
+            # Sentences whose hashes were just claimed can't be in "story_sentences" yet, and concurrent writers of the
+            # same sentences will wait for this transaction to commit on claiming their hashes, so there's no need to
+            # keep the lock while inserting
+            log.debug("Removing advisory lock on media ID {}, publish date {}...".format(
+                media_id, story['publish_date'],
+            ))
+            unlock_medium_week(db=db, media_id=media_id, publish_date=story['publish_date'])
+            holding_lock = False
+
+            sql = insert_sql.format(
+                dedup_sentences_statement=no_dedup_sentences_statement,
+                staging_table=__STORY_SENTENCES_STAGING_TABLE,
+            )
+
+            log.debug("Running sentence insertion query:\n{}".format(sql))
+
+            inserted_sentences = db.query(sql, insert_params).flat()
+
+        else:
+
+            sql = insert_sql.format(
+                dedup_sentences_statement=dedup_sentences_statement,
+                staging_table=__STORY_SENTENCES_STAGING_TABLE,
+            )
+
+            log.debug("Running sentence insertion + deduplication query for {} possible duplicates:\n{}".format(
+                known_hash_count, sql,
+            ))
+
+            # Insert sentences
+            inserted_sentences = db.query(sql, insert_params).flat()
+
+    except Exception:
+        if use_transaction:
+            db.rollback()
+        else:
+            db.query("ROLLBACK TO SAVEPOINT {}".format(__INSERT_STORY_SENTENCES_SAVEPOINT))
+        raise
+
+    finally:
+        if holding_lock:
+            log.debug("Removing advisory lock on media ID {}, publish date {}...".format(
+                media_id, story['publish_date'],
+            ))
+            unlock_medium_week(db=db, media_id=media_id, publish_date=story['publish_date'])
+
+    if not use_transaction:
+        db.query("RELEASE SAVEPOINT {}".format(__INSERT_STORY_SENTENCES_SAVEPOINT))
 
     db.query("""
         UPDATE media_stats
@@ -218,6 +484,9 @@ def _insert_story_sentences(
         'publish_date': story['publish_date'],
     })
 
+    if use_transaction:
+        db.commit()
+
     return inserted_sentences
 
 
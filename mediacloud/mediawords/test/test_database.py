@@ -139,6 +139,9 @@ class TestDatabaseWithSchemaTestCase(TestCase):
 
         db.disconnect()
 
+        # Tables of the recreated database might differ from the ones that got cached
+        DatabaseHandler.clear_primary_key_column_cache()
+
         db = connect_to_db(label=self.TEST_DB_LABEL)
 
         force_using_test_database()
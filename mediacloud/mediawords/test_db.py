@@ -1,6 +1,12 @@
 import pytest
 
-from mediawords.db import connect_to_db, McConnectToDBException
+from mediawords.db import (
+    connect_to_db,
+    connection_pool,
+    pooled_db,
+    DatabaseConnectionPool,
+    McConnectToDBException,
+)
 
 
 def test_connect_to_db():
@@ -17,3 +23,59 @@ def test_connect_to_db():
     # Invalid label
     with pytest.raises(McConnectToDBException):
         connect_to_db('NONEXISTENT_LABEL')
+
+
+def test_connection_pool():
+    pool = DatabaseConnectionPool(max_idle=1)
+
+    db = pool.acquire(label='test', do_not_check_schema_version=True)
+    backend_pid = db.query('SELECT pg_backend_pid()').flat()[0]
+
+    # Session state should get reset on return
+    db.query('SET work_mem TO 12345')
+    db.query('CREATE TEMPORARY TABLE test_connection_pool (id INT)')
+    db.begin()
+    pool.release(db=db, label='test', do_not_check_schema_version=True)
+    assert pool.idle_count() == 1
+
+    db = pool.acquire(label='test', do_not_check_schema_version=True)
+    assert db.query('SELECT pg_backend_pid()').flat()[0] == backend_pid
+    assert db.in_transaction() is False
+    assert db.query('SHOW work_mem').flat()[0] != '12345kB'
+    assert db.query("SELECT to_regclass('pg_temp.test_connection_pool')").flat()[0] is None
+    assert pool.idle_count() == 0
+
+    # Handlers over the idle limit get disconnected
+    other_db = pool.acquire(label='test', do_not_check_schema_version=True)
+    pool.release(db=db, label='test', do_not_check_schema_version=True)
+    pool.release(db=other_db, label='test', do_not_check_schema_version=True)
+    assert pool.idle_count() == 1
+    assert other_db.is_connected() is False
+
+    # Dead connections get replaced
+    db = pool.acquire(label='test', do_not_check_schema_version=True)
+    pool.release(db=db, label='test', do_not_check_schema_version=True)
+    killer_db = connect_to_db(label='test', do_not_check_schema_version=True)
+    killer_db.query('SELECT pg_terminate_backend(%(pid)s)', {'pid': backend_pid})
+    killer_db.disconnect()
+
+    db = pool.acquire(label='test', do_not_check_schema_version=True)
+    assert db.query('SELECT pg_backend_pid()').flat()[0] != backend_pid
+    assert pool.stats()['failed_health_checks'] == 1
+
+    # Handlers disconnected by the caller don't get pooled
+    db.disconnect()
+    pool.release(db=db, label='test', do_not_check_schema_version=True)
+    assert pool.idle_count() == 0
+
+    pool.close_all()
+
+
+def test_pooled_db():
+    with pooled_db(label='test', do_not_check_schema_version=True) as db:
+        database_name = db.query('SELECT current_database()').hash()
+        assert database_name['current_database'] == 'mediacloud_test'
+
+    assert connection_pool().idle_count() > 0
+    connection_pool().close_all()
+    assert connection_pool().idle_count() == 0
@@ -1,14 +1,19 @@
-import re
+import datetime
+
+import pytest
 
 from mediawords.db import connect_to_db
 # noinspection PyProtectedMember
 from mediawords.story_vectors import (
-    medium_is_locked,
+    lock_medium_week,
+    medium_week_is_locked,
+    medium_week_lock_key,
+    unlock_medium_week,
     _clean_sentences,
     _get_sentences_from_story_text,
     _delete_story_sentences,
     _get_unique_sentences_in_story,
-    _get_db_escaped_story_sentence_dicts,
+    _get_story_sentence_dicts,
     _insert_story_sentences,
 )
 from mediawords.test.db.create import (
@@ -30,18 +35,31 @@ class TestStoryVectors(TestDatabaseWithSchemaTestCase):
         self.test_story = create_test_story(self.db(), label='downloads est', feed=self.test_feed)
         self.test_download = create_download_for_story(self.db(), feed=self.test_feed, story=self.test_story)
 
-    def test_medium_is_locked(self):
+    def test_medium_week_is_locked(self):
         media_id = self.test_medium['media_id']
+        publish_date = '2016-10-15 08:00:00'
+
+        # Friday of the same week and Monday of the next one
+        same_week_publish_date = '2016-10-14 23:59:59'
+        next_week_publish_date = '2016-10-17 00:00:00'
 
         db_locked_session = connect_to_db(label=self.TEST_DB_LABEL)
 
-        assert medium_is_locked(db=self.db(), media_id=media_id) is False
+        assert medium_week_is_locked(db=self.db(), media_id=media_id, publish_date=publish_date) is False
+
+        assert lock_medium_week(db=db_locked_session, media_id=media_id, publish_date=publish_date) is True
+        assert medium_week_is_locked(db=self.db(), media_id=media_id, publish_date=publish_date) is True
+        assert medium_week_is_locked(db=self.db(), media_id=media_id, publish_date=same_week_publish_date) is True
+
+        # Other weeks and other media are not locked
+        assert medium_week_is_locked(db=self.db(), media_id=media_id, publish_date=next_week_publish_date) is False
+        assert medium_week_is_locked(db=self.db(), media_id=media_id + 1, publish_date=publish_date) is False
 
-        db_locked_session.query("SELECT pg_advisory_lock(%(media_id)s)", {'media_id': media_id})
-        assert medium_is_locked(db=self.db(), media_id=media_id) is True
+        # Bounded wait gives up
+        assert lock_medium_week(db=self.db(), media_id=media_id, publish_date=publish_date, timeout=0.1) is False
 
-        db_locked_session.query("SELECT pg_advisory_unlock(%(media_id)s)", {'media_id': media_id})
-        assert medium_is_locked(db=self.db(), media_id=media_id) is False
+        unlock_medium_week(db=db_locked_session, media_id=media_id, publish_date=publish_date)
+        assert medium_week_is_locked(db=self.db(), media_id=media_id, publish_date=publish_date) is False
 
         db_locked_session.disconnect()
 
@@ -76,9 +94,8 @@ class TestStoryVectors(TestDatabaseWithSchemaTestCase):
             condition_hash={},
         ).hashes()) == 0
 
-    def test_get_db_escaped_story_sentence_dicts(self):
-        escaped_sentences = _get_db_escaped_story_sentence_dicts(
-            db=self.db(),
+    def test_get_story_sentence_dicts(self):
+        sentence_dicts = _get_story_sentence_dicts(
             story=self.test_story,
             sentences=[
 
@@ -90,21 +107,15 @@ class TestStoryVectors(TestDatabaseWithSchemaTestCase):
 
             ]
         )
-        assert len(escaped_sentences) == 2
-
-        # We expect strings to be returned instead of integers because this will be join()ed together into a SQL query
-        assert escaped_sentences[0]['media_id'] == str(self.test_medium['media_id'])
-        assert escaped_sentences[0]['stories_id'] == str(self.test_story['stories_id'])
-        assert re.match(
-            pattern=r"^'\d\d\d\d-\d\d-\d\d \d\d:\d\d:\d\d'::timestamp$",
-            string=escaped_sentences[0]['publish_date'],
-        )
-        assert escaped_sentences[0]['sentence'] == "'It''s toasted!'"
-        assert escaped_sentences[0]['sentence_number'] == '0'
-        assert escaped_sentences[0]['language'] == "'en'"
+        assert len(sentence_dicts) == 2
+
+        # Values are not escaped because they get COPYed into a staging table
+        assert sentence_dicts[0]['sentence'] == "It's toasted!"
+        assert sentence_dicts[0]['sentence_number'] == 0
+        assert sentence_dicts[0]['language'] == 'en'
 
-        assert escaped_sentences[1]['sentence_number'] == '1'
-        assert escaped_sentences[1]['language'] == "'lt'"
+        assert sentence_dicts[1]['sentence_number'] == 1
+        assert sentence_dicts[1]['language'] == 'lt'
 
     def test_insert_story_sentences(self):
         sentences = [
@@ -188,6 +199,151 @@ class TestStoryVectors(TestDatabaseWithSchemaTestCase):
         # Two sentences with no_dedup_sentences=False, plus three sentences with no_dedup_sentences=True
         assert len(db_sentences) == 5
 
+    def __make_story_recent(self, story: dict) -> dict:
+        """Move story to the current week so that its sentences get into the deduplication index."""
+        story = story.copy()
+        story['publish_date'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.db().update_by_id('stories', story['stories_id'], {'publish_date': story['publish_date']})
+        return story
+
+    def test_insert_story_sentences_dedup_index(self):
+        sentences = [
+            'First sentence of the first story.',
+            'Second sentence of the first story.',
+        ]
+
+        self.test_story = self.__make_story_recent(self.test_story)
+
+        inserted_sentences = _insert_story_sentences(db=self.db(), story=self.test_story, sentences=sentences)
+        assert inserted_sentences == sentences
+
+        hash_count = self.db().query("SELECT COUNT(*) FROM story_sentence_hashes").flat()[0]
+        assert hash_count == 2
+
+        # One new and one already indexed sentence
+        test_story_2 = create_test_story(self.db(), label='test story 2', feed=self.test_feed)
+        test_story_2 = self.__make_story_recent(test_story_2)
+        inserted_sentences = _insert_story_sentences(
+            db=self.db(),
+            story=test_story_2,
+            sentences=['First sentence of the second story.', sentences[1]],
+        )
+        assert inserted_sentences == ['First sentence of the second story.']
+
+        hash_count = self.db().query("SELECT COUNT(*) FROM story_sentence_hashes").flat()[0]
+        assert hash_count == 3
+
+        dup_sentences = self.db().query("SELECT sentence FROM story_sentences WHERE is_dup").flat()
+        assert dup_sentences == [sentences[1]]
+
+        # Hashes of deleted sentences stay in the index but don't make the reextracted sentences duplicates
+        _delete_story_sentences(db=self.db(), story=self.test_story)
+        inserted_sentences = _insert_story_sentences(db=self.db(), story=self.test_story, sentences=sentences[:1])
+        assert inserted_sentences == sentences[:1]
+
+        dup_sentences = self.db().query("SELECT sentence FROM story_sentences WHERE is_dup").flat()
+        assert dup_sentences == []
+
+        # Pruning keeps the recent weeks
+        self.db().query("SELECT prune_story_sentence_hashes()")
+        hash_count = self.db().query("SELECT COUNT(*) FROM story_sentence_hashes").flat()[0]
+        assert hash_count == 3
+
+    def test_insert_story_sentences_old_week(self):
+        sentences = [
+            'First sentence of the first story.',
+            'Second sentence of the first story.',
+        ]
+
+        # Old weeks don't get indexed but their sentences still get deduplicated
+        inserted_sentences = _insert_story_sentences(db=self.db(), story=self.test_story, sentences=sentences)
+        assert inserted_sentences == sentences
+
+        test_story_2 = create_test_story(self.db(), label='test story 2', feed=self.test_feed)
+        inserted_sentences = _insert_story_sentences(db=self.db(), story=test_story_2, sentences=sentences[1:])
+        assert inserted_sentences == []
+
+        hash_count = self.db().query("SELECT COUNT(*) FROM story_sentence_hashes").flat()[0]
+        assert hash_count == 0
+
+        dup_sentences = self.db().query("SELECT sentence FROM story_sentences WHERE is_dup").flat()
+        assert dup_sentences == [sentences[1]]
+
+        # Hashes of old weeks get pruned
+        self.db().query("""
+            INSERT INTO story_sentence_hashes (media_id, week_start_date, sentence_half_md5)
+            VALUES (%(media_id)s, week_start_date(%(publish_date)s::date), half_md5('foo'))
+        """, {'media_id': self.test_story['media_id'], 'publish_date': self.test_story['publish_date']})
+
+        self.db().query("SELECT prune_story_sentence_hashes()")
+        hash_count = self.db().query("SELECT COUNT(*) FROM story_sentence_hashes").flat()[0]
+        assert hash_count == 0
+
+    def test_insert_story_sentences_unlocks_on_error(self):
+        # Claiming hashes for a nonexistent medium fails while holding the medium week's lock
+        story = self.__make_story_recent(self.test_story)
+        story['media_id'] = self.test_medium['media_id'] + 1
+
+        db_other_session = connect_to_db(label=self.TEST_DB_LABEL)
+
+        self.db().begin()
+
+        with pytest.raises(Exception):
+            _insert_story_sentences(db=self.db(), story=story, sentences=['First sentence.'])
+
+        # Lock got released and the caller's transaction is still usable
+        assert medium_week_is_locked(
+            db=db_other_session, media_id=story['media_id'], publish_date=story['publish_date'],
+        ) is False
+        assert self.db().query("SELECT 1").flat() == [1]
+
+        self.db().rollback()
+
+        db_other_session.disconnect()
+
+    def test_insert_story_sentences_csv_special_characters(self):
+        sentences = [
+            'Sentence with "double quotes", a comma and a backslash (\\).',
+            'Sentence with a line break\nin the middle of it.',
+        ]
+
+        inserted_sentences = _insert_story_sentences(
+            db=self.db(),
+            story=self.test_story,
+            sentences=sentences,
+        )
+        assert inserted_sentences == sentences
+
+        db_sentences = self.db().query("""
+            SELECT sentence
+            FROM story_sentences
+            ORDER BY sentence_number
+        """).flat()
+        assert db_sentences == sentences
+
+
+def test_medium_week_lock_key():
+    # Same week (starting on Monday)
+    assert medium_week_lock_key(media_id=1, publish_date='2016-10-10 00:00:00') == medium_week_lock_key(
+        media_id=1, publish_date='2016-10-16 23:59:59'
+    )
+    assert medium_week_lock_key(media_id=1, publish_date='2016-10-16') == medium_week_lock_key(
+        media_id=1, publish_date=datetime.datetime(2016, 10, 13, 12, 0, 0)
+    )
+
+    # Different week
+    assert medium_week_lock_key(media_id=1, publish_date='2016-10-16 23:59:59') != medium_week_lock_key(
+        media_id=1, publish_date='2016-10-17 00:00:00'
+    )
+
+    # Different medium
+    assert medium_week_lock_key(media_id=1, publish_date='2016-10-16') != medium_week_lock_key(
+        media_id=2, publish_date='2016-10-16'
+    )
+
+    # Fits into bigint
+    assert 0 < medium_week_lock_key(media_id=2 ** 31 - 1, publish_date='2100-01-01') < 2 ** 63
+
 
 def test_clean_sentences():
     good_sentences = [
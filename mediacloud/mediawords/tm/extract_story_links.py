@@ -226,6 +226,7 @@ def extract_links_for_topic_story(db: DatabaseHandler, story: dict, topic: dict)
         log.info("mining %s %s for topic %s .." % (story['title'], story['url'], topic['name']))
         links = get_links_from_story(db, story)
 
+        topic_links = []
         for link in links:
             if mediawords.tm.domains.skip_self_linked_domain_url(db, topic['topics_id'], story['url'], link):
                 log.info("skipping self linked domain url...")
@@ -237,9 +238,11 @@ def extract_links_for_topic_story(db: DatabaseHandler, story: dict, topic: dict)
                 'url': link
             }
 
-            db.create('topic_links', topic_link)
+            topic_links.append(topic_link)
             mediawords.tm.domains.increment_domain_links(db, topic_link)
 
+        db.insert_many('topic_links', topic_links)
+
         link_mine_error = ''
     except Exception:
         link_mine_error = traceback.format_exc()
@@ -231,14 +231,11 @@ def _add_tweets_to_meta_tweets(meta_tweets: list) -> None:
 
 def _insert_tweet_urls(db: DatabaseHandler, topic_tweet: dict, urls: typing.List) -> typing.List:
     """Insert list of urls into topic_tweet_urls."""
-    for url in urls:
-        db.query(
-            """
-            insert into topic_tweet_urls( topic_tweets_id, url )
-                values( %(a)s, %(b)s )
-                on conflict do nothing
-            """,
-            {'a': topic_tweet['topic_tweets_id'], 'b': url})
+    db.insert_many(
+        'topic_tweet_urls',
+        [{'topic_tweets_id': topic_tweet['topic_tweets_id'], 'url': url} for url in urls],
+        on_conflict='do nothing',
+    )
 
 
 def _remove_json_tree_nulls(d: dict):
@@ -108,10 +108,11 @@ def _update_media_normalized_urls(db: DatabaseHandler) -> None:
 
     log.warning("updating media_normalized_urls ...")
 
-    media = db.query("select * from media where normalized_url is null").hashes()
+    (total,) = db.query("select count(*) from media where normalized_url is null").flat()
+
+    media = db.query_stream("select * from media where normalized_url is null")
 
     i = 0
-    total = len(media)
     for medium in media:
         i += 1
         normalized_url = mediawords.util.url.normalize_url_lossy(medium['url'])
@@ -13,6 +13,7 @@ import mediawords.dbi.downloads
 from mediawords.dbi.stories.extractor_arguments import PyExtractorArguments
 import mediawords.dbi.stories.stories
 import mediawords.key_value_store.amazon_s3
+from mediawords.story_vectors import claim_story_sentence_hashes
 from mediawords.tm.guess_date import guess_date, GuessDateResult
 import mediawords.tm.media
 import mediawords.util.parse_html
@@ -567,6 +568,7 @@ def copy_story_to_new_medium(db: DatabaseHandler, topic: dict, old_story: dict,
                 where stories_id = %(b)s
         """,
         {'a': story['stories_id'], 'b': old_story['stories_id']})
+    claim_story_sentence_hashes(db=db, stories_id=story['stories_id'])
 
     return story
 
@@ -706,7 +708,7 @@ def merge_dup_media_stories(db, topic):
 
     log.info("merge dup media stories")
 
-    dup_media_stories = db.query(
+    dup_media_stories = db.query_stream(
         """
         SELECT distinct s.*
             FROM snap.live_stories s
@@ -716,12 +718,15 @@ def merge_dup_media_stories(db, topic):
                 m.dup_media_id is not null and
                 cs.topics_id = %(a)s
         """,
-        {'a': topic['topics_id']}).hashes()
+        {'a': topic['topics_id']})
 
-    if len(dup_media_stories) > 0:
-        log.info("merging %d stories" % len(dup_media_stories))
+    merged_story_count = 0
+    for s in dup_media_stories:
+        merge_dup_media_story(db, topic, s)
+        merged_story_count += 1
 
-    [merge_dup_media_story(db, topic, s) for s in dup_media_stories]
+    if merged_story_count > 0:
+        log.info("merged %d stories" % merged_story_count)
 
 
 def copy_stories_to_topic(db: DatabaseHandler, source_topics_id: int, target_topics_id: int) -> None:
@@ -829,7 +834,7 @@ def _get_dup_story_groups(db: DatabaseHandler, topic: dict) -> list:
     Find all stories within a topic that have duplicate normalized titles with a given day and media_id.  Return a
     list of story lists.  Each story list is a list of stories that are duplicated os each other.
     """
-    story_pairs = db.query(
+    story_pairs = db.query_stream(
         """
         select a.stories_id stories_id_a, b.stories_id stories_id_b
             from snap.live_stories a,
@@ -843,16 +848,17 @@ def _get_dup_story_groups(db: DatabaseHandler, topic: dict) -> list:
                 date_trunc('day', a.publish_date) = date_trunc('day', b.publish_date)
             order by stories_id_a, stories_id_b
         """,
-        {'a': topic['topics_id']}).hashes()
+        {'a': topic['topics_id']},
+        as_tuples=True)
 
     story_groups = {}
     ignore_stories = {}
-    for story_pair in story_pairs:
-        if story_pair['stories_id_b'] in ignore_stories:
+    for (stories_id_a, stories_id_b) in story_pairs:
+        if stories_id_b in ignore_stories:
             continue
 
-        story_a = db.require_by_id('stories', story_pair['stories_id_a'])
-        story_b = db.require_by_id('stories', story_pair['stories_id_b'])
+        story_a = db.require_by_id('stories', stories_id_a)
+        story_b = db.require_by_id('stories', stories_id_b)
 
         story_groups.setdefault(story_a['stories_id'], [story_a])
         story_groups[story_a['stories_id']].append(story_b)
@@ -426,6 +426,12 @@ class TestTMStoriesDB(mediawords.test.test_database.TestDatabaseWithSchemaTestCa
 
         mediawords.tm.stories.add_to_topic_stories(db, old_story, topic)
 
+        # Make the sentences recent enough to get indexed, and forget that they were ever claimed
+        db.query(
+            "update story_sentences set publish_date = now() where stories_id = %(a)s",
+            {'a': old_story['stories_id']})
+        db.query("delete from story_sentence_hashes")
+
         new_story = mediawords.tm.stories.copy_story_to_new_medium(db, topic, old_story, new_medium)
 
         assert db.find_by_id('stories', new_story['stories_id']) is not None
@@ -451,6 +457,23 @@ class TestTMStoriesDB(mediawords.test.test_database.TestDatabaseWithSchemaTestCa
             {'a': new_story['stories_id']}).hashes()
         assert len(story_sentences) > 0
 
+        # Copied sentences have to get claimed in the sentence deduplication index
+        unclaimed_sentence_count = db.query(
+            """
+            select count(*)
+                from story_sentences ss
+                where ss.stories_id = %(a)s
+                    and not exists (
+                        select 1
+                            from story_sentence_hashes ssh
+                            where ssh.media_id = ss.media_id
+                                and ssh.week_start_date = week_start_date(ss.publish_date::date)
+                                and ssh.sentence_half_md5 = half_md5(ss.sentence)
+                    )
+            """,
+            {'a': new_story['stories_id']}).flat()[0]
+        assert unclaimed_sentence_count == 0
+
     def test_copy_story_to_new_medium_with_download_error(self) -> None:
         """Test copy_story_to_new_medium with an associated download error."""
         db = self.db()
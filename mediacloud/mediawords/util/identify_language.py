@@ -1,4 +1,8 @@
-from typing import Dict
+import hashlib
+import string
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
 
 import cld2
 
@@ -11,6 +15,17 @@ __RELIABLE_IDENTIFICATION_MIN_TEXT_LENGTH = 10
 # Don't process strings longer than the following length
 __MAX_TEXT_LENGTH = 1024 * 1024
 
+# ASCII letters and digits to count in identification_would_be_reliable()
+__ASCII_LETTERS = string.ascii_letters.encode('ascii')
+__ASCII_DIGITS = string.digits.encode('ascii')
+
+# Max. number of identified language codes to keep in the cache
+__LANGUAGE_CODE_CACHE_MAX_SIZE = 100 * 1000
+
+# Cache language codes only for texts up to the following length (sentences tend to repeat, e.g. boilerplate, while
+# whole story texts don't, so there's no point in hashing and caching those)
+__LANGUAGE_CODE_CACHE_MAX_TEXT_LENGTH = 4 * 1024
+
 log = create_logger(__name__)
 
 
@@ -40,21 +55,80 @@ def __create_supported_language_mapping() -> Dict[str, str]:
 __LANGUAGE_CODES_TO_NAMES = __create_supported_language_mapping()
 
 
+class _LanguageCodeCache(object):
+    """Bounded LRU cache of identified language codes, keyed on a hash of the identified text."""
+
+    __slots__ = [
+        '__max_size',
+
+        # Text hash -> language code
+        '__language_codes',
+
+        '__lock',
+
+        '__hits',
+        '__misses',
+    ]
+
+    def __init__(self, max_size: int):
+        """Constructor."""
+        self.__max_size = max_size
+        self.__language_codes = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @staticmethod
+    def text_key(text: str) -> bytes:
+        """Return cache key for a text."""
+        return hashlib.md5(text.encode('utf-8', errors='replace')).digest()
+
+    def get(self, key: bytes) -> Optional[str]:
+        """Return cached language code for the key, None if it's not in the cache."""
+        with self.__lock:
+            language_code = self.__language_codes.get(key, None)
+            if language_code is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+                self.__language_codes.move_to_end(key)
+            return language_code
+
+    def set(self, key: bytes, language_code: str) -> None:
+        """Add language code to the cache, evicting the least recently used one if the cache is full."""
+        with self.__lock:
+            self.__language_codes[key] = language_code
+            self.__language_codes.move_to_end(key)
+            while len(self.__language_codes) > self.__max_size:
+                self.__language_codes.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache hit / miss counts and current size."""
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'size': len(self.__language_codes),
+            }
+
+    def clear(self) -> None:
+        """Empty the cache and reset counters."""
+        with self.__lock:
+            self.__language_codes.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+
+__language_code_cache = _LanguageCodeCache(max_size=__LANGUAGE_CODE_CACHE_MAX_SIZE)
+
+
 def __recode_utf8_string(utf8_string: str) -> str:
     """Encode and then decode UTF-8 string by removing invalid characters in the process."""
     return utf8_string.encode('utf-8', errors='replace').decode('utf-8', errors='replace')
 
 
-def language_code_for_text(text: str):
-    """Returns an ISO 690 language code for the plain text passed as a parameter.
-
-    :param text: Text that should be identified
-    :return: ISO 690 language code (e.g. 'en') on successful identification, empty string ('') on failure
-    """
-    text = decode_object_from_bytes_if_needed(text)
-
-    if not text:
-        return ''
+def __identify_language_code(text: str) -> str:
+    """Identify language code of a (non-empty) text with CLD2; return empty string ('') on failure."""
 
     if len(text) > __MAX_TEXT_LENGTH:
         log.warning("Text is longer than %d, trimming..." % __MAX_TEXT_LENGTH)
@@ -85,6 +159,87 @@ def language_code_for_text(text: str):
     return language_code
 
 
+def language_code_for_text(text: str):
+    """Returns an ISO 690 language code for the plain text passed as a parameter.
+
+    Language codes of short texts (e.g. sentences) are cached.
+
+    :param text: Text that should be identified
+    :return: ISO 690 language code (e.g. 'en') on successful identification, empty string ('') on failure
+    """
+    text = decode_object_from_bytes_if_needed(text)
+
+    if not text:
+        return ''
+
+    if len(text) > __LANGUAGE_CODE_CACHE_MAX_TEXT_LENGTH:
+        return __identify_language_code(text)
+
+    cache_key = __language_code_cache.text_key(text)
+
+    language_code = __language_code_cache.get(cache_key)
+    if language_code is None:
+        language_code = __identify_language_code(text)
+        __language_code_cache.set(cache_key, language_code)
+
+    return language_code
+
+
+def language_codes_for_texts(texts: List[str]) -> List[str]:
+    """Returns a list of ISO 690 language codes for a list of plain texts, e.g. sentences of a story.
+
+    Every distinct text gets identified only once.
+
+    :param texts: List of texts that should be identified
+    :return: List of ISO 690 language codes (empty strings for the texts that couldn't get identified)
+    """
+    texts = decode_object_from_bytes_if_needed(texts)
+
+    if texts is None:
+        return []
+
+    language_codes = dict()
+    for text in texts:
+        if text not in language_codes:
+            language_codes[text] = language_code_for_text(text)
+
+    return [language_codes[text] for text in texts]
+
+
+def language_code_cache_stats() -> Dict[str, int]:
+    """Returns language code cache statistics.
+
+    :return: Dictionary with cache "hits", "misses" and current cache "size"
+    """
+    return __language_code_cache.stats()
+
+
+def clear_language_code_cache() -> None:
+    """Empties language code cache and resets its statistics."""
+    __language_code_cache.clear()
+
+
+def __letter_count(text: str) -> int:
+    """Return letter count (alphabetic character count minus digit and underscore count) of a text.
+
+    Characters get tested by mapping str methods over the string instead of iterating over it in a Python loop.
+    Regular expression character classes are not used because "\\d" and "\\w" match a slightly different set of
+    characters than str.isdigit() and str.isalpha() do.
+    """
+    if text.isascii():
+        # Fast path: ASCII letters and digits are mutually exclusive and easy to delete in one go
+        ascii_bytes = text.encode('ascii')
+        alpha_count = len(ascii_bytes) - len(ascii_bytes.translate(None, __ASCII_LETTERS))
+        digit_count = len(ascii_bytes) - len(ascii_bytes.translate(None, __ASCII_DIGITS))
+    else:
+        alpha_count = sum(map(str.isalpha, text))
+        digit_count = sum(map(str.isdigit, text))
+
+    underscore_count = text.count('_')
+
+    return alpha_count - digit_count - underscore_count
+
+
 def identification_would_be_reliable(text: str) -> bool:
     """Returns True if the language identification for the text passed as a parameter is likely to be reliable.
 
@@ -107,18 +262,7 @@ def identification_would_be_reliable(text: str) -> bool:
     text = __recode_utf8_string(text)
 
     # Not enough letters as opposed to non-letters?
-    word_character_count = 0
-    digit_count = 0
-    underscore_count = 0
-    for character in text:
-        if character.isalpha():
-            word_character_count += 1
-        if character.isdigit():
-            digit_count += 1
-        if character == '_':
-            underscore_count += 1
-
-    letter_count = word_character_count - digit_count - underscore_count
+    letter_count = __letter_count(text)
     if letter_count < __RELIABLE_IDENTIFICATION_MIN_TEXT_LENGTH:
         return False
 
@@ -10,6 +10,9 @@ from mediawords.util.web.user_agent import UserAgent, Response
 
 log = create_logger(__name__)
 
+# Number of sitemap pages to INSERT at once
+__SITEMAP_PAGES_INSERT_CHUNK_SIZE = 1000
+
 
 class _SitemapWebClientResponse(AbstractWebClientSuccessResponse):
     __slots__ = [
@@ -76,17 +79,9 @@ def fetch_sitemap_pages_for_media_id(db: DatabaseHandler, media_id: int) -> None
     log.info("Storing sitemap pages for media ID {} ({})...".format(media_id, media_url))
 
     insert_counter = 0
+    pages_to_insert = []
     for page in sitemaps.all_pages():
-        db.query("""
-            INSERT INTO media_sitemap_pages (
-                media_id, url, last_modified, change_frequency, priority,
-                news_title, news_publish_date
-            ) VALUES (
-                %(media_id)s, %(url)s, %(last_modified)s, %(change_frequency)s, %(priority)s,
-                %(news_title)s, %(news_publish_date)s
-            )
-            ON CONFLICT (url) DO NOTHING
-        """, {
+        pages_to_insert.append({
             'media_id': media_id,
             'url': page.url,
             'last_modified': page.last_modified,
@@ -96,8 +91,15 @@ def fetch_sitemap_pages_for_media_id(db: DatabaseHandler, media_id: int) -> None
             'news_publish_date': page.news_story.publish_date if page.news_story is not None else None,
         })
 
-        insert_counter += 1
-        if insert_counter % 1000 == 0:
+        if len(pages_to_insert) >= __SITEMAP_PAGES_INSERT_CHUNK_SIZE:
+            db.insert_many('media_sitemap_pages', pages_to_insert, on_conflict='(url) DO NOTHING')
+            insert_counter += len(pages_to_insert)
+            pages_to_insert = []
+
             log.info("Inserted {} URLs...".format(insert_counter))
 
+    if pages_to_insert:
+        db.insert_many('media_sitemap_pages', pages_to_insert, on_conflict='(url) DO NOTHING')
+        insert_counter += len(pages_to_insert)
+
     log.info("Done storing {} sitemap pages for media ID {} ({}).".format(insert_counter, media_id, media_url))
@@ -1,7 +1,7 @@
 from mediawords.languages.factory import LanguageFactory
 from mediawords.util.identify_language import (
-    language_code_for_text, identification_would_be_reliable, language_is_supported,
-    language_name_for_code)
+    language_code_for_text, language_codes_for_texts, identification_would_be_reliable, language_is_supported,
+    language_name_for_code, language_code_cache_stats, clear_language_code_cache)
 
 
 def test_language_code_for_text():
@@ -67,6 +67,13 @@ def test_identification_would_be_reliable_digits():
     # More digits than letters
     assert identification_would_be_reliable(text='000000000000000aaaaaaa') is False
 
+    # Underscores don't count as letters
+    assert identification_would_be_reliable(text='__________aaaaaaaaaa') is False
+
+    # Non-ASCII letters and digits
+    assert identification_would_be_reliable(text='ąčęėįšųūžąčęėįšųūž') is True
+    assert identification_would_be_reliable(text='ąčęėįšųūž١٢٣٤٥٦٧٨٩٠') is False
+
 
 def test_language_is_supported():
     assert language_is_supported(code='') is False
@@ -91,3 +98,41 @@ def test_language_name_for_code():
     assert language_name_for_code(code='ht') == 'Haitian Creole'
 
     assert language_name_for_code(code='xx') == ''
+
+
+def test_language_codes_for_texts():
+    assert language_codes_for_texts(texts=[]) == []
+    # noinspection PyTypeChecker
+    assert language_codes_for_texts(texts=None) == []
+
+    enabled_languages = LanguageFactory.enabled_languages()
+    sample_sentences = [LanguageFactory.language_for_code(code).sample_sentence() for code in enabled_languages]
+
+    # Same results as with identifying every text separately
+    assert language_codes_for_texts(texts=sample_sentences + ['']) == [
+        language_code_for_text(text=sentence) for sentence in sample_sentences + ['']
+    ]
+
+
+def test_language_code_cache():
+    clear_language_code_cache()
+    assert language_code_cache_stats() == {'hits': 0, 'misses': 0, 'size': 0}
+
+    english_sentence = LanguageFactory.language_for_code('en').sample_sentence()
+    lithuanian_sentence = LanguageFactory.language_for_code('lt').sample_sentence()
+
+    language_codes = language_codes_for_texts(texts=[english_sentence, lithuanian_sentence, english_sentence])
+    assert language_codes == ['en', 'lt', 'en']
+    assert language_code_cache_stats() == {'hits': 0, 'misses': 2, 'size': 2}
+
+    assert language_code_for_text(text=english_sentence) == 'en'
+    assert language_code_for_text(text=lithuanian_sentence) == 'lt'
+    assert language_code_cache_stats() == {'hits': 2, 'misses': 2, 'size': 2}
+
+    # Texts that couldn't be identified get cached too
+    assert language_code_for_text(text='1234567890') == ''
+    assert language_code_for_text(text='1234567890') == ''
+    assert language_code_cache_stats() == {'hits': 3, 'misses': 3, 'size': 3}
+
+    clear_language_code_cache()
+    assert language_code_cache_stats() == {'hits': 0, 'misses': 0, 'size': 0}
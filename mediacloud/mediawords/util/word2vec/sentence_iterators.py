@@ -2,7 +2,7 @@ import abc
 from abc import ABC
 from collections import deque
 from collections.abc import Iterator
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from mediawords.db import DatabaseHandler
 from mediawords.languages.factory import LanguageFactory
@@ -27,7 +27,7 @@ class SnapshotSentenceIterator(AbstractSentenceIterator, metaclass=abc.ABCMeta):
         '__db',
         '__snapshots_id',
 
-        # Deque of sentences
+        # Deque of sentences' word lists
         '__sentences_deque',
 
         # How many stories (and their sentences) to fetch in a single chunk
@@ -64,7 +64,8 @@ class SnapshotSentenceIterator(AbstractSentenceIterator, metaclass=abc.ABCMeta):
         "stories_id_chunk_size" stories at a time, feed them in __next__(), and then fetch another chunk.
         """
 
-        chunk = self.__db.query("""
+        # Tuples instead of dicts as chunks can be big
+        chunk = self.__db.query_tuples("""
             SELECT stories_id, sentence
             FROM story_sentences
             WHERE stories_id IN (
@@ -84,17 +85,52 @@ class SnapshotSentenceIterator(AbstractSentenceIterator, metaclass=abc.ABCMeta):
             'snapshots_id': self.__snapshots_id,
             'last_encountered_stories_id': self.__last_encountered_stories_id,
             'stories_id_chunk_size': self.__stories_id_chunk_size,
-        }).hashes()
+        }).tuples()
 
         if len(chunk):
-            self.__last_encountered_stories_id = chunk[-1]['stories_id']
+            self.__last_encountered_stories_id = chunk[-1][0]
 
-        sentences = [x['sentence'] for x in chunk]
+        sentences = [sentence for (stories_id, sentence,) in chunk]
 
         return sentences
 
-    def __next_sentence(self) -> Optional[str]:
-        """(Fetch if needed and) return next sentence; return None if no more sentences are to be found."""
+    @staticmethod
+    def __split_sentences_to_words(sentences: List[str]) -> List[List[str]]:
+        """Split a chunk of sentences into words, return a list of word lists in the same order.
+
+        Sentences are grouped by their language and split in LanguageFactory's process pool, so that tokenizing big
+        snapshots doesn't take up a single core only."""
+
+        # Language code -> list of (sentence index, sentence)
+        sentences_by_language = {}  # type: Dict[str, List[Tuple[int, str]]]
+
+        for index, sentence in enumerate(sentences):
+            sentence = sentence.strip()
+            if not len(sentence):
+                continue
+
+            language_code = None
+            if identification_would_be_reliable(sentence):
+                language_code = language_code_for_text(sentence)
+            if not language_code or LanguageFactory.language_for_code(language_code) is None:
+                language_code = LanguageFactory.default_language_code()
+
+            sentences_by_language.setdefault(language_code, []).append((index, sentence,))
+
+        words = [[] for _ in sentences]
+
+        for language_code, indexed_sentences in sentences_by_language.items():
+            language_words = LanguageFactory.tokenize_many(
+                sentences=[sentence for (index, sentence,) in indexed_sentences],
+                language_code=language_code,
+            )
+            for (index, sentence,), sentence_words in zip(indexed_sentences, language_words):
+                words[index] = sentence_words
+
+        return words
+
+    def __next_sentence_words(self) -> Optional[List[str]]:
+        """(Fetch if needed and) return next sentence's words; return None if no more sentences are to be found."""
 
         if len(self.__sentences_deque) == 0:
 
@@ -103,7 +139,7 @@ class SnapshotSentenceIterator(AbstractSentenceIterator, metaclass=abc.ABCMeta):
                 self.__stories_id_chunk_size,
             ))
             chunk = self.__fetch_next_sentences_chunk()
-            self.__sentences_deque.extend(chunk)
+            self.__sentences_deque.extend(self.__split_sentences_to_words(chunk))
 
             log.info("Fetched {} sentences".format(len(chunk)))
 
@@ -116,25 +152,8 @@ class SnapshotSentenceIterator(AbstractSentenceIterator, metaclass=abc.ABCMeta):
     def __next__(self) -> List[str]:
         """Return list of next sentence's words to be added to the word2vec vector."""
 
-        sentence = self.__next_sentence()
-        if sentence is None:
+        words = self.__next_sentence_words()
+        if words is None:
             raise StopIteration
 
-        sentence = sentence.strip()
-
-        if not len(sentence):
-            return []
-
-        language = None
-        if identification_would_be_reliable(sentence):
-            language_code = language_code_for_text(sentence)
-            language = LanguageFactory.language_for_code(language_code)
-        if language is None:
-            language = LanguageFactory.default_language()
-
-        words = language.split_sentence_to_words(sentence)
-
-        if not len(words):
-            return []
-
         return words
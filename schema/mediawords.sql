@@ -24,7 +24,7 @@ CREATE OR REPLACE FUNCTION set_database_schema_version() RETURNS boolean AS $$
 DECLARE
     -- Database schema version number (same as a SVN revision number)
     -- Increase it by 1 if you make major database schema changes.
-    MEDIACLOUD_DATABASE_SCHEMA_VERSION CONSTANT INT := 4728;
+    MEDIACLOUD_DATABASE_SCHEMA_VERSION CONSTANT INT := 4729;
 BEGIN
 
     -- Update / set database schema version
@@ -1716,6 +1716,46 @@ CREATE TRIGGER story_sentences_view_insert_update_delete_trigger
     FOR EACH ROW EXECUTE PROCEDURE story_sentences_view_insert_update_delete();
 
 
+--
+-- Sentence deduplication index: hashes of every sentence that was ever added
+-- to "story_sentences", per medium and week
+--
+-- Claiming hashes of new sentences with "INSERT ... ON CONFLICT DO NOTHING"
+-- tells which of them might be duplicates, so the "is_dup" UPDATE on
+-- "story_sentences" has to be run only when some hashes were already there.
+--
+-- Only the recent weeks (starting with story_sentence_hashes_start_date()) are
+-- indexed; sentences of stories published before that always get the "is_dup"
+-- UPDATE run, and older rows get pruned by prune_story_sentence_hashes().
+--
+-- Rows don't get removed together with the sentences; a stale hash makes the
+-- UPDATE run needlessly but doesn't mark anything as a duplicate.
+--
+CREATE TABLE story_sentence_hashes (
+    media_id                INT         NOT NULL REFERENCES media (media_id) ON DELETE CASCADE,
+    week_start_date         DATE        NOT NULL,
+    sentence_half_md5       BYTEA       NOT NULL,
+
+    PRIMARY KEY (media_id, week_start_date, sentence_half_md5)
+);
+
+CREATE INDEX story_sentence_hashes_week_start_date
+    ON story_sentence_hashes (week_start_date);
+
+
+-- First week of which sentence hashes are kept in "story_sentence_hashes"
+CREATE OR REPLACE FUNCTION story_sentence_hashes_start_date() RETURNS date AS $$
+    SELECT week_start_date((NOW() - INTERVAL '12 weeks')::date);
+$$ LANGUAGE SQL STABLE;
+
+
+-- Remove hashes of weeks that are not indexed anymore
+CREATE OR REPLACE FUNCTION prune_story_sentence_hashes() RETURNS VOID AS $$
+    DELETE FROM story_sentence_hashes
+    WHERE week_start_date < story_sentence_hashes_start_date();
+$$ LANGUAGE SQL;
+
+
 -- update media stats table for new story. create the media / day row if needed.
 CREATE OR REPLACE FUNCTION insert_story_media_stats() RETURNS trigger AS $$
 BEGIN
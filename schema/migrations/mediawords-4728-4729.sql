@@ -0,0 +1,82 @@
+--
+-- This is a Media Cloud PostgreSQL schema difference file (a "diff") between schema
+-- versions 4728 and 4729.
+--
+-- If you are running Media Cloud with a database that was set up with a schema version
+-- 4728, and you would like to upgrade both the Media Cloud and the
+-- database to be at version 4729, import this SQL file:
+--
+--     psql mediacloud < mediawords-4728-4729.sql
+--
+-- You might need to import some additional schema diff files to reach the desired version.
+--
+
+--
+-- 1 of 2. Import the output of 'apgdiff':
+--
+
+
+CREATE TABLE story_sentence_hashes (
+    media_id                INT         NOT NULL REFERENCES media (media_id) ON DELETE CASCADE,
+    week_start_date         DATE        NOT NULL,
+    sentence_half_md5       BYTEA       NOT NULL,
+
+    PRIMARY KEY (media_id, week_start_date, sentence_half_md5)
+);
+
+CREATE INDEX story_sentence_hashes_week_start_date
+    ON story_sentence_hashes (week_start_date);
+
+
+CREATE OR REPLACE FUNCTION story_sentence_hashes_start_date() RETURNS date AS $$
+    SELECT week_start_date((NOW() - INTERVAL '12 weeks')::date);
+$$ LANGUAGE SQL STABLE;
+
+
+CREATE OR REPLACE FUNCTION prune_story_sentence_hashes() RETURNS VOID AS $$
+    DELETE FROM story_sentence_hashes
+    WHERE week_start_date < story_sentence_hashes_start_date();
+$$ LANGUAGE SQL;
+
+
+-- Hashes of recent sentences that are already in "story_sentences" have to be
+-- there for them to get deduplicated against (older weeks always get the full
+-- "is_dup" UPDATE); stories are looked up by their indexed "publish_date" to
+-- not scan the whole "story_sentences_p"
+INSERT INTO story_sentence_hashes (media_id, week_start_date, sentence_half_md5)
+    SELECT DISTINCT
+        ss.media_id,
+        week_start_date(ss.publish_date::date),
+        half_md5(ss.sentence)
+    FROM stories AS s
+        INNER JOIN story_sentences_p AS ss
+            ON s.stories_id = ss.stories_id
+    WHERE s.publish_date >= story_sentence_hashes_start_date()
+      AND ss.publish_date >= story_sentence_hashes_start_date()
+ON CONFLICT DO NOTHING;
+
+
+--
+-- 2 of 2. Reset the database version.
+--
+
+CREATE OR REPLACE FUNCTION set_database_schema_version() RETURNS boolean AS $$
+DECLARE
+
+    -- Database schema version number (same as a SVN revision number)
+    -- Increase it by 1 if you make major database schema changes.
+    MEDIACLOUD_DATABASE_SCHEMA_VERSION CONSTANT INT := 4729;
+
+BEGIN
+
+    -- Update / set database schema version
+    DELETE FROM database_variables WHERE name = 'database-schema-version';
+    INSERT INTO database_variables (name, value) VALUES ('database-schema-version', MEDIACLOUD_DATABASE_SCHEMA_VERSION::int);
+
+    return true;
+
+END;
+$$
+LANGUAGE 'plpgsql';
+
+SELECT set_database_schema_version();
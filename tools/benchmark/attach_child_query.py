@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Compare the time it takes attach_child_query() to attach children to 10, 1k and 100k parents when the parent IDs get
+# passed to the child query as an array parameter and when they get copied to a temporary IDs table.
+#
+# Usage:
+#
+#     ./script/run_in_env.sh ./tools/benchmark/attach_child_query.py [--parents 10 1000 100000] [--runs 5]
+#
+
+import argparse
+import statistics
+import time
+from typing import List
+
+from mediawords.db import connect_to_db
+from mediawords.db.handler import DatabaseHandler
+from mediawords.util.log import create_logger
+
+log = create_logger(__name__)
+
+# Children per parent in the test table
+_CHILDREN_PER_PARENT = 3
+
+
+def _create_test_tables(db: DatabaseHandler, parent_count: int) -> None:
+    """Create temporary table with children of "parent_count" parents."""
+    db.query("DROP TABLE IF EXISTS benchmark_children")
+    db.query("""
+        CREATE TEMPORARY TABLE benchmark_children AS
+            SELECT
+                parent_id::bigint AS parent_id,
+                'child ' || child_number AS child_name
+            FROM generate_series(1, %(parent_count)s) AS parent_id,
+                generate_series(1, %(children_per_parent)s) AS child_number
+    """, {'parent_count': parent_count, 'children_per_parent': _CHILDREN_PER_PARENT})
+    db.query("CREATE INDEX benchmark_children_parent_id ON benchmark_children (parent_id)")
+    db.query("ANALYZE benchmark_children")
+
+
+def _time_attach_child_query(db: DatabaseHandler, parent_count: int, max_array_ids: int, runs: int) -> List[float]:
+    """Attach children to parents "runs" times, return timings."""
+    timings = []
+    for _ in range(runs):
+        parents = [{'parent_id': parent_id} for parent_id in range(1, parent_count + 1)]
+
+        # Temporary IDs tables are supposed to be created within a transaction
+        db.begin()
+
+        start = time.perf_counter()
+        db.attach_child_query(
+            data=parents,
+            child_query='SELECT parent_id, child_name FROM benchmark_children',
+            child_field='children',
+            id_column='parent_id',
+            max_array_ids=max_array_ids,
+        )
+        timings.append(time.perf_counter() - start)
+
+        db.rollback()
+
+    return timings
+
+
+def benchmark_attach_child_query(parent_counts: List[int], runs: int) -> None:
+    """Time attach_child_query() with both strategies for every parent count."""
+
+    db = connect_to_db()
+
+    for parent_count in parent_counts:
+        log.info("Creating children of %d parents..." % parent_count)
+        _create_test_tables(db=db, parent_count=parent_count)
+
+        log.info("Timing %d runs with %d parents..." % (runs, parent_count))
+        array_time = statistics.median(
+            _time_attach_child_query(db=db, parent_count=parent_count, max_array_ids=parent_count, runs=runs)
+        )
+        table_time = statistics.median(
+            _time_attach_child_query(db=db, parent_count=parent_count, max_array_ids=0, runs=runs)
+        )
+
+        print("%d parents, array parameter (median): %.4f s" % (parent_count, array_time))
+        print("%d parents, temporary IDs table (median): %.4f s" % (parent_count, table_time))
+
+    db.query("DROP TABLE IF EXISTS benchmark_children")
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark attach_child_query().")
+    parser.add_argument('-p', '--parents', type=int, nargs='+', default=[10, 1000, 100000],
+                        help="Parent counts to benchmark with.")
+    parser.add_argument('-r', '--runs', type=int, default=5, help="Number of runs for each case.")
+    args = parser.parse_args()
+
+    benchmark_attach_child_query(parent_counts=args.parents, runs=args.runs)
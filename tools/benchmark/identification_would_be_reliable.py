@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Compare the performance of identification_would_be_reliable() with the character-by-character loop that it used to
+# be implemented as.
+#
+# Usage:
+#
+#     ./script/run_in_env.sh ./tools/benchmark/identification_would_be_reliable.py [sentences.txt]
+#
+# where "sentences.txt" is an optional file with one sentence per line (e.g. an export of "story_sentences"); if it's
+# not provided, sentences from a test HTML page and the languages' sample sentences are used instead.
+#
+
+import argparse
+import os
+import timeit
+from typing import List
+
+from mediawords.languages.factory import LanguageFactory
+from mediawords.util.identify_language import identification_would_be_reliable
+from mediawords.util.log import create_logger
+from mediawords.util.parse_html import html_strip
+from mediawords.util.paths import mc_root_path
+
+log = create_logger(__name__)
+
+
+def _old_identification_would_be_reliable(text: str) -> bool:
+    """Previous implementation (without trimming and UTF-8 recoding) for comparison."""
+    if not text:
+        return False
+
+    if len(text) < 10:
+        return False
+
+    word_character_count = 0
+    digit_count = 0
+    underscore_count = 0
+    for character in text:
+        if character.isalpha():
+            word_character_count += 1
+        if character.isdigit():
+            digit_count += 1
+        if character == '_':
+            underscore_count += 1
+
+    letter_count = word_character_count - digit_count - underscore_count
+    if letter_count < 10:
+        return False
+
+    return True
+
+
+def _default_sentences() -> List[str]:
+    """Return sentences from a test HTML page and sample sentences of all enabled languages."""
+    html_path = os.path.join(mc_root_path(), 'mediacloud', 'test-data', 'html', 'strip.html')
+    with open(html_path, 'r', encoding='utf-8') as f:
+        text = html_strip(f.read())
+
+    sentences = LanguageFactory.default_language().split_text_to_sentences(text)
+
+    for language_code in sorted(LanguageFactory.enabled_languages()):
+        sentences.append(LanguageFactory.language_for_code(language_code).sample_sentence())
+
+    return sentences
+
+
+def benchmark_identification_would_be_reliable(sentences: List[str], repeat: int) -> None:
+    """Verify that both implementations agree on every sentence, then time them."""
+
+    for sentence in sentences:
+        if identification_would_be_reliable(sentence) != _old_identification_would_be_reliable(sentence):
+            raise Exception("Implementations disagree on sentence: %s" % sentence)
+
+    log.info("Timing %d sentences, %d times..." % (len(sentences), repeat))
+
+    old_time = timeit.timeit(
+        lambda: [_old_identification_would_be_reliable(sentence) for sentence in sentences],
+        number=repeat,
+    )
+    new_time = timeit.timeit(
+        lambda: [identification_would_be_reliable(sentence) for sentence in sentences],
+        number=repeat,
+    )
+
+    print("Old implementation: %.3f s" % old_time)
+    print("New implementation: %.3f s" % new_time)
+    print("Speedup: %.2fx" % (old_time / new_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark identification_would_be_reliable().")
+    parser.add_argument('sentences_file', nargs='?', help="File with one sentence per line.")
+    parser.add_argument('-r', '--repeat', type=int, default=100, help="Number of times to run over all sentences.")
+    args = parser.parse_args()
+
+    if args.sentences_file:
+        with open(args.sentences_file, 'r', encoding='utf-8') as sentences_file:
+            corpus = [line.rstrip('\n') for line in sentences_file]
+    else:
+        corpus = _default_sentences()
+
+    benchmark_identification_would_be_reliable(sentences=corpus, repeat=args.repeat)
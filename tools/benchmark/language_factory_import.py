@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# Measure worker cold start cost of the language factory: import LanguageFactory and get the English language instance
+# in a fresh Python interpreter, once with the language modules being imported lazily (current behavior) and once with
+# all the enabled language modules imported upfront (how the factory used to work).
+#
+# Usage:
+#
+#     ./script/run_in_env.sh ./tools/benchmark/language_factory_import.py [--runs 10]
+#
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import List
+
+from mediawords.languages.factory import LanguageFactory
+from mediawords.util.log import create_logger
+
+log = create_logger(__name__)
+
+# Cold start of a worker that only deals with English
+_LAZY_COLD_START = """
+import time
+start = time.perf_counter()
+
+from mediawords.languages.factory import LanguageFactory
+LanguageFactory.language_for_code('en')
+
+print(time.perf_counter() - start)
+"""
+
+# Cold start with every enabled language module imported upfront
+_EAGER_COLD_START = """
+import importlib
+import time
+start = time.perf_counter()
+
+from mediawords.languages.factory import LanguageFactory
+for language_code in %(language_codes)s:
+    importlib.import_module('mediawords.languages.%%s' %% language_code)
+LanguageFactory.language_for_code('en')
+
+print(time.perf_counter() - start)
+"""
+
+
+def _time_cold_start(code: str, runs: int) -> List[float]:
+    """Run code in fresh interpreters, return the timings that it printed out."""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code])
+        timings.append(float(output.decode('utf-8').strip().split("\n")[-1]))
+    return timings
+
+
+def benchmark_language_factory_import(runs: int) -> None:
+    """Time lazy and eager cold starts."""
+
+    language_codes = sorted(LanguageFactory.enabled_languages())
+
+    log.info("Timing %d cold starts of each kind..." % runs)
+
+    eager_timings = _time_cold_start(code=_EAGER_COLD_START % {'language_codes': repr(language_codes)}, runs=runs)
+    lazy_timings = _time_cold_start(code=_LAZY_COLD_START, runs=runs)
+
+    eager_time = statistics.median(eager_timings)
+    lazy_time = statistics.median(lazy_timings)
+
+    print("All language modules imported upfront (median): %.3f s" % eager_time)
+    print("Language modules imported lazily (median): %.3f s" % lazy_time)
+    print("Speedup: %.2fx" % (eager_time / lazy_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark cold start of the language factory.")
+    parser.add_argument('-r', '--runs', type=int, default=10, help="Number of interpreters to start for each case.")
+    args = parser.parse_args()
+
+    benchmark_language_factory_import(runs=args.runs)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Compare the time it takes to look up rows by their primary key with a plain query (which PostgreSQL parses and plans
+# on every call) and with a prepared statement (what find_by_id() does now), and report the planning time that
+# PostgreSQL itself spends on the plain query.
+#
+# Usage:
+#
+#     ./script/run_in_env.sh ./tools/benchmark/prepared_statements.py [--table stories] [--lookups 10000]
+#
+
+import argparse
+import re
+import time
+from typing import List
+
+from mediawords.db import connect_to_db
+from mediawords.db.handler import DatabaseHandler
+from mediawords.util.log import create_logger
+
+log = create_logger(__name__)
+
+
+def _sample_ids(db: DatabaseHandler, table: str, primary_key_column: str, count: int) -> List[int]:
+    """Return up to "count" IDs from the table."""
+    return db.query(
+        "SELECT %(id_column)s FROM %(table)s ORDER BY %(id_column)s DESC LIMIT %(count)d" % {
+            'id_column': primary_key_column,
+            'table': table,
+            'count': count,
+        }
+    ).flat()
+
+
+def _planning_time(db: DatabaseHandler, sql: str, object_id: int) -> float:
+    """Return planning time (in seconds) that PostgreSQL reports for the query."""
+    plan = db.query("EXPLAIN (ANALYZE, SUMMARY) " + sql, {'id_value': object_id}).flat()
+    for line in plan:
+        matches = re.search(r'Planning [Tt]ime: ([\d.]+) ms', line)
+        if matches:
+            return float(matches.group(1)) / 1000
+    return 0.0
+
+
+def benchmark_prepared_statements(table: str, lookups: int) -> None:
+    """Time plain and prepared lookups by primary key."""
+
+    db = connect_to_db()
+
+    primary_key_column = db.primary_key_column(table)
+    ids = _sample_ids(db=db, table=table, primary_key_column=primary_key_column, count=lookups)
+    if not ids:
+        raise Exception("Table '%s' is empty." % table)
+
+    # Cycle through the sampled IDs if there are fewer of them than lookups
+    ids = [ids[i % len(ids)] for i in range(lookups)]
+
+    plain_sql = "SELECT * FROM %s WHERE %s = %%(id_value)s" % (table, primary_key_column,)
+    prepared_sql = "SELECT * FROM %s WHERE %s = $1" % (table, primary_key_column,)
+
+    log.info("Measuring planning time of %d plain lookups..." % len(ids))
+    planning_time = sum(_planning_time(db=db, sql=plain_sql, object_id=object_id) for object_id in ids)
+
+    log.info("Timing %d plain lookups..." % len(ids))
+    start = time.time()
+    for object_id in ids:
+        db.query(plain_sql, {'id_value': object_id}).hash()
+    plain_time = time.time() - start
+
+    log.info("Timing %d prepared lookups..." % len(ids))
+    start = time.time()
+    for object_id in ids:
+        db.prepared('benchmark_find_by_id', prepared_sql, (object_id,)).hash()
+    prepared_time = time.time() - start
+
+    print("Planning time spent by PostgreSQL on plain lookups: %.3f s" % planning_time)
+    print("Plain lookups: %.3f s" % plain_time)
+    print("Prepared lookups: %.3f s" % prepared_time)
+    print("Prepared statement stats: %s" % str(db.prepared_statement_stats()))
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark prepared statements.")
+    parser.add_argument('-t', '--table', type=str, default='stories', help="Table to look up rows from.")
+    parser.add_argument('-l', '--lookups', type=int, default=10000, help="Number of lookups to do.")
+    args = parser.parse_args()
+
+    benchmark_prepared_statements(table=args.table, lookups=args.lookups)
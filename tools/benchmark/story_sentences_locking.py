@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Measure story sentence insertion throughput for a single large medium with several concurrent workers, once with all
+# the stories published on the same week (so that every insertion contends for the same medium week lock, which is
+# what a per-medium lock used to do for every story of a medium) and once with the stories spread over many weeks.
+#
+# The benchmark creates (and afterwards deletes) a test medium with its stories in the configured database, so don't
+# run it against a production one.
+#
+# Usage:
+#
+#     ./script/run_in_env.sh ./tools/benchmark/story_sentences_locking.py [--stories 2000] [--weeks 52] [--workers 8]
+#
+
+import argparse
+import datetime
+import multiprocessing
+import time
+from typing import List
+
+from mediawords.db import connect_to_db
+from mediawords.db.handler import DatabaseHandler
+# noinspection PyProtectedMember
+from mediawords.story_vectors import _insert_story_sentences
+from mediawords.util.log import create_logger
+
+log = create_logger(__name__)
+
+# Sentences per story
+_SENTENCES_PER_STORY = 30
+
+# Number of boilerplate sentences repeated in every story (i.e. duplicates)
+_BOILERPLATE_SENTENCES_PER_STORY = 3
+
+# Publish date of the first story
+_FIRST_PUBLISH_DATE = datetime.datetime(2018, 1, 1, 12, 0, 0)
+
+
+def _create_test_stories(db: DatabaseHandler, media_id: int, label: str, story_count: int, weeks: int) -> List[dict]:
+    """Create stories published over a number of weeks, return them."""
+    stories = []
+    for story_number in range(story_count):
+        publish_date = _FIRST_PUBLISH_DATE + datetime.timedelta(weeks=story_number % weeks)
+        stories.append(db.create(table='stories', insert_hash={
+            'media_id': media_id,
+            'url': 'http://story.test/%s/%d' % (label, story_number),
+            'guid': 'guid://story.test/%s/%d' % (label, story_number),
+            'title': 'story %d' % story_number,
+            'description': 'description %d' % story_number,
+            'publish_date': publish_date.isoformat(sep=' '),
+            'collect_date': publish_date.isoformat(sep=' '),
+            'full_text_rss': True,
+        }))
+    return stories
+
+
+def _story_sentences(story: dict) -> List[str]:
+    """Return sentences for a story, some of them duplicated in every story."""
+    sentences = ['Boilerplate sentence number %d.' % number for number in range(_BOILERPLATE_SENTENCES_PER_STORY)]
+    for number in range(_SENTENCES_PER_STORY - _BOILERPLATE_SENTENCES_PER_STORY):
+        sentences.append('Sentence number %d of story %d.' % (number, story['stories_id']))
+    return sentences
+
+
+def _insert_stories_sentences(stories: List[dict]) -> None:
+    """Insert sentences of stories (worker process)."""
+    db = connect_to_db()
+    for story in stories:
+        _insert_story_sentences(db=db, story=story, sentences=_story_sentences(story))
+    db.disconnect()
+
+
+def _time_insertion(stories: List[dict], workers: int) -> float:
+    """Insert sentences of stories with a number of concurrent workers, return the time it took."""
+    chunks = [stories[worker::workers] for worker in range(workers)]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=workers) as pool:
+        pool.map(_insert_stories_sentences, chunks)
+    return time.perf_counter() - start
+
+
+def benchmark_story_sentences_locking(story_count: int, weeks: int, workers: int) -> None:
+    """Time sentence insertion of stories published on a single week and over many weeks."""
+
+    db = connect_to_db()
+
+    medium = db.create(table='media', insert_hash={
+        'name': 'story sentences locking benchmark %d' % time.time(),
+        'url': 'http://story-sentences-locking-benchmark.test/%d' % time.time(),
+    })
+    media_id = medium['media_id']
+
+    try:
+        for label, week_count in (('single week', 1), ('%d weeks' % weeks, weeks)):
+            log.info("Creating %d stories published over %s..." % (story_count, label))
+            stories = _create_test_stories(
+                db=db,
+                media_id=media_id,
+                label=label.replace(' ', '-'),
+                story_count=story_count,
+                weeks=week_count,
+            )
+
+            # Child processes connect to the database themselves
+            db.disconnect()
+
+            log.info("Inserting sentences with %d workers..." % workers)
+            insertion_time = _time_insertion(stories=stories, workers=workers)
+
+            print("Stories published over %s: %.3f s, %.1f stories/s" % (
+                label, insertion_time, story_count / insertion_time,
+            ))
+
+            db = connect_to_db()
+
+    finally:
+        db.query("DELETE FROM media WHERE media_id = %(media_id)s", {'media_id': media_id})
+        db.disconnect()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark story sentence insertion locking.")
+    parser.add_argument('-s', '--stories', type=int, default=2000, help="Number of stories to insert sentences for.")
+    parser.add_argument('-w', '--weeks', type=int, default=52, help="Number of weeks to spread the stories over.")
+    parser.add_argument('-p', '--workers', type=int, default=8, help="Number of concurrent worker processes.")
+    args = parser.parse_args()
+
+    benchmark_story_sentences_locking(story_count=args.stories, weeks=args.weeks, workers=args.workers)